@@ -12,7 +12,7 @@ from .lark import Lark
 from .lexer import Token
 from .parser_frontends import ScanMatch
 from .tree import ParseTree, Tree
-from .utils import logger, TextSlice
+from .utils import logger, TextSlice, TextStream
 from .visitors import Discard, Transformer, Transformer_NonRecursive, Visitor, v_args
 
 __version__: str = "1.3.1"
@@ -36,6 +36,7 @@ __all__ = (
     "Transformer",
     "Transformer_NonRecursive",
     "TextSlice",
+    "TextStream",
     "Visitor",
     "v_args",
 )
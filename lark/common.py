@@ -21,6 +21,9 @@ from .lexer import TerminalDef, Token
 
 _ParserArgType: 'TypeAlias' = 'Literal["earley", "lalr", "cyk", "auto"]'
 _LexerArgType: 'TypeAlias' = 'Union[Literal["auto", "basic", "contextual", "dynamic", "dynamic_complete"], Type[Lexer]]'
+_LexerEngineArgType: 'TypeAlias' = 'Literal["re", "dfa"]'
+_PositionsArgType: 'TypeAlias' = 'Literal["lines", "offsets"]'
+_TokenValuesArgType: 'TypeAlias' = 'Literal["eager", "lazy"]'
 _LexerCallback = Callable[[Token], Token]
 ParserCallbacks = Dict[str, Callable]
 
@@ -35,12 +38,16 @@ class LexerConf(Serialize):
     callbacks: Dict[str, _LexerCallback]
     g_regex_flags: int
     skip_validation: bool
-    use_bytes: bool
+    use_bytes: 'Union[bool, Literal["utf8"]]'
     lexer_type: Optional[_LexerArgType]
     strict: bool
+    lexer_engine: _LexerEngineArgType
+    positions: _PositionsArgType
+    token_values: _TokenValuesArgType
 
     def __init__(self, terminals: Collection[TerminalDef], re_module: ModuleType, ignore: Collection[str]=(), postlex: 'Optional[PostLex]'=None,
-                 callbacks: Optional[Dict[str, _LexerCallback]]=None, g_regex_flags: int=0, skip_validation: bool=False, use_bytes: bool=False, strict: bool=False):
+                 callbacks: Optional[Dict[str, _LexerCallback]]=None, g_regex_flags: int=0, skip_validation: bool=False, use_bytes: 'Union[bool, Literal["utf8"]]'=False, strict: bool=False,
+                 lexer_engine: _LexerEngineArgType='re', positions: _PositionsArgType='lines', token_values: _TokenValuesArgType='eager'):
         self.terminals = terminals
         self.terminals_by_name = {t.name: t for t in self.terminals}
         assert len(self.terminals) == len(self.terminals_by_name)
@@ -52,6 +59,9 @@ class LexerConf(Serialize):
         self.skip_validation = skip_validation
         self.use_bytes = use_bytes
         self.strict = strict
+        self.lexer_engine = lexer_engine
+        self.positions = positions
+        self.token_values = token_values
         self.lexer_type = None
 
     def _deserialize(self):
@@ -67,6 +77,9 @@ class LexerConf(Serialize):
             deepcopy(self.g_regex_flags, memo),
             deepcopy(self.skip_validation, memo),
             deepcopy(self.use_bytes, memo),
+            lexer_engine=self.lexer_engine,
+            positions=self.positions,
+            token_values=self.token_values,
         )
 
 class ParserConf(Serialize):
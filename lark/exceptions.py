@@ -2,7 +2,7 @@ from .utils import logger, NO_VALUE
 from typing import Mapping, Iterable, Callable, Union, TypeVar, Tuple, Any, List, Set, Optional, Collection, TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from .lexer import Token
+    from .lexer import Token, NewlineIndex
     from .parsers.lalr_interactive_parser import InteractiveParser
     from .tree import Tree
 
@@ -47,9 +47,10 @@ class UnexpectedInput(LarkError):
     """
     line: int
     column: int
-    pos_in_stream = None
+    pos_in_stream: Optional[int] = None
     state: Any
     _terminals_by_name = None
+    _newline_index: 'Optional[NewlineIndex]' = None
     interactive_parser: 'InteractiveParser'
 
     def get_context(self, text: str, span: int=40) -> str:
@@ -63,13 +64,23 @@ class UnexpectedInput(LarkError):
         pos = self.pos_in_stream or 0
         start = max(pos - span, 0)
         end = pos + span
-        if not isinstance(text, bytes):
+        newline_index = self._newline_index
+        if newline_index is not None and newline_index.text is text:
+            # Lexed with positions='offsets'; find the line boundaries in the index
+            line_start_pos, line_end_pos = newline_index.line_span(pos)
+            before = text[max(start, line_start_pos):pos]
+            after = text[pos:min(end, line_end_pos)]
+        elif isinstance(text, str):
             before = text[start:pos].rsplit('\n', 1)[-1]
             after = text[pos:end].split('\n', 1)[0]
+        else:
+            before = bytes(text[start:pos]).rsplit(b'\n', 1)[-1]
+            after = bytes(text[pos:end]).split(b'\n', 1)[0]
+
+        if isinstance(text, str):
             return before + after + '\n' + ' ' * len(before.expandtabs()) + '^\n'
         else:
-            before = text[start:pos].rsplit(b'\n', 1)[-1]
-            after = text[pos:end].split(b'\n', 1)[0]
+            before, after = bytes(before), bytes(after)
             return (before + after + b'\n' + b' ' * len(before.expandtabs()) + b'^\n').decode("ascii", "backslashreplace")
 
     def match_examples(self, parse_fn: 'Callable[[str], Tree]',
@@ -177,7 +188,7 @@ class UnexpectedCharacters(LexError, UnexpectedInput):
     considered_tokens: Set[Any]
 
     def __init__(self, seq, lex_pos, line, column, allowed=None, considered_tokens=None, state=None, token_history=None,
-                 terminals_by_name=None, considered_rules=None):
+                 terminals_by_name=None, considered_rules=None, newline_index=None):
         super(UnexpectedCharacters, self).__init__()
 
         # TODO considered_tokens and allowed can be figured out using state
@@ -191,9 +202,10 @@ class UnexpectedCharacters(LexError, UnexpectedInput):
         self.considered_tokens = considered_tokens
         self.considered_rules = considered_rules
         self.token_history = token_history
+        self._newline_index = newline_index
 
-        if isinstance(seq, bytes):
-            self.char = seq[lex_pos:lex_pos + 1].decode("ascii", "backslashreplace")
+        if not isinstance(seq, str):
+            self.char = bytes(seq[lex_pos:lex_pos + 1]).decode("ascii", "backslashreplace")
         else:
             self.char = seq[lex_pos]
         self._context = self.get_context(seq)
@@ -215,7 +227,7 @@ class UnexpectedToken(ParseError, UnexpectedInput):
 
     Parameters:
         token: The mismatched token
-        expected: The set of expected tokens
+        expected: The set of expected tokens. May also be a function that returns it, to compute it only when it's used.
         considered_rules: Which rules were considered, to deduce the expected tokens
         state: A value representing the parser state. Do not rely on its value or type.
         interactive_parser: An instance of ``InteractiveParser``, that is initialized to the point of failure,
@@ -224,7 +236,6 @@ class UnexpectedToken(ParseError, UnexpectedInput):
     Note: These parameters are available as attributes of the instance.
     """
 
-    expected: Set[str]
     considered_rules: Set[str]
 
     def __init__(self, token, expected, considered_rules=None, state=None, interactive_parser=None, terminals_by_name=None, token_history=None):
@@ -234,10 +245,11 @@ class UnexpectedToken(ParseError, UnexpectedInput):
         self.line = getattr(token, 'line', '?')
         self.column = getattr(token, 'column', '?')
         self.pos_in_stream = getattr(token, 'start_pos', None)
+        self._newline_index = getattr(token, '_newline_index', None)
         self.state = state
 
         self.token = token
-        self.expected = expected  # XXX deprecate? `accepts` is better
+        self._expected = expected  # XXX deprecate? `accepts` is better
         self._accepts = NO_VALUE
         self.considered_rules = considered_rules
         self.interactive_parser = interactive_parser
@@ -245,6 +257,16 @@ class UnexpectedToken(ParseError, UnexpectedInput):
         self.token_history = token_history
 
 
+    @property
+    def expected(self) -> Set[str]:
+        if callable(self._expected):
+            self._expected = self._expected()
+        return self._expected
+
+    @expected.setter
+    def expected(self, expected: Set[str]) -> None:
+        self._expected = expected
+
     @property
     def accepts(self) -> Set[str]:
         if self._accepts is NO_VALUE:
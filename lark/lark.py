@@ -10,22 +10,23 @@ from typing import (
 )
 if TYPE_CHECKING:
     from .parsers.lalr_interactive_parser import InteractiveParser
+    from .parsers.lalr_incremental import IncrementalParse, Edit
     from .tree import ParseTree
     from .visitors import Transformer
     from typing import Literal
     from .parser_frontends import ParsingFrontend, ScanMatch
 
 from .exceptions import ConfigurationError, assert_config, UnexpectedInput
-from .utils import Serialize, SerializeMemoizer, FS, logger, TextOrSlice, LarkInput
+from .utils import Serialize, SerializeMemoizer, FS, logger, TextOrSlice, TextSlice, TextStream, LarkInput
 from .load_grammar import load_grammar, FromPackageLoader, Grammar, verify_used_files, PackageResource, sha256_digest
 
 from .tree import Tree
-from .common import LexerConf, ParserConf, _ParserArgType, _LexerArgType
+from .common import LexerConf, ParserConf, _ParserArgType, _LexerArgType, _LexerEngineArgType, _PositionsArgType, _TokenValuesArgType
 
-from .lexer import Lexer, BasicLexer, TerminalDef, LexerThread, Token
+from .lexer import Lexer, BasicLexer, TerminalDef, LexerThread, Token, TokenArrays, TokenSplice
 from .visitors import _Return_T
 from .parse_tree_builder import ParseTreeBuilder
-from .parser_frontends import _validate_frontend_args, _get_lexer_callbacks, _deserialize_parsing_frontend, _construct_parsing_frontend
+from .parser_frontends import StreamLexerThread, _validate_frontend_args, _get_lexer_callbacks, _deserialize_parsing_frontend, _construct_parsing_frontend
 from .grammar import Rule
 
 
@@ -65,11 +66,14 @@ class LarkOptions(Serialize):
     tree_class: Optional[Callable[[str, List], Any]]
     parser: _ParserArgType
     lexer: _LexerArgType
+    lexer_engine: _LexerEngineArgType
+    positions: _PositionsArgType
+    token_values: _TokenValuesArgType
     ambiguity: 'Literal["auto", "resolve", "explicit", "forest"]'
     postlex: Optional[PostLex]
     priority: 'Optional[Literal["auto", "normal", "invert"]]'
     lexer_callbacks: Dict[str, Callable[[Token], Token]]
-    use_bytes: bool
+    use_bytes: 'Union[bool, Literal["utf8"]]'
     ordered_sets: bool
     edit_terminals: Optional[Callable[[TerminalDef], TerminalDef]]
     import_paths: 'List[Union[str, Callable[[Union[None, str, PackageResource], str], Tuple[str, str]]]]'
@@ -125,9 +129,31 @@ class LarkOptions(Serialize):
 
             - "auto" (default): Choose for me based on the parser
             - "basic": Use a basic lexer
-            - "contextual": Stronger lexer (only works with parser="lalr")
+            - "contextual": Stronger lexer (only works with parser="lalr" or "earley")
             - "dynamic": Flexible and powerful (only with parser="earley")
             - "dynamic_complete": Same as dynamic, but tries *every* variation of tokenizing possible.
+    lexer_engine
+            Decides how the basic and contextual lexers match the terminals
+
+            - "re" (default): Match using a single alternation of the terminals' regexps
+            - "dfa": Compile the terminals into a single DFA (requires interegular).
+              Lexes in linear time, even with terminals that make "re" backtrack exponentially,
+              but is slower than "re" on typical grammars, especially to build the lexer.
+              It returns the longest match of the highest priority, instead of the first alternative
+              that matches, so it may tokenize differently than "re" (e.g. when a terminal matches a prefix of another's match).
+              Terminals it can't express (lookarounds, lazy repeats, backrefs, anchors) are matched with "re".
+    positions
+            Decides how the basic and contextual lexers keep track of token positions
+
+            - "lines" (default): Count the lines while lexing, and set them on every token
+            - "offsets": Only set ``start_pos`` and ``end_pos``. The line & column attributes of tokens,
+              exceptions and ``meta`` are computed on first access, using an index of the newlines in the text.
+    token_values
+            Decides when the basic and contextual lexers copy the values of tokens out of the text
+
+            - "eager" (default): When the token is created
+            - "lazy": On first access to ``token.value``. Requires ``use_bytes=True`` and ``positions="offsets"``.
+              Useful for parsing a memory-mapped file (see ``TextSlice``), when most values are never read.
     ambiguity
             Decides how to handle ambiguity in the parse. Only relevant if parser="earley"
 
@@ -146,6 +172,10 @@ class LarkOptions(Serialize):
             Dictionary of callbacks for the lexer. May alter tokens during lexing. Use with caution.
     use_bytes
             Accept an input of type ``bytes`` instead of ``str``.
+
+            - True: The grammar must be ascii-only. Columns are counted in bytes.
+            - "utf8": The input is UTF-8. Terminals (which may be non-ascii) are translated to match
+              the UTF-8 encoding of what they match in a ``str``, and columns are counted in code points.
     ordered_sets
             Should Earley use ordered-sets to achieve stable output (~10% slower than regular sets. Default: True)
     edit_terminals
@@ -177,6 +207,9 @@ class LarkOptions(Serialize):
         'postlex': None,
         'parser': 'earley',
         'lexer': 'auto',
+        'lexer_engine': 're',
+        'positions': 'lines',
+        'token_values': 'eager',
         'transformer': None,
         'start': 'start',
         'priority': 'auto',
@@ -215,6 +248,12 @@ class LarkOptions(Serialize):
 
 
         assert_config(self.parser, ('earley', 'lalr', 'cyk', None))
+        assert_config(self.lexer_engine, ('re', 'dfa'))
+        assert_config(self.positions, ('lines', 'offsets'))
+        assert_config(self.token_values, ('eager', 'lazy'))
+
+        if self.token_values == 'lazy' and not (self.use_bytes and self.positions == 'offsets'):
+            raise ConfigurationError("token_values='lazy' requires use_bytes=True and positions='offsets'")
 
         if self.parser == 'earley' and self.transformer:
             raise ConfigurationError('Cannot specify an embedded transformer when using the Earley algorithm. '
@@ -246,7 +285,7 @@ class LarkOptions(Serialize):
 
 # Options that can be passed to the Lark parser, even when it was loaded from cache/standalone.
 # These options are only used outside of `load_grammar`.
-_LOAD_ALLOWED_OPTIONS = {'postlex', 'transformer', 'lexer_callbacks', 'use_bytes', 'debug', 'g_regex_flags', 'regex', 'propagate_positions', 'tree_class', '_plugins'}
+_LOAD_ALLOWED_OPTIONS = {'postlex', 'transformer', 'lexer_callbacks', 'use_bytes', 'debug', 'g_regex_flags', 'regex', 'propagate_positions', 'tree_class', 'lexer_engine', 'positions', 'token_values', '_plugins'}
 
 _VALID_PRIORITY_OPTIONS = ('auto', 'normal', 'invert', None)
 _VALID_AMBIGUITY_OPTIONS = ('auto', 'resolve', 'explicit', 'forest')
@@ -276,6 +315,7 @@ class Lark(Serialize, Generic[_Return_T]):
     lexer: Lexer
     parser: 'ParsingFrontend'
     terminals: Collection[TerminalDef]
+    _basic_lexers: Dict[bool, BasicLexer]
 
     __serialize_fields__ = ['parser', 'rules', 'options']
 
@@ -334,9 +374,10 @@ class Lark(Serialize, Generic[_Return_T]):
         cache_sha256 = None
         if isinstance(grammar, str):
             self.source_grammar = grammar
-            if self.options.use_bytes:
+            if self.options.use_bytes and self.options.use_bytes != 'utf8':
                 if not grammar.isascii():
-                    raise ConfigurationError("Grammar must be ascii only, when use_bytes=True")
+                    raise ConfigurationError("Grammar must be ascii only, when use_bytes=True. "
+                                             "Use use_bytes='utf8' to match non-ascii terminals in UTF-8 input.")
 
             if self.options.cache:
                 if self.options.parser != 'lalr':
@@ -418,6 +459,8 @@ class Lark(Serialize, Generic[_Return_T]):
             assert_config(lexer, ('basic', 'contextual', 'dynamic', 'dynamic_complete'))
             if self.options.postlex is not None and 'dynamic' in lexer:
                 raise ConfigurationError("Can't use postlex with a dynamic lexer. Use basic or contextual instead")
+            if self.options.positions == 'offsets' and 'dynamic' in lexer:
+                raise ConfigurationError("positions='offsets' is only supported by the basic and contextual lexers")
 
         if self.options.ambiguity == 'auto':
             if self.options.parser == 'earley':
@@ -448,6 +491,7 @@ class Lark(Serialize, Generic[_Return_T]):
                 self.options.edit_terminals(t)
 
         self._terminals_dict = {t.name: t for t in self.terminals}
+        self._basic_lexers = {}
 
         # If the user asked to invert the priorities, negate them all here.
         if self.options.priority == 'invert':
@@ -469,7 +513,9 @@ class Lark(Serialize, Generic[_Return_T]):
         # TODO Deprecate lexer_callbacks?
         self.lexer_conf = LexerConf(
                 self.terminals, re_module, self.ignore_tokens, self.options.postlex,
-                self.options.lexer_callbacks, self.options.g_regex_flags, use_bytes=self.options.use_bytes, strict=self.options.strict
+                self.options.lexer_callbacks, self.options.g_regex_flags, use_bytes=self.options.use_bytes, strict=self.options.strict,
+                lexer_engine=self.options.lexer_engine, positions=self.options.positions,
+                token_values=self.options.token_values
             )
 
         if self.options.parser:
@@ -499,6 +545,16 @@ class Lark(Serialize, Generic[_Return_T]):
             lexer_conf.ignore = ()
         return BasicLexer(lexer_conf)
 
+    def _get_basic_lexer(self, dont_ignore: bool=False) -> BasicLexer:
+        "The BasicLexer of lex(), relex() and tokenize_arrays(). It's built once for each value of dont_ignore."
+        if not dont_ignore and hasattr(self, 'lexer'):
+            return self.lexer  # type: ignore[return-value]
+        try:
+            return self._basic_lexers[dont_ignore]
+        except KeyError:
+            lexer = self._basic_lexers[dont_ignore] = self._build_lexer(dont_ignore)
+            return lexer
+
     def _prepare_callbacks(self) -> None:
         self._callbacks = {}
         # we don't need these callbacks if we aren't building a tree
@@ -508,7 +564,8 @@ class Lark(Serialize, Generic[_Return_T]):
                     self.options.tree_class or Tree,
                     self.options.propagate_positions,
                     self.options.parser != 'lalr' and self.options.ambiguity == 'explicit',
-                    self.options.maybe_placeholders
+                    self.options.maybe_placeholders,
+                    self.options.positions
                 )
             self._callbacks = self._parse_tree_builder.create_callback(self.options.transformer)
         self._callbacks.update(_get_lexer_callbacks(self.options.transformer, self.terminals))
@@ -552,6 +609,9 @@ class Lark(Serialize, Generic[_Return_T]):
         lexer_conf.re_module = regex if options.regex else re
         lexer_conf.use_bytes = options.use_bytes
         lexer_conf.g_regex_flags = options.g_regex_flags
+        lexer_conf.lexer_engine = options.lexer_engine
+        lexer_conf.positions = options.positions
+        lexer_conf.token_values = options.token_values
         lexer_conf.skip_validation = True
         lexer_conf.postlex = options.postlex
         return lexer_conf
@@ -581,6 +641,7 @@ class Lark(Serialize, Generic[_Return_T]):
         self.terminals = self.lexer_conf.terminals
         self._prepare_callbacks()
         self._terminals_dict = {t.name: t for t in self.terminals}
+        self._basic_lexers = {}
         self.parser = _deserialize_parsing_frontend(
             data['parser'],
             memo,
@@ -676,41 +737,123 @@ class Lark(Serialize, Generic[_Return_T]):
         return 'Lark(open(%r), parser=%r, lexer=%r, ...)' % (self.source_path, self.options.parser, self.options.lexer)
 
 
-    def lex(self, text: TextOrSlice, dont_ignore: bool=False) -> Iterator[Token]:
+    def lex(self, text: Union[TextOrSlice, TextStream], dont_ignore: bool=False) -> Iterator[Token]:
         """Only lex (and postlex) the text, without parsing it. Only relevant when lexer='basic'
 
         When dont_ignore=True, the lexer will return all tokens, even those marked for %ignore.
 
+        The text may also be a TextStream, in which case it is read incrementally.
+
         :raises UnexpectedCharacters: In case the lexer cannot find a suitable match.
         """
-        lexer: Lexer
-        if not hasattr(self, 'lexer') or dont_ignore:
-            lexer = self._build_lexer(dont_ignore)
+        lexer = self._get_basic_lexer(dont_ignore)
+        lexer_thread: LexerThread
+        if isinstance(text, TextStream):
+            lexer_thread = StreamLexerThread.from_stream(lexer, self.lexer_conf, text)
         else:
-            lexer = self.lexer
-        lexer_thread = LexerThread.from_text(lexer, text)
+            lexer_thread = LexerThread.from_text(lexer, text)
         stream = lexer_thread.lex(None)
         if self.options.postlex:
             return self.options.postlex.process(stream)
         return stream
 
+    def relex(self, text: Union[str, bytes], tokens: Sequence[Token], edit: Tuple[int, int, Any], dont_ignore: bool=False) -> TokenSplice:
+        """Lex the text again after an edit, reusing the tokens of the previous call to ``lex()`` (or ``relex()``).
+        Only relevant when lexer='basic'. Doesn't support postlex.
+
+        Lexing restarts one token before the first token that touches the edit, and stops as soon as
+        a new token realigns with an old one (same type, at the same position after the edit).
+        So its cost grows with the size of the edit, rather than with the size of the text.
+
+        Parameters:
+            text: The text after the edit
+            tokens: The tokens of the text before the edit, as a list
+            edit: A ``(start, end, replacement)`` tuple: ``replacement`` replaced ``old_text[start:end]``.
+            dont_ignore: Like in ``lex()``. Must be the same as for the old tokens.
+
+        Returns:
+            A ``TokenSplice``, that describes which old tokens to replace with which new tokens.
+            Call its ``apply()`` method to update the list of tokens.
+
+        :raises UnexpectedCharacters: In case the lexer cannot find a suitable match.
+        """
+        if self.options.postlex:
+            raise ConfigurationError("relex() does not support postlex")
+        return self._get_basic_lexer(dont_ignore).relex(text, tokens, edit)
+
+    def tokenize_arrays(self, text: TextOrSlice, dont_ignore: bool=False) -> TokenArrays:
+        """Lex the text like ``lex()``, but return the tokens as parallel arrays of terminal ids,
+        start positions and end positions, instead of as Token instances.
+
+        Much cheaper than ``lex()`` for large inputs, when only the types and offsets are needed.
+        Line and column information isn't computed. Doesn't support postlex.
+
+        When dont_ignore=True, the arrays will include all tokens, even those marked for %ignore.
+
+        :raises UnexpectedCharacters: In case the lexer cannot find a suitable match.
+        """
+        if self.options.postlex:
+            raise ConfigurationError("tokenize_arrays() does not support postlex")
+        return self._get_basic_lexer(dont_ignore).lex_arrays(TextSlice.cast_from(text))
+
     def get_terminal(self, name: str) -> TerminalDef:
         """Get information about a terminal"""
         return self._terminals_dict[name]
 
-    def parse_interactive(self, text: Optional[LarkInput]=None, start: Optional[str]=None) -> 'InteractiveParser':
+    def parse_interactive(self, text: Optional[LarkInput]=None, start: Optional[str]=None, persistent_stacks: bool=False) -> 'InteractiveParser':
         """Start an interactive parsing session. Only works when parser='lalr'.
 
         Parameters:
             text (LarkInput, optional): Text to be parsed. Required for ``resume_parse()``.
             start (str, optional): Start symbol
+            persistent_stacks (bool, optional): Keep the parser stacks in a ``PersistentStack``, so that
+                ``copy()``, ``accepts()`` and ``as_immutable()`` take constant time, regardless of the depth of the stack.
+                Copies share their values instead of deep-copying them (see ``PersistentStack``).
+                Feeding tokens is somewhat slower. Default: False.
 
         Returns:
             A new InteractiveParser instance.
 
         See Also: ``Lark.parse()``
         """
-        return self.parser.parse_interactive(text, start=start)
+        return self.parser.parse_interactive(text, start=start, persistent_stacks=persistent_stacks)
+
+    def parse_incremental(self, previous: 'Union[str, IncrementalParse]', edits: 'Sequence[Edit]'=(), start: Optional[str]=None) -> 'IncrementalParse':
+        """Parse the text, keeping what's needed to quickly parse it again after it's edited.
+        Only works when ``parser='lalr'``, without ``postlex``, ``transformer`` or ``propagate_positions``.
+
+        Call it first with the text, and then with the previous result and the edits made since.
+        The parser resumes from the token before the first edit, and relexes and parses until it's back
+        in step with the previous parse. From there it reuses the previous tokens and subtrees, and only
+        redoes the reductions that involve the changed part of the stack. The edit's cost grows with its
+        size and with the number of reductions it affects (e.g. in a list of statements: how many statements
+        follow it), not with the number of tokens. Moving the following tokens is still linear, but cheap.
+
+        Parameters:
+            previous: The text to parse, or the ``IncrementalParse`` returned by the previous call.
+                A successful reparse consumes the previous result: its tokens and trees are reused by the new one,
+                and may be changed in-place. If the reparse raises an exception, the previous result stays valid.
+            edits: A sequence of ``(start, end, replacement)`` tuples, applied one after the other.
+                Each replaces ``text[start:end]`` of the text as it is after the edits before it.
+            start (str, optional): Start symbol. Only used on the first call.
+
+        Returns:
+            An ``IncrementalParse`` instance. Its ``tree`` attribute holds the parse tree,
+            which is equal to the one returned by ``parse()`` for the same text.
+
+        Note: ``lexer_callbacks`` are only called for the text that was lexed again.
+
+        :raises ConfigurationError: If the configuration doesn't support incremental parsing.
+        :raises UnexpectedInput: On a parse error, just like ``parse()``.
+
+        See Also: ``Lark.parse()``
+        """
+        if self.options.parser != 'lalr':
+            raise ConfigurationError("parse_incremental() requires parser='lalr'")
+        if self.options.transformer is not None or self.options.propagate_positions:
+            # We rely on the values being trees, that we can reuse and copy
+            raise ConfigurationError("parse_incremental() does not support transformer or propagate_positions")
+        return self.parser.parse_incremental(previous, edits, start=start)
 
     def parse(self, text: LarkInput, start: Optional[str]=None, on_error: 'Optional[Callable[[UnexpectedInput], bool]]'=None) -> _Return_T:
         """Parse the given text, according to the options provided.
@@ -718,6 +861,7 @@ class Lark(Serialize, Generic[_Return_T]):
         Parameters:
             text (LarkInput): Text to be parsed, as `str` or `bytes`.
                 TextSlice may also be used, but only when lexer='basic' or 'contextual'.
+                So may TextStream, to read the text incrementally from a file or an iterator of chunks.
                 If Lark was created with a custom lexer, this may be an object of any type.
             start (str, optional): Required if Lark was given multiple possible start symbols (using the start option).
             on_error (function, optional): if provided, will be called on UnexpectedInput error,
@@ -737,7 +881,13 @@ class Lark(Serialize, Generic[_Return_T]):
             raise NotImplementedError("The on_error option is only implemented for the LALR(1) parser.")
         return self.parser.parse(text, start=start, on_error=on_error)
 
-    def scan(self, text: TextOrSlice, start: Optional[str]=None) -> Iterator['ScanMatch[_Return_T]']:
+    @overload
+    def scan(self, text: TextOrSlice, start: Optional[str]=None, values: 'Literal[True]'=True) -> Iterator['ScanMatch[_Return_T]']: ...
+
+    @overload
+    def scan(self, text: TextOrSlice, start: Optional[str]=None, *, values: 'Literal[False]') -> Iterator[Tuple[int, int]]: ...
+
+    def scan(self, text: TextOrSlice, start: Optional[str]=None, values: bool=True) -> Iterator[Any]:
         """Scan the input text for non-overlapping matches of this grammar.
         Only works when ``parser='lalr'`` and without ``postlex``.
 
@@ -763,11 +913,14 @@ class Lark(Serialize, Generic[_Return_T]):
         Parameters:
             text (TextOrSlice): Text to be scanned, as ``str``, ``bytes``, or a ``TextSlice`` instance.
             start (str, optional): Start symbol. Required if Lark was initialized with multiple start symbols.
+            values (bool, optional): When False, yields only the ranges of the matches, without building
+                their values, or running any parser callbacks. Default: True.
 
         Yields:
             ``ScanMatch`` instances, each with a ``range`` (a (start, end) tuple)
             and a ``value`` attribute. ``value`` is a ``Tree`` by default, or
             whatever the ``transformer`` returns when one was supplied.
+            When ``values=False``, yields the (start, end) tuples instead.
 
         :raises ConfigurationError: If the configuration doesn't support scanning;
                 scan() requires ``parser='lalr'`` without ``postlex`` or a custom lexer.
@@ -777,7 +930,7 @@ class Lark(Serialize, Generic[_Return_T]):
         """
         if self.options.parser != 'lalr':
             raise ConfigurationError("scan() requires parser='lalr'")
-        return self.parser.scan(text, start=start)
+        return self.parser.scan(text, start=start, values=values)
 
 
 ###}
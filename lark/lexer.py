@@ -4,7 +4,7 @@ from abc import abstractmethod, ABC
 import re
 from typing import (
     TypeVar, Type, Dict, Iterator, Collection, Callable, Optional, FrozenSet, Any,
-    AnyStr, ClassVar, TYPE_CHECKING, overload
+    AnyStr, ClassVar, Set, TYPE_CHECKING, overload, List, NamedTuple, Tuple, NoReturn, Sequence, Union
 )
 from types import ModuleType
 import warnings
@@ -15,13 +15,16 @@ except ImportError:
 if TYPE_CHECKING:
     from .common import LexerConf
     from .parsers.lalr_parser_state import ParserState
+    from .grammar import Terminal
 
-from .utils import classify, get_regexp_width, Serialize, logger, TextSlice, TextOrSlice
+from .utils import classify, get_regexp_width, get_regexp_opcodes, get_regexp_first_chars, utf8_regexp, utf8_len, Serialize, logger, TextSlice, TextOrSlice, _count, _rfind
 from .exceptions import UnexpectedCharacters, ConfigurationError, LexError, UnexpectedToken
 from .grammar import TOKEN_DEFAULT_PRIORITY
 
 
 ###{standalone
+from array import array
+from bisect import bisect_left
 from contextlib import suppress
 from copy import copy
 from dataclasses import dataclass
@@ -274,6 +277,197 @@ class Token(str):
     __hash__ = str.__hash__
 
 
+def _lazy_slot(slot, resolve):
+    def fget(self):
+        try:
+            return slot.__get__(self)
+        except AttributeError:
+            # Not computed yet
+            resolve(self)
+            return slot.__get__(self)
+    return property(fget, slot.__set__)
+
+def _resolve_start(t: 'OffsetToken') -> None:
+    assert t._newline_index is not None and t.start_pos is not None
+    t.line, t.column = t._newline_index.line_col(t.start_pos)
+
+def _resolve_end(t: 'OffsetToken') -> None:
+    assert t._newline_index is not None and t.end_pos is not None
+    t.end_line, t.end_column = t._newline_index.line_col(t.end_pos)
+
+
+class OffsetToken(Token):
+    """A Token that is produced by the lexer when ``positions='offsets'``.
+
+    Only ``start_pos`` and ``end_pos`` are set by the lexer. The line and column attributes
+    are computed on first access, from the newline index of the input text, and then cached.
+    """
+    __slots__ = ('_newline_index',)
+
+    _newline_index: 'Optional[NewlineIndex]'
+
+    @classmethod
+    def _future_new(cls, *args, **kwargs):
+        inst = super(OffsetToken, cls)._future_new(*args, **kwargs)
+        inst._newline_index = None
+        return inst
+
+    @classmethod
+    def _new_lazy(cls, type: str, value: Any, start_pos: int, end_pos: int, newline_index: 'NewlineIndex') -> 'OffsetToken':
+        # Fast path for the lexer. The line & column slots are left unset, to be resolved on first access.
+        inst = str.__new__(cls, value)
+        inst.type = type
+        inst.start_pos = start_pos
+        inst.value = value
+        inst.end_pos = end_pos
+        inst._newline_index = newline_index
+        return inst
+
+    line = _lazy_slot(Token.line, _resolve_start)
+    column = _lazy_slot(Token.column, _resolve_start)
+    end_line = _lazy_slot(Token.end_line, _resolve_end)
+    end_column = _lazy_slot(Token.end_column, _resolve_end)
+
+    def __deepcopy__(self, memo):
+        if self._newline_index is None:
+            return super().__deepcopy__(memo)
+        return self._new_lazy(self.type, self.value, self.start_pos, self.end_pos, self._newline_index)
+
+
+def _resolve_value(t: 'LazyToken'):
+    t.value = bytes(t._buffer[t.start_pos:t.end_pos])
+
+
+class LazyToken(OffsetToken):
+    """A Token that is produced by the lexer when ``token_values='lazy'``.
+
+    The lexer only records where the token is in the input buffer. Its value is copied
+    from the buffer on first access, and then cached.
+
+    Since the token is created before its value is known, its string content is empty.
+    Use ``token.value`` to get the value. (``str()``, comparisons and hashing use it too)
+    """
+    __slots__ = ('_buffer',)
+
+    _buffer: Any
+
+    @classmethod
+    def _future_new(cls, *args, **kwargs):
+        inst = super(LazyToken, cls)._future_new(*args, **kwargs)
+        inst._buffer = None
+        return inst
+
+    @classmethod
+    def _new_from_buffer(cls, type: str, buffer: Any, start_pos: int, end_pos: int, newline_index: 'NewlineIndex') -> 'LazyToken':
+        inst = str.__new__(cls)
+        inst.type = type
+        inst.start_pos = start_pos
+        inst.end_pos = end_pos
+        inst._newline_index = newline_index
+        inst._buffer = buffer
+        return inst
+
+    value = _lazy_slot(Token.value, _resolve_value)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __format__(self, format_spec):
+        return format(str(self.value), format_spec)
+
+    def __len__(self):
+        try:
+            return len(Token.value.__get__(self))
+        except AttributeError:
+            # Not read yet. Don't read it just for a truth test.
+            return self.end_pos - self.start_pos
+
+    def __eq__(self, other):
+        if isinstance(other, Token) and self.type != other.type:
+            return False
+        return str.__eq__(str(self.value), str(other.value) if isinstance(other, LazyToken) else other)
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    def __hash__(self):
+        return hash(str(self.value))
+
+    def __deepcopy__(self, memo):
+        if self._buffer is None:
+            return super().__deepcopy__(memo)
+        return self._new_from_buffer(self.type, self._buffer, self.start_pos, self.end_pos, self._newline_index)
+
+
+class TokenArrays(NamedTuple):
+    """The tokens of a text, in columnar form. Returned by ``Lark.tokenize_arrays()``.
+
+    Attributes:
+        types: The terminal id of each token. Use ``type_names`` to get its name.
+        start_pos: The index where each token starts in the text
+        end_pos: The index where each token ends in the text
+        type_names: A list that maps each terminal id to its name
+    """
+    types: 'array[int]'
+    start_pos: 'array[int]'
+    end_pos: 'array[int]'
+    type_names: List[str]
+
+    def __len__(self):
+        return len(self.types)
+
+
+class TokenSplice(NamedTuple):
+    """The change to a list of tokens, after an edit to its text. Returned by ``Lark.relex()``.
+
+    The tokens ``old_tokens[start:end]`` are replaced with ``tokens``. The tokens that follow are the same,
+    but moved ``pos_delta`` characters and ``line_delta`` lines. Those that start on the line of the first
+    of them also moved ``column_delta`` columns.
+
+    Attributes:
+        start: The index of the first old token that was replaced
+        end: The index after the last old token that was replaced
+        tokens: The new tokens
+        pos_delta: How far the tokens that follow moved, in characters
+        line_delta: How far the tokens that follow moved, in lines
+        column_delta: How far the tokens that follow moved, in columns (only for those on the same line)
+    """
+    start: int
+    end: int
+    tokens: List[Token]
+    pos_delta: int
+    line_delta: int
+    column_delta: int
+
+    def apply(self, old_tokens: List[Token]) -> None:
+        "Updates the old list of tokens in-place, including the positions of the tokens that follow"
+        if self.end < len(old_tokens):
+            _shift_tokens(old_tokens, self.end, self.line_delta, self.column_delta, self.pos_delta)
+        old_tokens[self.start:self.end] = self.tokens
+
+
+def _shift_tokens(tokens: List[Token], start: int, line_delta: int, column_delta: int, pos_delta: int) -> None:
+    "Moves the tokens from index ``start`` on. Only the tokens on the first line change their column."
+    t: Any  # Lexed tokens always have their positions
+    first_line = tokens[start].line
+    for index in range(start, len(tokens)):
+        t = tokens[index]
+        if t.line != first_line:
+            break
+        t.column += column_delta
+        if t.end_line == first_line:
+            t.end_column += column_delta
+    if line_delta:
+        for t in tokens[start:]:
+            t.line += line_delta
+            t.end_line += line_delta
+    if pos_delta:
+        for t in tokens[start:]:
+            t.start_pos += pos_delta
+            t.end_pos += pos_delta
+
+
 @dataclass(frozen=True)
 class _TextSlice_WithLineCount(TextSlice):
     """Internal: a TextSlice carrying the line/column state at its ``start``, so the lexer can
@@ -282,11 +476,34 @@ class _TextSlice_WithLineCount(TextSlice):
     line: int
     line_start_pos: int
 
+    @classmethod
+    def after_token(cls, text: AnyStr, token: Optional[Token]) -> '_TextSlice_WithLineCount':
+        "The text that follows the given token (or all of it, when it's None), with the line and column at its end"
+        if token is None:
+            return cls(text, 0, len(text), 1, 0)
+        pos = token.end_pos
+        assert pos is not None and token.end_line is not None and token.end_column is not None
+        return cls(text, pos, len(text), token.end_line, pos - token.end_column + 1)
+
+
+def _find_token_at(tokens: Sequence[Token], pos: int) -> int:
+    "Returns the index of the first token that ends at ``pos`` or after it, using a binary search"
+    lo, hi = 0, len(tokens)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        end_pos = tokens[mid].end_pos
+        assert end_pos is not None
+        if end_pos < pos:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
 
 class LineCounter:
     "A utility class for keeping track of line & column information"
 
-    __slots__ = 'char_pos', 'line', 'column', 'line_start_pos', 'newline_char'
+    __slots__ = 'char_pos', 'line', 'column', 'line_start_pos', 'newline_char', 'utf8'
 
     def __init__(self, newline_char):
         self.newline_char = newline_char
@@ -294,13 +511,14 @@ class LineCounter:
         self.line = 1
         self.column = 1
         self.line_start_pos = 0
+        self.utf8 = False   # When True, the text is UTF-8 bytes, and the column counts code points
 
     @classmethod
     def from_text_slice(cls, text_slice: TextSlice) -> 'LineCounter':
         """Build a counter positioned at ``text_slice.start``. Resumes from a snapshot when the
         slice carries one (``_TextSlice_WithLineCount``); otherwise counts the prefix once.
         """
-        self = cls(b'\n' if isinstance(text_slice.text, bytes) else '\n')
+        self = cls('\n' if isinstance(text_slice.text, str) else b'\n')
         if isinstance(text_slice, _TextSlice_WithLineCount):
             self.char_pos = text_slice.start
             self.line = text_slice.line
@@ -330,25 +548,141 @@ class LineCounter:
         self.char_pos += len(token)
         self.column = self.char_pos - self.line_start_pos + 1
 
+    def feed_utf8(self, token: bytes, test_newline=True):
+        "Like feed(), for UTF-8 text. The column is counted in code points."
+        column = self.column
+        line_start = 0
+        if test_newline:
+            newlines = token.count(self.newline_char)
+            if newlines:
+                self.line += newlines
+                line_start = token.rindex(self.newline_char) + 1
+                self.line_start_pos = self.char_pos + line_start
+                column = 1
+
+        self.char_pos += len(token)
+        self.column = column + utf8_len(token, line_start, len(token))
+
+    def set_utf8(self, text: bytes):
+        "Start counting the column in code points"
+        self.utf8 = True
+        self.column = utf8_len(text, self.line_start_pos, self.char_pos) + 1
+
     def advance_to(self, text: AnyStr, pos: int):
         """Advance the counter to absolute offset ``pos`` within ``text``, counting the newlines
         """
-        newlines = text.count(self.newline_char, self.char_pos, pos)
+        newlines = _count(text, self.newline_char, self.char_pos, pos)
         if newlines:
             self.line += newlines
-            self.line_start_pos = text.rindex(self.newline_char, self.char_pos, pos) + 1
+            self.line_start_pos = _rfind(text, self.newline_char, self.char_pos, pos) + 1
         self.char_pos = pos
-        self.column = self.char_pos - self.line_start_pos + 1
+        if self.utf8:
+            self.column = utf8_len(text, self.line_start_pos, pos) + 1
+        else:
+            self.column = self.char_pos - self.line_start_pos + 1
+
+
+class NewlineIndex:
+    """A sorted index of the newline offsets in a text, used to compute line & column
+    from an offset with a binary search.
+
+    The index is built on first use, so it costs nothing when no line is ever asked for.
+    """
+
+    __slots__ = 'text', 'utf8', '_offsets'
+
+    text: Union[str, bytes]
+    utf8: bool
+
+    def __init__(self, text: Union[str, bytes], utf8: bool = False):
+        self.text = text
+        self.utf8 = utf8    # Count the columns in code points, instead of bytes
+        self._offsets: Optional[List[int]] = None
+
+    @property
+    def offsets(self) -> List[int]:
+        if self._offsets is None:
+            text = self.text
+            if isinstance(text, (str, bytes)):
+                newline_char: Any = '\n' if isinstance(text, str) else b'\n'
+                offsets = []
+                i = text.find(newline_char)
+                while i != -1:
+                    offsets.append(i)
+                    i = text.find(newline_char, i + 1)
+            else:
+                offsets = [m.start() for m in re.finditer(b'\n', text)]
+            self._offsets = offsets
+        return self._offsets
+
+    def line_col(self, pos: int) -> Tuple[int, int]:
+        "Returns the line & column of the given offset (both starting with 1)"
+        offsets = self.offsets
+        i = bisect_left(offsets, pos)
+        line_start_pos = offsets[i-1] + 1 if i else 0
+        if self.utf8:
+            return i + 1, utf8_len(self.text, line_start_pos, pos) + 1
+        return i + 1, pos - line_start_pos + 1
+
+    def line_span(self, pos: int) -> Tuple[int, int]:
+        "Returns the start and end offsets of the line containing the given offset (excluding the newline)"
+        offsets = self.offsets
+        i = bisect_left(offsets, pos)
+        line_start_pos = offsets[i-1] + 1 if i else 0
+        line_end_pos = offsets[i] if i < len(offsets) else len(self.text)
+        return line_start_pos, line_end_pos
 
 
 class UnlessCallback:
-    def __init__(self, scanner: 'Scanner'):
-        self.scanner = scanner
+    """Changes the type of a token to the string terminal that it's equal to, if there is one
+    (e.g. from NAME to a keyword), using a dict lookup.
+
+    Case-insensitive strings are looked up by their lower-case form. Since the case-insensitive
+    matching of ``re`` has a few non-ascii quirks (e.g. the Kelvin sign matches "k"), non-ascii
+    values are checked using a Scanner instead, when there are case-insensitive strings.
+    """
+    def __init__(self, terminals: List[TerminalDef], g_regex_flags, re_, use_bytes):
+        self.terminals = terminals
+        self.g_regex_flags = g_regex_flags
+        self.re_ = re_
+        self.use_bytes = use_bytes
+
+        # Map each string to (index, name), so that the first terminal wins, like in the Scanner
+        self.exact: Dict[Any, Tuple[int, str]] = {}
+        self.folded: Dict[Any, Tuple[int, str]] = {}
+        ignorecase = g_regex_flags & re_.IGNORECASE
+        for i, t in enumerate(terminals):
+            s = t.pattern.value.encode('latin-1') if use_bytes else t.pattern.value
+            if ignorecase or 'i' in t.pattern.flags:
+                self.folded.setdefault(s.lower(), (i, t.name))
+            else:
+                self.exact.setdefault(s, (i, t.name))
+
+        self._scanner: Optional[Scanner] = None
+
+    @property
+    def scanner(self) -> 'Scanner':
+        if self._scanner is None:
+            self._scanner = Scanner(self.terminals, self.g_regex_flags, self.re_, self.use_bytes)
+        return self._scanner
 
     def __call__(self, t: Token):
-        res = self.scanner.fullmatch(t.value)
-        if res is not None:
-            t.type = res
+        value = t.value
+        if self.folded:
+            if not value.isascii():
+                res = self.scanner.fullmatch(value)
+                if res is not None:
+                    t.type = res
+                return t
+            match = self.folded.get(value.lower())
+            exact_match = self.exact.get(value)
+            if match is None or (exact_match is not None and exact_match < match):
+                match = exact_match
+        else:
+            match = self.exact.get(value)
+
+        if match is not None:
+            t.type = match[1]
         return t
 
 
@@ -369,13 +703,13 @@ def _get_match(re_, regexp, s, flags):
         return m.group(0)
 
 def _create_unless(terminals, g_regex_flags, re_, use_bytes):
-    tokens_by_type = classify(terminals, lambda t: type(t.pattern))
+    tokens_by_type = classify(terminals, lambda t: t.pattern.type)
     assert len(tokens_by_type) <= 2, tokens_by_type.keys()
     embedded_strs = set()
     callback = {}
-    for retok in tokens_by_type.get(PatternRE, []):
+    for retok in tokens_by_type.get('re', []):
         unless = []
-        for strtok in tokens_by_type.get(PatternStr, []):
+        for strtok in tokens_by_type.get('str', []):
             if strtok.priority != retok.priority:
                 continue
             s = strtok.pattern.value
@@ -384,7 +718,7 @@ def _create_unless(terminals, g_regex_flags, re_, use_bytes):
                 if strtok.pattern.flags <= retok.pattern.flags:
                     embedded_strs.add(strtok)
         if unless:
-            callback[retok.name] = UnlessCallback(Scanner(unless, g_regex_flags, re_, use_bytes=use_bytes))
+            callback[retok.name] = UnlessCallback(unless, g_regex_flags, re_, use_bytes)
 
     new_terminals = [t for t in terminals if t not in embedded_strs]
     return new_terminals, callback
@@ -401,6 +735,31 @@ class Scanner:
 
         self._mres = self._build_mres(terminals, len(terminals))
 
+        # Dispatch on the first character of the text, to only try the terminals that can start with it.
+        # (Only for ascii characters. The others try all the terminals)
+        # The first characters are computed with sre_parse, which doesn't know the syntax of the regex module.
+        self._dispatch: Optional[List[Optional[list]]] = None
+        if len(terminals) > 1 and re_ is re:
+            self._init_dispatch()
+
+    def _init_dispatch(self):
+        first_chars = [get_regexp_first_chars(t.pattern.to_regexp(), self.g_regex_flags) for t in self.terminals]
+        self._bucket_terminals = [tuple(i for i, chars in enumerate(first_chars) if c in chars) for c in range(128)]
+        self._bucket_mres: Dict[tuple, list] = {}
+        self._dispatch = [None] * 128
+
+    def _build_bucket(self, c: int) -> list:
+        # Buckets are compiled on first use, and shared by the characters that start the same terminals
+        key = self._bucket_terminals[c]
+        try:
+            mres = self._bucket_mres[key]
+        except KeyError:
+            terminals = [self.terminals[i] for i in key]
+            mres = self._bucket_mres[key] = self._build_mres(terminals, len(terminals))
+        assert self._dispatch is not None
+        self._dispatch[c] = mres
+        return mres
+
     def _build_mres(self, terminals, max_size):
         # Python sets an unreasonable group limit (currently 100) in its re module
         # Worse, the only way to know we reached it is by catching an AssertionError!
@@ -419,12 +778,33 @@ class Scanner:
             terminals = terminals[max_size:]
         return mres
 
-    def match(self, text: TextSlice, pos):
-        for mre in self._mres:
+    def _match(self, text: TextSlice, pos):
+        mres = self._mres
+        if self._dispatch is not None and pos < text.end:
+            c = text.text[pos]
+            if not self.use_bytes:
+                c = ord(c)
+            if c < 128:
+                mres = self._dispatch[c]
+                if mres is None:
+                    mres = self._build_bucket(c)
+
+        for mre in mres:
             m = mre.match(text.text, pos, text.end)
             if m:
-                return m.group(0), m.lastgroup
+                return m
+        return None
+
+    def match(self, text: TextSlice, pos):
+        m = self._match(text, pos)
+        if m:
+            return m.group(0), m.lastgroup
 
+    def match_end(self, text: TextSlice, pos):
+        "Like match(), but returns the end of the match instead of its value"
+        m = self._match(text, pos)
+        if m:
+            return m.end(), m.lastgroup
 
     def fullmatch(self, text: str) -> Optional[str]:
         for mre in self._mres:
@@ -442,6 +822,235 @@ class Scanner:
                 best = m
         return best.start() if best is not None else None
 
+
+# Constructs that a DFA can't express, or that interegular would silently mis-translate
+_DFA_UNSUPPORTED_OPCODES = frozenset({
+    'MIN_REPEAT', 'POSSESSIVE_REPEAT', 'ATOMIC_GROUP', 'ASSERT', 'ASSERT_NOT', 'AT', 'GROUPREF', 'GROUPREF_EXISTS',
+})
+# Constructs that interegular only translates correctly for ascii characters
+_DFA_ASCII_ONLY_OPCODES = frozenset({'CATEGORY', 'IGNORECASE'})
+# Characters on which interegular's classes agree with the ones of `re`.
+# Elsewhere (non-ascii, and the \x1c-\x1f separators that `re` considers whitespace), only terminals
+# that use none of _DFA_ASCII_ONLY_OPCODES can be trusted to the DFA.
+_DFA_SAFE_CODES = frozenset(i for i in range(128) if not 0x1c <= i <= 0x1f)
+# Maps a regexp to (its FSM, or the reason it can't be compiled into one; whether it uses _DFA_ASCII_ONLY_OPCODES)
+_dfa_fsm_cache: Dict[str, Any] = {}
+
+class DFAScanner(Scanner):
+    """A drop-in replacement for Scanner, that matches the terminals with a single table-driven DFA,
+    built from their interegular FSMs.
+
+    Each call to ``match()`` is a single pass over the input, with no backtracking, so its running time
+    is linear in the length of the match, even for terminals that make ``re`` backtrack exponentially.
+    On typical grammars, the ``re`` Scanner is faster.
+
+    Unlike Scanner, which follows the semantics of the ``re`` alternation, the DFA returns the match
+    with the highest priority, and among those the longest one. Ties are broken by the terminal order.
+
+    The states of the DFA are built as the input reaches them, and are discarded if there are too many.
+
+    Some terminals are matched with ``re`` instead, and their matches compete with the DFA's by the same rules:
+
+        - Terminals that can't be compiled into a DFA (lookarounds, lazy repeats, backrefs, anchors)
+        - Terminals with character classes or case folding, once the scan reaches a character
+          outside of ASCII, because interegular doesn't follow the Unicode semantics of ``re``.
+
+    Raises ValueError if none of the terminals can be compiled into a DFA.
+    """
+    MAX_STATES = 10000
+
+    def __init__(self, terminals: Sequence[TerminalDef], g_regex_flags: int, re_: ModuleType, use_bytes: Union[bool, str]) -> None:
+        self.terminals = terminals
+        self.g_regex_flags = g_regex_flags
+        self.re_ = re_
+        self.use_bytes = use_bytes
+
+        self.allowed_types = {t.name for t in self.terminals}
+        self._names = [t.name for t in terminals]
+        self._priorities = [t.priority for t in terminals]
+        self._fallback: Optional[Scanner] = None
+
+        if g_regex_flags:
+            raise ValueError("g_regex_flags are not supported by the DFA lexer engine")
+
+        self._fsms: List[Any] = []
+        self._ascii_only: Set[int] = set()
+        self._re_only: List[int] = []
+        self._regexps: Dict[int, Callable] = {}
+        for i, t in enumerate(terminals):
+            regexp = t.pattern.to_regexp()
+            try:
+                fsm, ascii_only = self._terminal_to_fsm(t)
+            except ValueError as e:
+                logger.debug("Matching terminal %s with 're' instead of the DFA. %s", t.name, e)
+                fsm = None
+                self._re_only.append(i)
+            else:
+                if ascii_only:
+                    self._ascii_only.add(i)
+            self._fsms.append(fsm)
+
+            if fsm is None or i in self._ascii_only:
+                pattern = regexp.encode('latin-1') if use_bytes else regexp
+                self._regexps[i] = re_.compile(pattern).match
+
+        if len(self._re_only) == len(terminals):
+            raise ValueError("None of the terminals can be compiled into a DFA")
+
+        # Only try the terminals that can start with the current (ascii) character
+        self._re_only_by_char: Optional[List[Tuple[int, ...]]] = None
+        if self._re_only and re_ is re:
+            first_chars = {i: get_regexp_first_chars(terminals[i].pattern.to_regexp()) for i in self._re_only}
+            self._re_only_by_char = [tuple(i for i in self._re_only if c in first_chars[i]) for c in range(128)]
+
+        self._initial = tuple((i, fsm.initial) for i, fsm in enumerate(self._fsms) if fsm is not None)
+        self._states: List[tuple] = []
+        self._state_ids: Dict[tuple, int] = {}
+        self._rows: List[Dict[Any, int]] = []
+        self._accepts: List[int] = []
+        self._flushes = 0
+        self._add_state(self._initial)
+
+    @staticmethod
+    def _terminal_to_fsm(t: TerminalDef) -> Tuple[Any, bool]:
+        """Returns the FSM of the terminal, and whether it's only correct for ascii characters.
+
+        The results are cached by regexp, because each state of a ContextualLexer builds its own DFAScanner.
+        """
+        regexp = t.pattern.to_regexp()
+        try:
+            fsm, ascii_only = _dfa_fsm_cache[regexp]
+        except KeyError:
+            opcodes = get_regexp_opcodes(regexp)
+            ascii_only = bool(opcodes & _DFA_ASCII_ONLY_OPCODES)
+            if opcodes & _DFA_UNSUPPORTED_OPCODES:
+                fsm = "unsupported construct"
+            else:
+                try:
+                    fsm = interegular.parse_pattern(regexp).to_fsm()
+                except Exception as e:  # interegular's Unsupported and InvalidSyntax derive from Exception
+                    fsm = str(e)
+            _dfa_fsm_cache[regexp] = fsm, ascii_only
+
+        if isinstance(fsm, str):
+            raise ValueError("Terminal %s can't be compiled into a DFA: %s (%s)" % (t.name, regexp, fsm))
+        return fsm, ascii_only
+
+    def _add_state(self, dfa_state: tuple) -> int:
+        # The states of the DFA are tuples of (terminal index, fsm state), for every terminal that is still alive
+        if len(self._states) >= self.MAX_STATES:
+            # Start over instead of growing without bound.
+            # The lists are cleared in place, because _run() holds on to them.
+            self._state_ids.clear()
+            del self._states[:], self._rows[:], self._accepts[:]
+            self._flushes += 1
+            self._add_state(self._initial)
+
+        state_id = self._state_ids[dfa_state] = len(self._states)
+        self._states.append(dfa_state)
+        self._rows.append({})
+        final = [i for i, s in dfa_state if s in self._fsms[i].finals]
+        self._accepts.append(min(final) if final else -1)
+        return state_id
+
+    def _transition(self, state: int, c) -> Tuple[int, Tuple[int, ...]]:
+        """Returns the next state (or -1), and the terminals that leave the DFA to be matched with ``re``.
+
+        The transition is cached in the row of the state, unless terminals left the DFA.
+        """
+        code = c if self.use_bytes else ord(c)
+        char = chr(c) if self.use_bytes else c
+        safe = code in _DFA_SAFE_CODES
+        fsms = self._fsms
+
+        next_state = []
+        escaped = []
+        for i, s in self._states[state]:
+            if not safe and i in self._ascii_only:
+                escaped.append(i)
+                continue
+            fsm = fsms[i]
+            s2 = fsm.map[s].get(fsm.alphabet[char])
+            if s2 is not None:
+                next_state.append((i, s2))
+
+        flushes = self._flushes
+        if not next_state:
+            next_id = -1
+        else:
+            next_id = self._state_ids.get(tuple(next_state), -1)
+            if next_id < 0:
+                next_id = self._add_state(tuple(next_state))
+
+        if not escaped and flushes == self._flushes:
+            self._rows[state][c] = next_id
+        return next_id, tuple(escaped)
+
+    @property
+    def fallback(self) -> Scanner:
+        if self._fallback is None:
+            self._fallback = Scanner(self.terminals, self.g_regex_flags, self.re_, self.use_bytes)
+        return self._fallback
+
+    def _run(self, s, pos: int, end: int):
+        "Returns (terminal index, end of match), or (-1, pos) when nothing matched"
+        rows = self._rows
+        accepts = self._accepts
+        priorities = self._priorities
+
+        start = pos
+        best = -1
+        best_end = pos
+        state = 0
+        escaped: Tuple[int, ...] = ()
+        while pos < end:
+            c = s[pos]
+            next_state = rows[state].get(c)
+            if next_state is None:
+                next_state, escaped_here = self._transition(state, c)
+                escaped += escaped_here
+            if next_state < 0:
+                break
+            state = next_state
+            pos += 1
+            i = accepts[state]
+            if i >= 0 and (best < 0 or priorities[i] >= priorities[best]):
+                best = i
+                best_end = pos
+
+        if self._re_only and start < end:
+            code = s[start] if self.use_bytes else ord(s[start])
+            if self._re_only_by_char is not None and code < 128:
+                escaped += self._re_only_by_char[code]
+            else:
+                escaped += tuple(self._re_only)
+
+        for i in escaped:
+            m = self._regexps[i](s, start, end)
+            if m and (best < 0 or (priorities[i], m.end(), -i) > (priorities[best], best_end, -best)):
+                best = i
+                best_end = m.end()
+        return best, best_end
+
+    def match(self, text: TextSlice, pos):
+        i, end = self._run(text.text, pos, text.end)
+        if i >= 0:
+            return text.text[pos:end], self._names[i]
+        return None
+
+    def match_end(self, text: TextSlice, pos):
+        i, end = self._run(text.text, pos, text.end)
+        if i >= 0:
+            return end, self._names[i]
+        return None
+
+    def fullmatch(self, text: str) -> Optional[str]:
+        return self.fallback.fullmatch(text)
+
+    def search(self, text: TextSlice, pos: int) -> Optional[int]:
+        return self.fallback.search(text, pos)
+
+
 def _regexp_has_newline(r: str):
     r"""Expressions that may indicate newlines in a regexp:
         - newlines (\n)
@@ -458,7 +1067,7 @@ class LexerState:
     (Lexer objects are only instantiated per grammar, not per text)
     """
 
-    __slots__ = 'text', 'line_ctr', 'last_token'
+    __slots__ = 'text', 'line_ctr', 'last_token', '_newline_index'
 
     text: TextSlice
     line_ctr: LineCounter
@@ -475,7 +1084,14 @@ class LexerState:
         self.text = text
         self.line_ctr = line_ctr
         self.last_token = last_token
+        self._newline_index: Optional[NewlineIndex] = None
 
+    @property
+    def newline_index(self) -> NewlineIndex:
+        "The newline index of the text, shared by all the tokens lexed with ``positions='offsets'``"
+        if self._newline_index is None:
+            self._newline_index = NewlineIndex(self.text.text, self.line_ctr.utf8)
+        return self._newline_index
 
     def __eq__(self, other):
         if not isinstance(other, LexerState):
@@ -484,7 +1100,9 @@ class LexerState:
         return self.text == other.text and self.line_ctr == other.line_ctr and self.last_token == other.last_token
 
     def __copy__(self):
-        return type(self)(self.text, copy(self.line_ctr), self.last_token)
+        new = type(self)(self.text, copy(self.line_ctr), self.last_token)
+        new._newline_index = self._newline_index
+        return new
 
 
 class LexerThread:
@@ -585,6 +1203,55 @@ class AbstractBasicLexer(Lexer):
                 yield self.next_token(state, parser_state)
 
 
+def _validate_terminals(terminals: List[TerminalDef], conf: 'LexerConf') -> Dict[TerminalDef, str]:
+    "Raises LexError if a terminal can't be lexed. Returns the regexps of the regexp terminals, to check for collisions."
+    terminal_to_regexp = {}
+    for t in terminals:
+        regexp = t.pattern.to_regexp()
+        try:
+            conf.re_module.compile(regexp, conf.g_regex_flags)
+        except conf.re_module.error:
+            raise LexError("Cannot compile token %s: %s" % (t.name, t.pattern))
+
+        if t.pattern.min_width == 0:
+            raise LexError("Lexer does not allow zero-width terminals. (%s: %s)" % (t.name, t.pattern))
+        if t.pattern.type == "re":
+            terminal_to_regexp[t] = regexp
+
+    if not (set(conf.ignore) <= {t.name for t in terminals}):
+        raise LexError("Ignore terminals are not defined: %s" % (set(conf.ignore) - {t.name for t in terminals}))
+    return terminal_to_regexp
+
+
+class _PatternUTF8Str(PatternStr):
+    """A non-ascii string, matched on its UTF-8 encoding (as latin-1).
+
+    It stays a string terminal, so _create_unless() can still turn it into a keyword, but it's
+    matched with a translated regexp, because re only folds the case of ascii letters in bytes.
+    """
+    def __init__(self, value: str, regexp: str, flags: Collection[str] = (), raw: Optional[str] = None) -> None:
+        super().__init__(value, flags, raw)
+        self.regexp = regexp
+
+    def to_regexp(self) -> str:
+        return self.regexp
+
+
+def _utf8_terminal(t: TerminalDef, g_regex_flags: int, re_: ModuleType) -> TerminalDef:
+    "Returns a terminal that matches the UTF-8 encoding of what the given terminal matches (as a latin-1 pattern)"
+    pattern = t.pattern
+    if isinstance(pattern, PatternStr) and pattern.value.isascii():
+        return t
+    try:
+        regexp = utf8_regexp(pattern.to_regexp(), g_regex_flags, re_)
+    except ValueError as e:
+        raise LexError("Cannot match terminal %s in UTF-8 bytes: %s" % (t.name, e))
+    if isinstance(pattern, PatternStr):
+        value = pattern.value.encode('utf-8').decode('latin-1')
+        return TerminalDef(t.name, _PatternUTF8Str(value, regexp, pattern.flags, pattern.raw), t.priority)
+    return TerminalDef(t.name, PatternRE(regexp, (), pattern.raw), t.priority)
+
+
 class BasicLexer(AbstractBasicLexer):
     terminals: Collection[TerminalDef]
     ignore_types: FrozenSet[str]
@@ -600,41 +1267,36 @@ class BasicLexer(AbstractBasicLexer):
         self.re = conf.re_module
 
         if not conf.skip_validation:
-            # Sanitization
-            terminal_to_regexp = {}
-            for t in terminals:
-                regexp = t.pattern.to_regexp()
-                try:
-                    self.re.compile(regexp, conf.g_regex_flags)
-                except self.re.error:
-                    raise LexError("Cannot compile token %s: %s" % (t.name, t.pattern))
-
-                if t.pattern.min_width == 0:
-                    raise LexError("Lexer does not allow zero-width terminals. (%s: %s)" % (t.name, t.pattern))
-                if t.pattern.type == "re":
-                    terminal_to_regexp[t] = regexp
-
-            if not (set(conf.ignore) <= {t.name for t in terminals}):
-                raise LexError("Ignore terminals are not defined: %s" % (set(conf.ignore) - {t.name for t in terminals}))
-
+            terminal_to_regexp = _validate_terminals(terminals, conf)
             if has_interegular:
                 _check_regex_collisions(terminal_to_regexp, comparator, conf.strict)
             elif conf.strict:
                 raise LexError("interegular must be installed for strict mode. Use `pip install 'lark[interegular]'`.")
 
+        if conf.lexer_engine == 'dfa' and not has_interegular:
+            raise ConfigurationError("interegular must be installed for lexer_engine='dfa'. Use `pip install 'lark[interegular]'`.")
+
         # Init
         self.newline_types = frozenset(t.name for t in terminals if _regexp_has_newline(t.pattern.to_regexp()))
         self.ignore_types = frozenset(conf.ignore)
 
         terminals.sort(key=lambda x: (-x.priority, -x.pattern.max_width, -len(x.pattern.value), x.name))
+        self._utf8 = conf.use_bytes == 'utf8'
+        if self._utf8:
+            terminals = [_utf8_terminal(t, conf.g_regex_flags, self.re) for t in terminals]
         self.terminals = terminals
         self.user_callbacks = conf.callbacks
         self.g_regex_flags = conf.g_regex_flags
         self.use_bytes = conf.use_bytes
         self.terminals_by_name = conf.terminals_by_name
+        self.lexer_engine = conf.lexer_engine
+        self.positions = conf.positions
+        self.token_values = conf.token_values
 
         self._scanner: Optional[Scanner] = None
         self._search_scanner: Optional[Scanner] = None
+        self._skip: Optional[Callable] = None
+        self._skip_newlines = False
 
     def _build_scanner(self) -> Scanner:
         terminals, self.callback = _create_unless(self.terminals, self.g_regex_flags, self.re, self.use_bytes)
@@ -652,14 +1314,53 @@ class BasicLexer(AbstractBasicLexer):
             else:
                 self.callback[type_] = f
 
+        self._skip = self._build_skip(terminals)
+
+        if self.lexer_engine == 'dfa':
+            try:
+                return DFAScanner(terminals, self.g_regex_flags, self.re, self.use_bytes)
+            except ValueError as e:
+                logger.warning("Cannot use the DFA lexer engine, falling back to 're'. %s", e)
         return Scanner(terminals, self.g_regex_flags, self.re, self.use_bytes)
 
+    def _build_skip(self, terminals: List[TerminalDef]) -> Optional[Callable]:
+        """Compiles the ignored terminals that have no callback into a single regexp, that matches a run of them.
+
+        A terminal is only included if no other terminal can start with the same (ascii) character,
+        so that at every position where the regexp matches, the scanner would have chosen the same terminal.
+        """
+        if self.re is not re:
+            return None     # get_regexp_first_chars() doesn't know the syntax of the regex module
+
+        first_chars = {t.name: get_regexp_first_chars(t.pattern.to_regexp(), self.g_regex_flags) for t in terminals}
+        skipped = [t for t in terminals if t.name in self.ignore_types and t.name not in self.callback]
+        while skipped:
+            others = set().union(*(first_chars[t.name] for t in terminals if t not in skipped))
+            disjoint = [t for t in skipped if not first_chars[t.name] & others]
+            if len(disjoint) == len(skipped):
+                break
+            skipped = disjoint
+        if not skipped:
+            return None
+
+        # The lookahead keeps non-ascii characters, which the first characters don't account for, out of the skip
+        pattern = u'(?:(?=[\\x00-\\x7f])(?:%s))+' % u'|'.join(u'(?:%s)' % t.pattern.to_regexp() for t in skipped)
+        self._skip_newlines = any(t.name in self.newline_types for t in skipped)
+        return self.re.compile(pattern.encode('latin-1') if self.use_bytes else pattern, self.g_regex_flags).match
+
     @property
     def scanner(self) -> Scanner:
         if self._scanner is None:
             self._scanner = self._build_scanner()
         return self._scanner
 
+    @property
+    def skip(self) -> Optional[Callable]:
+        "Matches a run of ignored terminals, when possible. See ``_build_skip()``"
+        if self._scanner is None:
+            self._scanner = self._build_scanner()
+        return self._skip
+
     @property
     def search_scanner(self) -> Scanner:
         # Used by search_start(): a match can only begin with a non-ignored terminal, so we
@@ -673,9 +1374,41 @@ class BasicLexer(AbstractBasicLexer):
     def match(self, text, pos):
         return self.scanner.match(text, pos)
 
+    def _fused_loop_parts(self) -> Optional[tuple]:
+        """Returns what a fused lex+parse loop needs, in order to do the work of next_token() by itself.
+
+        Returns None when next_token() has to be called instead: for positions='offsets', for utf8,
+        or when a subclass overrides how tokens are matched.
+        """
+        if self.positions != 'lines' or self._utf8:
+            return None
+        if type(self).next_token is not BasicLexer.next_token or type(self).match is not BasicLexer.match:
+            return None
+        return self.scanner.match, self.skip, self._skip_newlines, self.ignore_types, self.newline_types, self.callback
+
     def next_token(self, lex_state: LexerState, parser_state: Any = None) -> Token:
+        if self.positions == 'offsets':
+            if self.token_values == 'lazy':
+                return self._next_token_lazy(lex_state, parser_state)
+            return self._next_token_offsets(lex_state, parser_state)
+
         line_ctr = lex_state.line_ctr
+        feed: Callable[..., None] = line_ctr.feed
+        if self._utf8:
+            if not line_ctr.utf8:
+                line_ctr.set_utf8(lex_state.text.text)
+            feed = line_ctr.feed_utf8
+        if line_ctr.char_pos >= lex_state.text.end:
+            raise EOFError(self)    # Before self.skip, which builds the scanner
+        skip = self.skip
         while line_ctr.char_pos < lex_state.text.end:
+            if skip is not None:
+                m = skip(lex_state.text.text, line_ctr.char_pos, lex_state.text.end)
+                if m:
+                    feed(m.group(0), self._skip_newlines)
+                    if line_ctr.char_pos >= lex_state.text.end:
+                        break
+
             res = self.match(lex_state.text, line_ctr.char_pos)
             if not res:
                 allowed = self.scanner.allowed_types - self.ignore_types
@@ -691,7 +1424,7 @@ class BasicLexer(AbstractBasicLexer):
             t = None
             if not ignored or type_ in self.callback:
                 t = Token(type_, value, line_ctr.char_pos, line_ctr.line, line_ctr.column)
-            line_ctr.feed(value, type_ in self.newline_types)
+            feed(value, type_ in self.newline_types)
             if t is not None:
                 t.end_line = line_ctr.line
                 t.end_column = line_ctr.column
@@ -707,11 +1440,218 @@ class BasicLexer(AbstractBasicLexer):
         # EOF
         raise EOFError(self)
 
+    def _next_token_offsets(self, lex_state: LexerState, parser_state: Any = None) -> Token:
+        # Like next_token(), but doesn't count lines. Only line_ctr.char_pos is kept up to date.
+        line_ctr = lex_state.line_ctr
+        if self._utf8 and not line_ctr.utf8:
+            line_ctr.utf8 = True
+        text = lex_state.text
+        if line_ctr.char_pos >= text.end:
+            raise EOFError(self)    # Before self.skip, which builds the scanner
+        skip = self.skip
+        while line_ctr.char_pos < text.end:
+            if skip is not None:
+                m = skip(text.text, line_ctr.char_pos, text.end)
+                if m:
+                    line_ctr.char_pos = m.end()
+                    if line_ctr.char_pos >= text.end:
+                        break
+
+            pos = line_ctr.char_pos
+            res = self.match(text, pos)
+            if not res:
+                allowed = self.scanner.allowed_types - self.ignore_types
+                if not allowed:
+                    allowed = {"<END-OF-FILE>"}
+                newline_index = lex_state.newline_index
+                line, column = newline_index.line_col(pos)
+                raise UnexpectedCharacters(text.text, pos, line, column,
+                                           allowed=allowed, token_history=lex_state.last_token and [lex_state.last_token],
+                                           state=parser_state, terminals_by_name=self.terminals_by_name,
+                                           newline_index=newline_index)
+
+            value, type_ = res
+            line_ctr.char_pos = end_pos = pos + len(value)
+
+            ignored = type_ in self.ignore_types
+            if not ignored or type_ in self.callback:
+                t: Token = OffsetToken._new_lazy(type_, value, pos, end_pos, lex_state.newline_index)
+                if type_ in self.callback:
+                    t = self.callback[type_](t)
+                if not ignored:
+                    if not isinstance(t, Token):
+                        raise LexError("Callbacks must return a token (returned %r)" % t)
+                    lex_state.last_token = t
+                    return t
+
+        # EOF
+        raise EOFError(self)
+
+    def _next_token_lazy(self, lex_state: LexerState, parser_state: Any = None) -> Token:
+        # Like _next_token_offsets(), but never copies the matched text. The tokens read it from the buffer when needed.
+        line_ctr = lex_state.line_ctr
+        if self._utf8 and not line_ctr.utf8:
+            line_ctr.utf8 = True
+        text = lex_state.text
+        if line_ctr.char_pos >= text.end:
+            raise EOFError(self)    # Before self.skip, which builds the scanner
+        skip = self.skip
+        match_end = self.scanner.match_end
+        while line_ctr.char_pos < text.end:
+            if skip is not None:
+                m = skip(text.text, line_ctr.char_pos, text.end)
+                if m:
+                    line_ctr.char_pos = m.end()
+                    if line_ctr.char_pos >= text.end:
+                        break
+
+            pos = line_ctr.char_pos
+            res = match_end(text, pos)
+            if not res:
+                allowed = self.scanner.allowed_types - self.ignore_types
+                if not allowed:
+                    allowed = {"<END-OF-FILE>"}
+                newline_index = lex_state.newline_index
+                line, column = newline_index.line_col(pos)
+                raise UnexpectedCharacters(text.text, pos, line, column,
+                                           allowed=allowed, token_history=lex_state.last_token and [lex_state.last_token],
+                                           state=parser_state, terminals_by_name=self.terminals_by_name,
+                                           newline_index=newline_index)
+
+            end_pos, type_ = res
+            line_ctr.char_pos = end_pos
+
+            ignored = type_ in self.ignore_types
+            if not ignored or type_ in self.callback:
+                t: Token = LazyToken._new_from_buffer(type_, text.text, pos, end_pos, lex_state.newline_index)
+                if type_ in self.callback:
+                    t = self.callback[type_](t)
+                if not ignored:
+                    if not isinstance(t, Token):
+                        raise LexError("Callbacks must return a token (returned %r)" % t)
+                    lex_state.last_token = t
+                    return t
+
+        # EOF
+        raise EOFError(self)
+
     def search_start(self, text: TextSlice, start_state: Any, pos: int) -> Optional[int]:
         return self.search_scanner.search(text, pos)
 
+    def relex(self, text: AnyStr, old_tokens: Sequence[Token], edit: Tuple[int, int, AnyStr]) -> TokenSplice:
+        """Lex the text again after an edit, reusing the tokens that the edit didn't change.
+
+        Lexing restarts one token before the first token that touches the edit, and stops as soon as
+        a new token realigns with an old one (same type, at the same position after the edit).
+        See ``Lark.relex()``.
+        """
+        if self.positions != 'lines' or self._utf8:
+            raise ConfigurationError("relex() requires positions='lines', and doesn't support use_bytes='utf8'")
+        start, end, replacement = edit
+        new_end = start + len(replacement)
+        if text[start:new_end] != replacement:
+            raise ValueError("The text doesn't contain the replacement of the edit at %d" % start)
+        pos_delta = len(replacement) - (end - start)
+
+        # Find the first token that touches the edit
+        n = len(old_tokens)
+        lo = _find_token_at(old_tokens, start)
+
+        # Restart one token earlier, because the edit might let it match a longer string
+        first = max(lo - 1, 0)
+        last_token = old_tokens[first-1] if first else None
+        text_slice = _TextSlice_WithLineCount.after_token(text, last_token)
+
+        old: Sequence[Any] = old_tokens     # Lexed tokens always have their positions
+        t: Any
+        tokens: List[Token] = []
+        j = lo
+        for t in self.lex(LexerState(text_slice, last_token=last_token), None):
+            if t.start_pos >= new_end:
+                old_pos = t.start_pos - pos_delta
+                while j < n and old[j].start_pos < old_pos:
+                    j += 1
+                if j < n and old[j].start_pos == old_pos and old[j].type == t.type:
+                    return TokenSplice(first, j, tokens, pos_delta, t.line - old[j].line, t.column - old[j].column)
+            tokens.append(t)
+        return TokenSplice(first, n, tokens, pos_delta, 0, 0)
+
+    def lex_arrays(self, text: TextSlice) -> TokenArrays:
+        """Lex the whole text into a TokenArrays instance.
+
+        Tokens are only instantiated for terminals that have a callback. These tokens are given
+        their start_pos and end_pos, but no line and column information.
+        """
+        match = self.scanner.match
+        skip = self.skip
+        callback = self.callback
+        ignore_types = self.ignore_types
+
+        type_names = [t.name for t in self.terminals]
+        type_ids = {name: i for i, name in enumerate(type_names)}
+        types = array('i')
+        start_pos = array('i')
+        end_pos = array('i')
+
+        pos = text.start
+        while pos < text.end:
+            if skip is not None:
+                m = skip(text.text, pos, text.end)
+                if m:
+                    pos = m.end()
+                    if pos >= text.end:
+                        break
+
+            res = match(text, pos)
+            if not res:
+                line_ctr = LineCounter.from_text_slice(TextSlice(text.text, pos, text.end))
+                if self._utf8:
+                    line_ctr.set_utf8(text.text)
+                allowed = self.scanner.allowed_types - ignore_types
+                raise UnexpectedCharacters(text.text, pos, line_ctr.line, line_ctr.column,
+                                           allowed=allowed or {"<END-OF-FILE>"}, terminals_by_name=self.terminals_by_name)
+
+            value, type_ = res
+            new_pos = pos + len(value)
+            ignored = type_ in ignore_types
+            if type_ in callback:
+                t = callback[type_](Token(type_, value, pos, end_pos=new_pos))
+                if not isinstance(t, Token):
+                    raise LexError("Callbacks must return a token (returned %r)" % t)
+                type_ = t.type
+            if not ignored:
+                try:
+                    types.append(type_ids[type_])
+                except KeyError:
+                    type_ids[type_] = len(type_names)
+                    type_names.append(type_)
+                    types.append(type_ids[type_])
+                start_pos.append(pos)
+                end_pos.append(new_pos)
+            pos = new_pos
+
+        return TokenArrays(types, start_pos, end_pos, type_names)
+
+
+class _LazyLexers(dict):
+    "Maps each parser state to its lexer, and creates the lexer when the state is first reached"
+
+    def __init__(self, create_lexer: Callable[[int], AbstractBasicLexer]) -> None:
+        super().__init__()
+        self.create_lexer = create_lexer
+
+    def __missing__(self, state: int) -> AbstractBasicLexer:
+        lexer = self[state] = self.create_lexer(state)
+        return lexer
+
 
 class ContextualLexer(Lexer):
+    """A lexer that only matches the terminals that the parser accepts in its current state.
+
+    The lexer of each state is created when the state is first reached, and states that accept
+    the same terminals share a single lexer. The terminals are validated upfront, once for all the states.
+    """
+
     lexers: Dict[int, AbstractBasicLexer]
     root_lexer: AbstractBasicLexer
 
@@ -719,52 +1659,135 @@ class ContextualLexer(Lexer):
 
     def __init__(self, conf: 'LexerConf', states: Dict[int, Collection[str]], always_accept: Collection[str]=()) -> None:
         terminals = list(conf.terminals)
-        terminals_by_name = conf.terminals_by_name
 
         trad_conf = copy(conf)
         trad_conf.terminals = terminals
+        trad_conf.skip_validation = True    # Validated below, instead of by each lexer
 
-        if has_interegular and not conf.skip_validation:
-            comparator = interegular.Comparator.from_regexes({t: t.pattern.to_regexp() for t in terminals})
-        else:
-            comparator = None
-        lexer_by_tokens: Dict[FrozenSet[str], AbstractBasicLexer] = {}
-        self.lexers = {}
-        for state, accepts in states.items():
-            key = frozenset(accepts)
-            try:
-                lexer = lexer_by_tokens[key]
-            except KeyError:
-                accepts = set(accepts) | set(conf.ignore) | set(always_accept)
-                lexer_conf = copy(trad_conf)
-                lexer_conf.terminals = [terminals_by_name[n] for n in accepts if n in terminals_by_name]
-                lexer = self.BasicLexer(lexer_conf, comparator)
-                lexer_by_tokens[key] = lexer
+        self._states = states
+        self._always_accept = frozenset(conf.ignore) | frozenset(always_accept)
+        self._state_conf = trad_conf
+        self._lexers_by_terminals: Dict[FrozenSet[str], AbstractBasicLexer] = {}
+        self.lexers = _LazyLexers(self._create_state_lexer)
 
-            self.lexers[state] = lexer
+        if not conf.skip_validation:
+            terminal_to_regexp = _validate_terminals(terminals, conf)
+            if has_interegular:
+                # Terminals can only collide if a state accepts both of them
+                comparator = interegular.Comparator.from_regexes({t: t.pattern.to_regexp() for t in terminals})
+                for accepts in dict.fromkeys(frozenset(accepts) for accepts in states.values()):
+                    names = accepts | self._always_accept
+                    _check_regex_collisions({t: r for t, r in terminal_to_regexp.items() if t.name in names}, comparator, conf.strict)
+            elif conf.strict:
+                raise LexError("interegular must be installed for strict mode. Use `pip install 'lark[interegular]'`.")
 
-        assert trad_conf.terminals is terminals
-        trad_conf.skip_validation = True  # We don't need to verify all terminals again
-        self.root_lexer = self.BasicLexer(trad_conf, comparator)
+        self.root_lexer = self.BasicLexer(trad_conf)
+
+    def _create_state_lexer(self, state: int) -> AbstractBasicLexer:
+        key = frozenset(self._states[state])
+        try:
+            return self._lexers_by_terminals[key]
+        except KeyError:
+            terminals_by_name = self._state_conf.terminals_by_name
+            lexer_conf = copy(self._state_conf)
+            lexer_conf.terminals = [terminals_by_name[n] for n in key | self._always_accept if n in terminals_by_name]
+            lexer = self._lexers_by_terminals[key] = self.BasicLexer(lexer_conf)
+            return lexer
+
+    @property
+    def materialized_scanners(self) -> int:
+        "The number of distinct scanners that were compiled so far"
+        return sum(getattr(lexer, '_scanner', None) is not None for lexer in self._lexers_by_terminals.values())
 
     def lex(self, lexer_state: LexerState, parser_state: 'ParserState') -> Iterator[Token]:
         try:
             while True:
-                lexer = self.lexers[parser_state.position]
+                lexer = self.lexers[parser_state.lexer_position]
                 yield lexer.next_token(lexer_state, parser_state)
         except EOFError:
             pass
         except UnexpectedCharacters as e:
-            # In the contextual lexer, UnexpectedCharacters can mean that the terminal is defined, but not in the current context.
-            # This tests the input against the global context, to provide a nicer error.
-            try:
-                last_token = lexer_state.last_token  # Save last_token. Calling root_lexer.next_token will change this to the wrong token
-                token = self.root_lexer.next_token(lexer_state, parser_state)
-                raise UnexpectedToken(token, e.allowed, state=parser_state, token_history=[last_token], terminals_by_name=self.root_lexer.terminals_by_name)
-            except UnexpectedCharacters:
-                raise e  # Raise the original UnexpectedCharacters. The root lexer raises it with the wrong expected set.
+            self._raise_unexpected(e, lexer_state, parser_state)
+
+    def next_token(self, lexer_state: LexerState, parser_state: 'ParserState') -> Token:
+        "Lex a single token, in the context of the given parser state. Raises EOFError at the end of the text."
+        try:
+            return self.lexers[parser_state.lexer_position].next_token(lexer_state, parser_state)
+        except UnexpectedCharacters as e:
+            self._raise_unexpected(e, lexer_state, parser_state)
+
+    def _raise_unexpected(self, e: UnexpectedCharacters, lexer_state: LexerState, parser_state: 'ParserState') -> NoReturn:
+        # In the contextual lexer, UnexpectedCharacters can mean that the terminal is defined, but not in the current context.
+        # This tests the input against the global context, to provide a nicer error.
+        try:
+            last_token = lexer_state.last_token  # Save last_token. Calling root_lexer.next_token will change this to the wrong token
+            token = self.root_lexer.next_token(lexer_state, parser_state)
+            raise UnexpectedToken(token, e.allowed, state=parser_state, token_history=[last_token], terminals_by_name=self.root_lexer.terminals_by_name)
+        except UnexpectedCharacters:
+            raise e  # Raise the original UnexpectedCharacters. The root lexer raises it with the wrong expected set.
 
     def search_start(self, text: TextSlice, start_state: Any, pos: int) -> Optional[int]:
         return self.lexers[start_state].search_start(text, start_state, pos)
 
 ###}
+
+
+class EarleyContextualLexer(ContextualLexer):
+    """A contextual lexer for the Earley parser (``parser='earley', lexer='contextual'``).
+
+    Instead of a parser state, Earley passes the terminals that it expects next (as ``Terminal`` symbols),
+    and the lexer only matches those (and the ignored terminals). There can be many more distinct
+    sets of terminals than there are LALR states, so only the lexers of the ``max_lexers`` most
+    recently used sets are kept.
+
+    When none of the expected terminals match, the text is lexed with all the terminals instead,
+    so that the parser can report the unexpected token.
+    """
+
+    def __init__(self, conf: 'LexerConf', always_accept: Collection[str]=(), max_lexers: int=128) -> None:
+        # The root lexer validates all the terminals, like the basic lexer does.
+        # The lexers of each set of terminals are only created while parsing, so they don't repeat it.
+        self.root_lexer = self.BasicLexer(conf)
+
+        state_conf = copy(conf)
+        state_conf.terminals = list(conf.terminals)
+        state_conf.skip_validation = True
+        self._state_conf = state_conf
+        self._always_accept = frozenset(conf.ignore) | frozenset(always_accept)
+        self._lexers_by_terminals = {}
+        self.max_lexers = max_lexers
+
+    def _get_lexer(self, expects: Collection['Terminal']) -> AbstractBasicLexer:
+        accepts = frozenset(t.name for t in expects)
+        lexers = self._lexers_by_terminals
+        lexer = lexers.pop(accepts, None)
+        if lexer is None:
+            terminals_by_name = self._state_conf.terminals_by_name
+            lexer_conf = copy(self._state_conf)
+            lexer_conf.terminals = [terminals_by_name[n] for n in accepts | self._always_accept if n in terminals_by_name]
+            lexer = self.BasicLexer(lexer_conf)
+        lexers[accepts] = lexer
+        while len(lexers) > self.max_lexers:
+            lexers.pop(next(iter(lexers)), None)    # Drop the least recently used
+        return lexer
+
+    # parser_state is the collection of the expected terminals, rather than a ParserState
+    def lex(self, lexer_state: LexerState, parser_state: Any) -> Iterator[Token]:
+        try:
+            while True:
+                yield self.next_token(lexer_state, parser_state)
+        except EOFError:
+            pass
+
+    def next_token(self, lexer_state: LexerState, parser_state: Any) -> Token:
+        "Lex a single token, out of the terminals in ``parser_state``. Raises EOFError at the end of the text."
+        try:
+            return self._get_lexer(parser_state).next_token(lexer_state, parser_state)
+        except UnexpectedCharacters as e:
+            try:
+                return self.root_lexer.next_token(lexer_state, parser_state)
+            except UnexpectedCharacters:
+                raise e     # Raise the original UnexpectedCharacters, with the expected terminals
+
+    def search_start(self, text: TextSlice, start_state: Any, pos: int) -> Optional[int]:
+        raise ConfigurationError("scan() is not supported by the Earley parser")
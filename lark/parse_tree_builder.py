@@ -38,36 +38,36 @@ class PropagatePositions:
             # - nodes start at the start of their first child's container,
             #   and end at the end of their last child's container.
             # Containers are nodes that take up space in text, but have been inlined in the tree.
-
-            res_meta = res.meta
-
-            first_meta = self._pp_get_meta(children)
-            if first_meta is not None:
-                if not hasattr(res_meta, 'line'):
-                    # meta was already set, probably because the rule has been inlined (e.g. `?rule`)
-                    res_meta.line = getattr(first_meta, 'container_line', first_meta.line)
-                    res_meta.column = getattr(first_meta, 'container_column', first_meta.column)
-                    res_meta.start_pos = getattr(first_meta, 'container_start_pos', first_meta.start_pos)
-                    res_meta.empty = False
-
-                res_meta.container_line = getattr(first_meta, 'container_line', first_meta.line)
-                res_meta.container_column = getattr(first_meta, 'container_column', first_meta.column)
-                res_meta.container_start_pos = getattr(first_meta, 'container_start_pos', first_meta.start_pos)
-
-            last_meta = self._pp_get_meta(reversed(children))
-            if last_meta is not None:
-                if not hasattr(res_meta, 'end_line'):
-                    res_meta.end_line = getattr(last_meta, 'container_end_line', last_meta.end_line)
-                    res_meta.end_column = getattr(last_meta, 'container_end_column', last_meta.end_column)
-                    res_meta.end_pos = getattr(last_meta, 'container_end_pos', last_meta.end_pos)
-                    res_meta.empty = False
-
-                res_meta.container_end_line = getattr(last_meta, 'container_end_line', last_meta.end_line)
-                res_meta.container_end_column = getattr(last_meta, 'container_end_column', last_meta.end_column)
-                res_meta.container_end_pos = getattr(last_meta, 'container_end_pos', last_meta.end_pos)
+            self._propagate(res.meta, children)
 
         return res
 
+    def _propagate(self, res_meta, children):
+        first_meta = self._pp_get_meta(children)
+        if first_meta is not None:
+            if not hasattr(res_meta, 'line'):
+                # meta was already set, probably because the rule has been inlined (e.g. `?rule`)
+                res_meta.line = getattr(first_meta, 'container_line', first_meta.line)
+                res_meta.column = getattr(first_meta, 'container_column', first_meta.column)
+                res_meta.start_pos = getattr(first_meta, 'container_start_pos', first_meta.start_pos)
+                res_meta.empty = False
+
+            res_meta.container_line = getattr(first_meta, 'container_line', first_meta.line)
+            res_meta.container_column = getattr(first_meta, 'container_column', first_meta.column)
+            res_meta.container_start_pos = getattr(first_meta, 'container_start_pos', first_meta.start_pos)
+
+        last_meta = self._pp_get_meta(reversed(children))
+        if last_meta is not None:
+            if not hasattr(res_meta, 'end_line'):
+                res_meta.end_line = getattr(last_meta, 'container_end_line', last_meta.end_line)
+                res_meta.end_column = getattr(last_meta, 'container_end_column', last_meta.end_column)
+                res_meta.end_pos = getattr(last_meta, 'container_end_pos', last_meta.end_pos)
+                res_meta.empty = False
+
+            res_meta.container_end_line = getattr(last_meta, 'container_end_line', last_meta.end_line)
+            res_meta.container_end_column = getattr(last_meta, 'container_end_column', last_meta.end_column)
+            res_meta.container_end_pos = getattr(last_meta, 'container_end_pos', last_meta.end_pos)
+
     def _pp_get_meta(self, children):
         for c in children:
             if self.node_filter is not None and not self.node_filter(c):
@@ -80,11 +80,42 @@ class PropagatePositions:
             elif hasattr(c, '__lark_meta__'):
                 return c.__lark_meta__()
 
-def make_propagate_positions(option):
+
+class PropagateOffsets(PropagatePositions):
+    """Used instead of PropagatePositions when lexing with ``positions='offsets'``.
+
+    Only start_pos and end_pos (and their container_* versions) are propagated. The line & column
+    attributes of the meta are computed on first access, from the newline index of the tokens.
+    """
+    def _propagate(self, res_meta, children):
+        first_meta = self._pp_get_meta(children)
+        if first_meta is None:
+            return
+        last_meta = self._pp_get_meta(reversed(children))
+        newline_index = getattr(first_meta, '_newline_index', None)
+        if newline_index is None or getattr(last_meta, '_newline_index', None) is not newline_index:
+            # Not lexed with offsets (e.g. a token created by a postlexer); copy the lines eagerly
+            return super()._propagate(res_meta, children)
+
+        if not hasattr(res_meta, 'start_pos'):
+            res_meta.start_pos = getattr(first_meta, 'container_start_pos', first_meta.start_pos)
+            res_meta.empty = False
+        res_meta.container_start_pos = getattr(first_meta, 'container_start_pos', first_meta.start_pos)
+
+        if not hasattr(res_meta, 'end_pos'):
+            res_meta.end_pos = getattr(last_meta, 'container_end_pos', last_meta.end_pos)
+            res_meta.empty = False
+        res_meta.container_end_pos = getattr(last_meta, 'container_end_pos', last_meta.end_pos)
+
+        res_meta._newline_index = newline_index
+
+
+def make_propagate_positions(option, positions='lines'):
+    cls = PropagateOffsets if positions == 'offsets' else PropagatePositions
     if callable(option):
-        return partial(PropagatePositions, node_filter=option)
+        return partial(cls, node_filter=option)
     elif option is True:
-        return PropagatePositions
+        return cls
     elif option is False:
         return None
 
@@ -329,16 +360,17 @@ def apply_visit_wrapper(func, name, wrapper):
 
 
 class ParseTreeBuilder:
-    def __init__(self, rules, tree_class, propagate_positions=False, ambiguous=False, maybe_placeholders=False):
+    def __init__(self, rules, tree_class, propagate_positions=False, ambiguous=False, maybe_placeholders=False, positions='lines'):
         self.tree_class = tree_class
         self.propagate_positions = propagate_positions
+        self.positions = positions
         self.ambiguous = ambiguous
         self.maybe_placeholders = maybe_placeholders
 
         self.rule_builders = list(self._init_builders(rules))
 
     def _init_builders(self, rules):
-        propagate_positions = make_propagate_positions(self.propagate_positions)
+        propagate_positions = make_propagate_positions(self.propagate_positions, self.positions)
 
         for rule in rules:
             options = rule.options
@@ -1,11 +1,13 @@
+from copy import copy
 from dataclasses import dataclass
 from typing import Any, Callable, Dict, Optional, Collection, Union, TYPE_CHECKING, Generic, Iterator, Tuple, TypeVar
 
-from .exceptions import ConfigurationError, GrammarError, LexError, UnexpectedInput, assert_config
-from .utils import get_regexp_width, Serialize, TextOrSlice, TextSlice, LarkInput
-from .lexer import LexerThread, LineCounter, Token, _TextSlice_WithLineCount, BasicLexer, ContextualLexer, Lexer
+from .exceptions import ConfigurationError, GrammarError, LexError, UnexpectedInput, UnexpectedCharacters, UnexpectedToken, assert_config
+from .utils import get_regexp_width, utf8_regexp, Serialize, TextOrSlice, TextSlice, TextStream, LarkInput
+from .lexer import LexerThread, LexerState, LineCounter, Token, _TextSlice_WithLineCount, BasicLexer, ContextualLexer, EarleyContextualLexer, Lexer
 from .parsers import earley, xearley, cyk
 from .parsers.lalr_parser import LALR_Parser
+from .parsers.lalr_incremental import IncrementalParser, IncrementalParse, _apply_edits
 from .tree import Tree
 from .common import LexerConf, ParserConf, _ParserArgType, _LexerArgType
 
@@ -107,7 +109,7 @@ class ParsingFrontend(Serialize):
         elif isinstance(lexer_type, str):
             create_lexer = {
                 'basic': create_basic_lexer,
-                'contextual': create_contextual_lexer,
+                'contextual': create_contextual_lexer if parser_conf.parser_type != 'earley' else create_earley_contextual_lexer,
             }[lexer_type]
             self.lexer = create_lexer(lexer_conf, self.parser, lexer_conf.postlex, options)
         else:
@@ -132,6 +134,8 @@ class ParsingFrontend(Serialize):
             return text
         if text is None:
             return cls(self.lexer, None)
+        if isinstance(text, TextStream):
+            return StreamLexerThread.from_stream(self.lexer, self.lexer_conf, text)
         if isinstance(text, (str, bytes, TextSlice)):
             return cls.from_text(self.lexer, text)
         return cls.from_custom_input(self.lexer, text)
@@ -140,22 +144,50 @@ class ParsingFrontend(Serialize):
         if self.lexer_conf.lexer_type in ("dynamic", "dynamic_complete"):
             if isinstance(text, TextSlice) and not text.is_complete_text():
                 raise TypeError(f"Lexer {self.lexer_conf.lexer_type} does not support text slices.")
+            if isinstance(text, TextStream):
+                raise ConfigurationError(f"Lexer {self.lexer_conf.lexer_type} does not support TextStream input.")
 
         chosen_start = self._verify_start(start)
         kw = {} if on_error is None else {'on_error': on_error}
         stream = self._make_lexer_thread(text)
         return self.parser.parse(stream, chosen_start, **kw)
 
-    def parse_interactive(self, text: Optional[TextOrSlice]=None, start=None):
+    def parse_interactive(self, text: Optional[TextOrSlice]=None, start=None, persistent_stacks: bool=False):
         # TODO BREAK - Change text from Optional[str] to text: str = ''.
         #   Would break behavior of exhaust_lexer(), which currently raises TypeError, and after the change would just return []
         chosen_start = self._verify_start(start)
         if self.parser_conf.parser_type != 'lalr':
             raise ConfigurationError("parse_interactive() currently only works with parser='lalr' ")
         stream = self._make_lexer_thread(text)
+        if persistent_stacks:
+            return self.parser.parse_interactive(stream, chosen_start, persistent_stacks=True)
         return self.parser.parse_interactive(stream, chosen_start)
 
-    def scan(self, text: TextOrSlice, start: Optional[str]=None) -> Iterator[ScanMatch]:
+    def parse_incremental(self, previous: Union[str, IncrementalParse], edits=(), start=None) -> IncrementalParse:
+        """See ``Lark.parse_incremental``."""
+        if self.parser_conf.parser_type != 'lalr':
+            raise ConfigurationError("parse_incremental() requires parser='lalr'")
+        if self.skip_lexer or isinstance(self.lexer_conf.lexer_type, type):
+            raise ConfigurationError("parse_incremental() requires lexer='basic' or lexer='contextual'")
+        if self.lexer_conf.postlex is not None:
+            # postlex carries state across the stream, that we can't resume from the middle of the text
+            raise ConfigurationError("parse_incremental() does not support postlex")
+        if self.lexer_conf.use_bytes or self.lexer_conf.positions != 'lines' or self.lexer_conf.token_values != 'eager':
+            # We move the tokens that follow an edit, which requires that they store their own positions
+            raise ConfigurationError("parse_incremental() requires use_bytes=False, positions='lines' and token_values='eager'")
+
+        incremental_parser = IncrementalParser(self.parser.parser, self.lexer)
+        if isinstance(previous, IncrementalParse):
+            if start is not None and start != previous.start:
+                raise ConfigurationError("Can't change the start symbol of an incremental parse (%r != %r)" % (start, previous.start))
+            return incremental_parser.reparse(previous, edits)
+
+        if not isinstance(previous, str):
+            raise TypeError("parse_incremental() expects a str, or the result of a previous call (got %r)" % type(previous))
+        text = _apply_edits(previous, edits)[0]
+        return incremental_parser.parse(text, self._verify_start(start))
+
+    def scan(self, text: TextOrSlice, start: Optional[str]=None, values: bool=True) -> Iterator[Union[ScanMatch, Tuple[int, int]]]:
         """See ``Lark.scan``."""
         if self.parser_conf.parser_type != 'lalr':
             raise ConfigurationError("scan() requires parser='lalr'")
@@ -168,13 +200,15 @@ class ParsingFrontend(Serialize):
             # A custom lexer class was supplied; scan() relies on the built-in lexers' search_start().
             raise ConfigurationError("scan() does not support custom lexers")
         chosen_start = self._verify_start(start)
-        return self._scan(TextSlice.cast_from(text), chosen_start)
+        return self._scan(TextSlice.cast_from(text), chosen_start, values)
 
-    def _scan(self, text_slice: TextSlice, chosen_start: str) -> Iterator[ScanMatch]:
+    def _scan(self, text_slice: TextSlice, chosen_start: str, values: bool=True) -> Iterator[Union[ScanMatch, Tuple[int, int]]]:
         start_state = self.parser._parse_table.start_states[chosen_start]
         pos = text_slice.start
         # We count the lines here, to avoid re-counting them inside each new lexer state
         line_ctr = LineCounter.from_text_slice(text_slice)
+        log: list = []
+        recording_callbacks = None
         while True:
             # Search for a plausible start
             match_start = self.lexer.search_start(text_slice, start_state, pos)
@@ -182,32 +216,40 @@ class ParsingFrontend(Serialize):
                 return
             assert text_slice.start <= match_start <= text_slice.end
 
-            # Parse without callbacks, to keep value-stack minimal and avoid expensive deepcopies.
-            # Aim for the longest possible match, and save the tokens we lex for later replay.
+            # Parse while recording the tokens it shifts and the rules it reduces, instead of running the
+            # callbacks (or, without values, with no callbacks at all).
+            # Aim for the longest possible match, and keep the part of the log that produces it.
             line_ctr.advance_to(text_slice.text, match_start)
             text_slice_wlc = _TextSlice_WithLineCount(
                 text_slice.text, match_start, text_slice.end,
                 line_ctr.line, line_ctr.line_start_pos)
             stunted_ip = self.parse_interactive(text_slice_wlc, start=chosen_start)
-            stunted_ip.parser_state.parse_conf.callbacks = {}
+            parser_state = stunted_ip.parser_state
+            if not values:
+                parser_state.parse_conf.callbacks = {}
+            else:
+                if recording_callbacks is None:
+                    callbacks = parser_state.parse_conf.callbacks
+                    recording_callbacks = _recording_callbacks(self.parser_conf.rules, self.lexer_conf.terminals, log)
+                parser_state.parse_conf.callbacks = recording_callbacks
+                del log[:]
             matched_tokens = []
             longest_match = 0  # number of tokens in the longest accepted prefix
-            token_stream = stunted_ip.lexer_thread.lex(stunted_ip.parser_state)
+            token_stream = stunted_ip.lexer_thread.lex(parser_state)
             try:
+                # Most candidates fail quickly, so we avoid raising (and copying) for each failed token
                 for token in token_stream:
-                    stunted_ip.feed_token(token)
+                    if not parser_state.try_feed_token(token):
+                        break
                     matched_tokens.append(token)
                     # Test if we reached a possible completed parse
-                    if '$END' in stunted_ip.choices():
-                        tmp_state = stunted_ip.parser_state.copy(deepcopy_values=False)
-                        try:
-                            tmp_state.feed_token(Token.new_borrow_pos('$END', '', token), is_end=True)
-                        except UnexpectedInput:
-                            continue
+                    end_reductions: Optional[list] = [] if values else None
+                    if parser_state.accepts_token_type('$END', end_reductions):
                         longest_match = len(matched_tokens)
+                        match_log = (len(log), end_reductions)
                         # keep going and testing for candidates, until the parse ends or fails
             except UnexpectedInput:
-                # Parse failed
+                # Lexing failed
                 pass
             except ConfigurationError:
                 # ConfigurationError subclasses ValueError, and must not be swallowed
@@ -217,18 +259,21 @@ class ParsingFrontend(Serialize):
                 pass
 
             if longest_match:
-                # Match found! Replay tokens with real callbacks, and yield the result
+                # Match found! Run the real callbacks over the recorded steps, and yield the result
                 matched = matched_tokens[:longest_match]
-                replay_ip = self.parse_interactive(start=chosen_start)
                 for t in matched:
                     if t.start_pos is None or t.end_pos is None:
                         raise LexError(
                             f"Lexer callback for {t.type!r} did not preserve token positions; "
                             f"scan() requires source positions on every token (use Token.update() in callbacks).")
-                    replay_ip.feed_token(t)
-                res = replay_ip.feed_eof(matched[-1])
                 # Range comes from the matched tokens, not match_start (the lexer may skip leading ignores).
-                yield ScanMatch((matched[0].start_pos, matched[-1].end_pos), res)
+                match_range = (matched[0].start_pos, matched[-1].end_pos)
+                if values:
+                    log_len, end_reductions = match_log
+                    assert end_reductions is not None
+                    yield ScanMatch(match_range, _run_callbacks(log[:log_len] + end_reductions, callbacks))
+                else:
+                    yield match_range
                 # Resume from end of match (no overlaps)
                 pos = matched[-1].end_pos
             else:
@@ -236,12 +281,43 @@ class ParsingFrontend(Serialize):
                 pos = match_start + 1
 
 
+def _recording_callbacks(rules, terminals, log: list) -> Dict[Any, Callable]:
+    "Parser callbacks that append to ``log`` the tokens that are shifted and the rules that are reduced"
+    def record_reduce(rule):
+        return lambda children: log.append(rule)
+
+    def record_shift(token):
+        log.append(token)
+        return token
+
+    callbacks: Dict[Any, Callable] = {rule: record_reduce(rule) for rule in rules}
+    callbacks.update((t.name, record_shift) for t in terminals)
+    return callbacks
+
+def _run_callbacks(log: list, callbacks):
+    "Computes the result of a parse from its recorded steps, as the parser would with these callbacks"
+    value_stack: list = []
+    for step in log:
+        if isinstance(step, Token):
+            callback = callbacks.get(step.type)
+            value_stack.append(step if callback is None else callback(step))
+        else:
+            size = len(step.expansion)
+            if size:
+                s = value_stack[-size:]
+                del value_stack[-size:]
+            else:
+                s = []
+            value_stack.append(callbacks[step](s) if callbacks else s)
+    return value_stack[-1]
+
+
 def _validate_frontend_args(parser, lexer) -> None:
     assert_config(parser, ('lalr', 'earley', 'cyk'))
     if not isinstance(lexer, type):     # not custom lexer?
         expected = {
             'lalr': ('basic', 'contextual'),
-            'earley': ('basic', 'dynamic', 'dynamic_complete'),
+            'earley': ('basic', 'contextual', 'dynamic', 'dynamic_complete'),
             'cyk': ('basic', ),
          }[parser]
         assert_config(lexer, expected, 'Parser %r does not support lexer %%r, expected one of %%s' % parser)
@@ -265,6 +341,134 @@ class PostLexConnector:
         return self.postlexer.process(i)
 
 
+class StreamLexerThread(LexerThread):
+    """A LexerThread that reads its text from a TextStream.
+
+    The lexer only sees a rolling buffer of the text. A match can depend on the text that follows it
+    (e.g. "12" is only a whole NUMBER if it isn't followed by ".5"), so a token is only accepted when
+    the buffer holds at least ``lookahead`` more characters after it, or the stream is exhausted.
+    Otherwise, or when the match fails, the buffer is refilled and the token is lexed again.
+    Text that was already consumed is released from the buffer.
+
+    So the tokens are the same as if the whole text was given, unless a terminal's regexp has to look
+    further than ``lookahead`` characters past the end of its match.
+
+    Token positions are counted from the start of the stream, as if the whole text was given.
+    (Except inside lexer callbacks, which see positions relative to the buffer)
+    """
+
+    MIN_LOOKAHEAD = 0x1000
+
+    def __init__(self, lexer: Lexer, stream: TextStream, postlex=None):
+        first_chunk = stream.read()
+        text = first_chunk if first_chunk is not None else ''
+        super().__init__(lexer, LexerState(TextSlice(text, 0, len(text))))
+        self.stream = stream
+        self.postlex = postlex
+        self.base = 0   # The position of the buffer in the stream
+        self.lookahead = max(stream.chunk_size, self.MIN_LOOKAHEAD)
+        self._eof = first_chunk is None
+
+    @classmethod
+    def from_stream(cls, lexer: Any, lexer_conf: LexerConf, stream: TextStream) -> 'StreamLexerThread':
+        postlex = None
+        if isinstance(lexer, PostLexConnector):
+            lexer, postlex = lexer.lexer, lexer.postlexer
+        if not isinstance(lexer, (BasicLexer, ContextualLexer)):
+            raise ConfigurationError("TextStream input requires lexer='basic' or 'contextual'")
+        if lexer_conf.positions == 'offsets':
+            raise ConfigurationError("TextStream input does not support positions='offsets'")
+        return cls(lexer, stream, postlex)
+
+    def lex(self, parser_state):
+        stream = self._lex(parser_state)
+        if self.postlex is not None:
+            return self.postlex.process(stream)
+        return stream
+
+    def _lex(self, parser_state) -> Iterator[Token]:
+        lexer: Any = self.lexer
+        state = self.state
+        assert state is not None
+        while True:
+            line_ctr = copy(state.line_ctr)
+            last_token = state.last_token
+            try:
+                token = lexer.next_token(state, parser_state)
+            except EOFError:
+                token = None
+            except UnexpectedInput as e:
+                if self._refill(line_ctr.char_pos):
+                    state.line_ctr = line_ctr
+                    state.last_token = last_token
+                    continue
+                self._shift_error(e)
+                raise
+
+            if state.line_ctr.char_pos + self.lookahead > state.text.end and self._refill(line_ctr.char_pos):
+                # The match might depend on text that wasn't read yet. Undo, and lex it again.
+                state.line_ctr = line_ctr
+                state.last_token = last_token
+                continue
+
+            if token is None:
+                return
+
+            if self.base:
+                token.start_pos += self.base
+                token.end_pos += self.base
+            yield token
+            self._release()
+
+    def _refill(self, pos: int) -> bool:
+        """Read more of the stream. Reads at least the lookahead, and at least as much as is left to lex,
+        so that long tokens are lexed in linear time."""
+        if self._eof:
+            return False
+        state = self.state
+        assert state is not None
+        chunks = [state.text.text]
+        size = 0
+        while size < max(len(state.text.text) - pos, self.lookahead):
+            chunk = self.stream.read()
+            if chunk is None:
+                self._eof = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        if not size:
+            return False
+        text = chunks[0][:0].join(chunks)
+        state.text = TextSlice(text, 0, len(text))
+        return True
+
+    def _release(self):
+        "Drop the consumed text from the buffer, once it's larger than a chunk"
+        state = self.state
+        assert state is not None
+        pos = state.line_ctr.char_pos
+        if pos < self.stream.chunk_size:
+            return
+        text = state.text.text[pos:]
+        state.text = TextSlice(text, 0, len(text))
+        state.line_ctr.char_pos -= pos
+        state.line_ctr.line_start_pos -= pos
+        self.base += pos
+
+    def _shift_error(self, e: UnexpectedInput):
+        if not self.base:
+            return
+        if isinstance(e, UnexpectedCharacters) and e.pos_in_stream is not None:
+            e.pos_in_stream += self.base
+        elif isinstance(e, UnexpectedToken) and e.token is not None:
+            e.token.start_pos += self.base
+            e.token.end_pos += self.base
+            e.pos_in_stream = e.token.start_pos
+
+    def __copy__(self):
+        raise TypeError("A lexer thread that reads from a TextStream cannot be copied")
+
+
 
 def create_basic_lexer(lexer_conf, parser, postlex, options) -> BasicLexer:
     cls = (options and options._plugins.get('BasicLexer')) or BasicLexer
@@ -299,7 +503,9 @@ class EarleyRegexpMatcher:
             else:
                 if width == 0:
                     raise GrammarError("Dynamic Earley doesn't allow zero-width regexps", t)
-            if lexer_conf.use_bytes:
+            if lexer_conf.use_bytes == 'utf8':
+                regexp = utf8_regexp(regexp, lexer_conf.g_regex_flags, lexer_conf.re_module).encode('latin-1')
+            elif lexer_conf.use_bytes:
                 regexp = regexp.encode('utf-8')
 
             self.regexps[t.name] = lexer_conf.re_module.compile(regexp, lexer_conf.g_regex_flags)
@@ -321,6 +527,10 @@ def _match_earley_basic(term, token):
 def create_earley_parser__basic(lexer_conf: LexerConf, parser_conf: ParserConf, **kw):
     return earley.Parser(lexer_conf, parser_conf, _match_earley_basic, **kw)
 
+def create_earley_contextual_lexer(lexer_conf: LexerConf, parser, postlex, options) -> EarleyContextualLexer:
+    always_accept: Collection[str] = postlex.always_accept if postlex else ()
+    return EarleyContextualLexer(lexer_conf, always_accept=always_accept)
+
 def create_earley_parser(lexer_conf: LexerConf, parser_conf: ParserConf, options) -> earley.Parser:
     resolve_ambiguity = options.ambiguity == 'resolve'
     debug = options.debug if options else False
@@ -18,7 +18,7 @@ from ..exceptions import UnexpectedEOF, UnexpectedToken
 from ..utils import logger, OrderedSet, dedup_list
 from .grammar_analysis import GrammarAnalyzer
 from ..grammar import NonTerminal
-from .earley_common import Item
+from .earley_common import Item, TransitiveItem
 from .earley_forest import ForestSumVisitor, SymbolNode, StableSymbolNode, TokenNode, ForestToParseTree
 
 if TYPE_CHECKING:
@@ -75,14 +75,20 @@ class Parser:
         self.term_matcher = term_matcher
 
 
-    def predict_and_complete(self, i, to_scan, columns, transitives, node_cache):
+    def predict_and_complete(self, i, to_scan, columns, transitives, node_cache, expecting=None, start_symbol=None):
         """The core Earley Predictor and Completer.
 
         At each stage of the input, we handling any completed items (things
         that matched on the last cycle) and use those to predict what should
         come next in the input stream. The completions and any predicted
         non-terminals are recursively processed until we reach a set of,
-        which can be added to the scan list for the next scanner cycle."""
+        which can be added to the scan list for the next scanner cycle.
+
+        ``expecting`` holds a dict for each of the previous columns, which maps a symbol to the items
+        of that column that expect it. When given, the completer uses it instead of searching the
+        column, and the dict for this column is appended to it once the column is complete.
+        It also enables Leo's optimization (see ``_leo_transitive()``), which never skips the
+        completion of ``start_symbol`` from the first column."""
         # Held Completions (H in E.Scotts paper).
         held_completions = {}
 
@@ -99,24 +105,17 @@ class Parser:
                     item.node = node_cache[label] if label in node_cache else node_cache.setdefault(label, self.SymbolNode(*label))
                     item.node.add_family(item.s, item.rule, item.start, None, None)
 
-                # create_leo_transitives(item.rule.origin, item.start)
-
                 ###R Joop Leo right recursion Completer
-                if item.rule.origin in transitives[item.start]:
-                    transitive = transitives[item.start][item.s]
-                    if transitive.previous in transitives[transitive.column]:
-                        root_transitive = transitives[transitive.column][transitive.previous]
-                    else:
-                        root_transitive = transitive
-
-                    new_item = Item(transitive.rule, transitive.ptr, transitive.start)
-                    label = (root_transitive.s, root_transitive.start, i)
+                transitive = None
+                if expecting is not None and item.start < i:
+                    transitive = self._leo_transitive(item.start, item.s, transitives, expecting, start_symbol)
+                if transitive is not None:
+                    # Skip the reductions along the path, and complete the item at its top
+                    new_item = transitive.top.reduction.advance()
+                    label = (new_item.s, new_item.start, i)
                     new_item.node = node_cache[label] if label in node_cache else node_cache.setdefault(label, self.SymbolNode(*label))
-                    new_item.node.add_path(root_transitive, item.node)
-                    if new_item.expect in self.TERMINALS:
-                        # Add (B :: aC.B, h, y) to Q
-                        to_scan.add(new_item)
-                    elif new_item not in column:
+                    new_item.node.add_path(transitive, item.node, node_cache)
+                    if new_item not in column:
                         # Add (B :: aC.B, h, y) to Ei and R
                         column.add(new_item)
                         items.append(new_item)
@@ -131,7 +130,10 @@ class Parser:
                     if is_empty_item:
                         held_completions[item.rule.origin] = item.node
 
-                    originators = [originator for originator in columns[item.start] if originator.expect is not None and originator.expect == item.s]
+                    if expecting is not None and item.start < i:
+                        originators = expecting[item.start].get(item.s, ())
+                    else:
+                        originators = [originator for originator in columns[item.start] if originator.expect is not None and originator.expect == item.s]
                     for originator in originators:
                         new_item = originator.advance()
                         label = (new_item.s, originator.start, i)
@@ -167,6 +169,48 @@ class Parser:
                         column.add(new_item)
                         items.append(new_item)
 
+        if expecting is not None:
+            # No more items will be added to this column
+            by_expect = {}
+            for item in column:
+                if item.expect is not None:
+                    if item.expect in by_expect:
+                        by_expect[item.expect].append(item)
+                    else:
+                        by_expect[item.expect] = [item]
+            expecting.append(by_expect)
+
+    def _leo_transitive(self, column, symbol, transitives, expecting, start_symbol):
+        """Returns the TransitiveItem for completing ``symbol`` from ``column``, or None.
+
+        Joop Leo's optimization: when a finished column has only one item that expects a symbol, and
+        the symbol is the last of the item's rule, completing the symbol will complete that rule too,
+        and so on up the path. Instead of completing each item along the path (which makes right
+        recursion quadratic), the completer adds the last one. The links are memoized per column
+        in ``transitives``, and the SPPF nodes of the skipped reductions are built from them later,
+        when the forest is read (see ``SymbolNode.add_path()``).
+        """
+        path = []
+        up = None
+        while True:
+            column_transitives = transitives[column]
+            if symbol in column_transitives:
+                up = column_transitives[symbol]
+                break
+            originators = expecting[column].get(symbol, ())
+            if len(originators) != 1 or originators[0].ptr + 1 != len(originators[0].rule.expansion):
+                column_transitives[symbol] = None
+                break
+            reduction = originators[0]
+            path.append((column_transitives, symbol, reduction))
+            if reduction.start == column or (reduction.start == 0 and reduction.rule.origin == start_symbol):
+                break
+            column, symbol = reduction.start, reduction.rule.origin
+
+        for column_transitives, symbol, reduction in reversed(path):
+            up = column_transitives[symbol] = TransitiveItem(reduction, up)
+        return up
+
     def _parse(self, lexer, columns, to_scan, start_symbol=None):
 
         def is_quasi_complete(item):
@@ -182,25 +226,47 @@ class Parser:
                 quasi = quasi.advance()
             return True
 
-        # def create_leo_transitives(origin, start):
-        #   ...   # removed at commit 4c1cfb2faf24e8f8bff7112627a00b94d261b420
+        def group_to_scan(to_scan):
+            """Groups the scan list by the name of the expected terminal, and updates ``expects``."""
+            to_scan_by_name = {}
+            for item in to_scan:
+                name = item.expect.name
+                if name in to_scan_by_name:
+                    to_scan_by_name[name].append(item)
+                else:
+                    to_scan_by_name[name] = [item]
+
+            expects.clear()
+            expects.update(items[0].expect for items in to_scan_by_name.values())
+            return to_scan_by_name
 
-        def scan(i, token, to_scan):
+        def scan(i, token, to_scan, to_scan_by_name):
             """The core Earley Scanner.
 
             This is a custom implementation of the scanner that uses the
             Lark lexer to match tokens. The scan list is built by the
             Earley predictor, based on the previously completed tokens.
             This ensures that at each phase of the parse we have a custom
-            lexer context, allowing for more complex ambiguities."""
+            lexer context, allowing for more complex ambiguities.
+
+            The terminal matcher only accepts a Token for the terminal of its type, so a Token
+            goes straight to the items that expect it. Other tokens (e.g. Trees, when using
+            TreeMatcher) are matched against each of the expected terminals."""
             next_to_scan = self.Set()
             next_set = self.Set()
             columns.append(next_set)
             transitives.append({})
             node_cache = {}
 
-            for item in self.Set(to_scan):
-                if match(item.expect, token):
+            if isinstance(token, Token):
+                candidates = [to_scan_by_name[token.type]] if token.type in to_scan_by_name else []
+            else:
+                candidates = to_scan_by_name.values()
+
+            for items in candidates:
+                if not match(items[0].expect, token):
+                    continue
+                for item in items:
                     new_item = item.advance()
                     label = (new_item.s, new_item.start, i + 1)
                     # 'terminals' may not contain token.type when using %declare
@@ -236,25 +302,28 @@ class Parser:
 
         # Cache for nodes & tokens created in a particular parse step.
         transitives = [{}]
+        # The items of each finished column, by the symbol they expect (for the completer)
+        expecting = []
 
         ## The main Earley loop.
         # Run the Prediction/Completion cycle for any Items in the current Earley set.
         # Completions will be added to the SPPF tree, and predictions will be recursively
         # processed down to terminals/empty nodes to be added to the scanner for the next
         # step.
-        expects = {i.expect for i in to_scan}
+        # The lexer reads the terminals expected by the next column (as Terminal symbols) from `expects`. It's
+        # a generator, so each token is only lexed after the column's predictions are complete.
+        expects = set()
         i = 0
         node_cache = {}
-        for token in lexer.lex(expects):
-            self.predict_and_complete(i, to_scan, columns, transitives, node_cache)
+        self.predict_and_complete(i, to_scan, columns, transitives, node_cache, expecting, start_symbol)
+        to_scan_by_name = group_to_scan(to_scan)
 
-            to_scan, node_cache = scan(i, token, to_scan)
+        for token in lexer.lex(expects):
+            to_scan, node_cache = scan(i, token, to_scan, to_scan_by_name)
             i += 1
 
-            expects.clear()
-            expects |= {i.expect for i in to_scan}
-
-        self.predict_and_complete(i, to_scan, columns, transitives, node_cache)
+            self.predict_and_complete(i, to_scan, columns, transitives, node_cache, expecting, start_symbol)
+            to_scan_by_name = group_to_scan(to_scan)
 
         ## Column is now the final column in the parse.
         assert i == len(columns)-1
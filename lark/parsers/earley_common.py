@@ -38,5 +38,20 @@ class Item:
         return '%s (%d)' % (symbol, self.start)
 
 
-# class TransitiveItem(Item):
-#   ...   # removed at commit 4c1cfb2faf24e8f8bff7112627a00b94d261b420
+class TransitiveItem:
+    """A link in a deterministic reduction path, for Joop Leo's right-recursion optimization.
+
+    ``reduction`` is the only item of its column that expects some symbol, and that symbol is the last
+    in its rule. So completing the symbol in a later column always completes the item's rule too.
+    ``up`` is the link for that rule's origin in the column of ``reduction.start`` (or None),
+    and ``top`` is the last link of the path, whose completed item the completer adds instead.
+    """
+
+    __slots__ = ('reduction', 'up', 'top')
+    def __init__(self, reduction, up):
+        self.reduction = reduction
+        self.up = up
+        self.top = up.top if up is not None else self
+
+    def __repr__(self):
+        return 'TransitiveItem(%r)' % (self.reduction,)
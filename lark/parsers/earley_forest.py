@@ -10,6 +10,8 @@ https://web.archive.org/web/20190616123959/http://www.bramvandersanden.com/post/
 from typing import Type, AbstractSet
 from random import randint
 from collections import deque
+from bisect import bisect_left, bisect_right
+from itertools import count
 from operator import attrgetter
 from importlib import import_module
 from functools import partial
@@ -22,6 +24,9 @@ from ..tree import Tree
 class ForestNode:
     pass
 
+# Numbers the families in the order that they're added, so that the families of a Leo path can be put in their place
+_family_counter = count()
+
 class SymbolNode(ForestNode):
     """
     A Symbol Node represents a symbol (or Intermediate LR0).
@@ -46,14 +51,15 @@ class SymbolNode(ForestNode):
         priority: The priority of the node's symbol.
     """
     Set: Type[AbstractSet] = set   # Overridden by StableSymbolNode
-    __slots__ = ('s', 'start', 'end', '_children', 'paths', 'paths_loaded', 'priority', 'is_intermediate')
+    __slots__ = ('s', 'start', 'end', '_children', 'paths', 'paths_loaded', '_node_cache', 'priority', 'is_intermediate')
     def __init__(self, s, start, end):
         self.s = s
         self.start = start
         self.end = end
         self._children = self.Set()
         self.paths = self.Set()
-        self.paths_loaded = False
+        self.paths_loaded = True
+        self._node_cache = None
 
         ### We use inf here as it can be safely negated without resorting to conditionals,
         #   unlike None or float('NaN'), and sorts appropriately.
@@ -63,19 +69,74 @@ class SymbolNode(ForestNode):
     def add_family(self, lr0, rule, start, left, right):
         self._children.add(PackedNode(self, lr0, rule, start, left, right))
 
-    def add_path(self, transitive, node):
-        self.paths.add((transitive, node))
+    def add_path(self, transitive, node, node_cache):
+        """Adds the derivation through a deterministic reduction path (see ``TransitiveItem``),
+        from ``transitive`` up to this node's symbol, over ``node``.
+
+        The nodes of the reductions along the path are only created when the children are read,
+        using ``node_cache`` (of this node's column) to share them with the rest of the forest.
+        """
+        self.paths.add((transitive, node, next(_family_counter)))
+        self.paths_loaded = False
+        self._node_cache = node_cache
 
     def load_paths(self):
-        for transitive, node in self.paths:
-            if transitive.next_titem is not None:
-                vn = type(self)(transitive.next_titem.s, transitive.next_titem.start, self.end)
-                vn.add_path(transitive.next_titem, node)
-                self.add_family(transitive.reduction.rule.origin, transitive.reduction.rule, transitive.reduction.start, transitive.reduction.node, vn)
-            else:
-                self.add_family(transitive.reduction.rule.origin, transitive.reduction.rule, transitive.reduction.start, transitive.reduction.node, node)
+        node_cache = self._node_cache
+        families_by_node = {}
+        for transitive, node, seq in self.paths:
+            # Add the families of the skipped reductions, from the bottom of the path up to this node
+            right = node
+            while True:
+                reduction = transitive.reduction
+                origin = reduction.rule.origin
+                if transitive.up is None:
+                    parent = self
+                else:
+                    label = (origin, reduction.start, self.end)
+                    parent = node_cache[label] if label in node_cache else node_cache.setdefault(label, type(self)(*label))
+                packed = PackedNode(parent, origin, reduction.rule, self.end, reduction.node, right)
+                packed.seq = seq
+                families_by_node.setdefault(parent, []).append(packed)
+                if transitive.up is None:
+                    break
+                right = parent
+                transitive = transitive.up
+        self.paths = self.Set()
         self.paths_loaded = True
 
+        for parent, families in families_by_node.items():
+            parent._add_families_at_seq(families)
+
+    def _add_families_at_seq(self, families):
+        """Adds families of Leo paths, each in the place where the regular completer would have added it.
+
+        The regular completer goes up a deterministic path right away, so it adds all the families of the path
+        at the time of the completion (``seq``), before the families that were added since. The order matters,
+        because ambiguity='resolve' picks the first of the families with the best sort key.
+        """
+        children = sorted(self._children, key=attrgetter('seq'))    # Already in order, unless Set is a set
+        seqs = [child.seq for child in children]
+        existing = {child: child for child in children}
+        for packed in families:
+            seq = packed.seq
+            if packed in existing:
+                packed = existing[packed]
+                if packed.seq <= seq:
+                    continue
+                # Move it to its earlier place
+                i = bisect_left(seqs, packed.seq)
+                while children[i] is not packed:
+                    i += 1
+                del children[i]
+                del seqs[i]
+                packed.seq = seq
+            else:
+                existing[packed] = packed
+            i = bisect_right(seqs, seq)
+            children.insert(i, packed)
+            seqs.insert(i, seq)
+        self._children = self.Set(children)
+
     @property
     def is_ambiguous(self):
         """Returns True if this node is ambiguous."""
@@ -90,6 +151,8 @@ class SymbolNode(ForestNode):
         return sorted(self._children, key=attrgetter('sort_key'))
 
     def __iter__(self):
+        if not self.paths_loaded:
+            self.load_paths()
         return iter(self._children)
 
     def __repr__(self):
@@ -118,7 +181,7 @@ class PackedNode(ForestNode):
         right: The right child of this node. ``None`` if one does not exist.
         priority: The priority of this node.
     """
-    __slots__ = ('parent', 's', 'rule', 'start', 'left', 'right', 'priority', '_hash')
+    __slots__ = ('parent', 's', 'rule', 'start', 'left', 'right', 'priority', 'seq', '_hash')
     def __init__(self, parent, s, rule, start, left, right):
         self.parent = parent
         self.s = s
@@ -127,6 +190,7 @@ class PackedNode(ForestNode):
         self.left = left
         self.right = right
         self.priority = float('-inf')
+        self.seq = next(_family_counter)
         self._hash = hash((self.left, self.right))
 
     @property
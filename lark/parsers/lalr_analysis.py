@@ -6,7 +6,7 @@ For now, shift/reduce conflicts are automatically resolved as shifts.
 # Author: Erez Shinan (2017)
 # Email : erezshin@gmail.com
 
-from typing import Dict, Set, Iterator, Tuple, List, TypeVar, Generic
+from typing import Dict, Set, Iterator, Tuple, List, TypeVar, Generic, FrozenSet, Optional, Collection
 from collections import defaultdict
 
 from ..utils import classify, classify_bool, bfs, fzset, Enumerator, logger
@@ -72,14 +72,165 @@ class ParseTable(ParseTableBase['State']):
 
     Slower than IntParseTable, but useful for debugging
     """
-    pass
+    _consistent_reductions: Optional[Dict['State', Rule]] = None
+
+    @property
+    def consistent_reductions(self) -> Dict['State', Rule]:
+        "The reduce of each state that has no other action on a terminal, like ``IntParseTable.consistent_reductions``"
+        if self._consistent_reductions is None:
+            # Like in IntParseTable, without the grammar, the nonterminals are the origins of the rules that we reduce
+            nonterminals = {arg.origin.name for actions in self.states.values() for action, arg in actions.values() if action is Reduce}
+            self._consistent_reductions = {}
+            for state, actions in self.states.items():
+                terminal_actions = {(action, arg) for sym, (action, arg) in actions.items() if sym not in nonterminals}
+                if len(terminal_actions) == 1:
+                    (action, arg), = terminal_actions
+                    if action is Reduce and arg.origin.name not in self.start_states:
+                        self._consistent_reductions[state] = arg
+        return self._consistent_reductions
 
 
 class IntParseTable(ParseTableBase[int]):
-    """Parse-table whose key is int. Best for performance."""
+    """Parse-table whose key is int. Best for performance.
+
+    Alongside ``states``, it holds a compressed integer version of the table, that the parser uses for its lookups:
+
+    - Every symbol gets an integer id. Terminals come first, so ``id < n_terminals`` is a terminal.
+    - ``action_rows[state][terminal_id]`` is ``target << 1`` for a shift, ``rule_index << 1 | 1`` for a reduce,
+      or -1, in which case the action is ``default_actions[state]``.
+    - ``default_actions[state]`` is the most common reduce of the state, or -1 if it has none.
+      Its entries are removed from the action row, which lets more states share the same row.
+    - ``goto_rows[state][nonterminal_id - n_terminals]`` is the goto state, or -1.
+    - ``consistent_reductions[state]`` is the reduce of a state that has no other action, or -1.
+      Such a state can be reduced without looking at the next token, so the contextual lexer lexes
+      the next token in the state that the reduction leads to (see ``ParserState.lexer_position``).
+
+    States with identical rows share the same list.
+
+    The default actions would reduce on unexpected tokens too, and detect the error in a later state,
+    that might expect fewer terminals. So the parser only takes them for the terminals in ``states``.
+    """
+
+    symbols: List[str]
+    symbol_ids: Dict[str, int]
+    n_terminals: int
+    rules: List[Rule]
+    rule_sizes: List[int]
+    rule_origins: List[int]
+    action_rows: List[List[int]]
+    default_actions: List[int]
+    goto_rows: List[List[int]]
+    consistent_reductions: List[int]
+
+    def __init__(self, states, start_states, end_states, nonterminals: Optional[Collection[str]]=None):
+        super().__init__(states, start_states, end_states)
+
+        # The nonterminals are the origins of the grammar's rules. The rest of the symbols are terminals.
+        # Without the grammar (i.e. a table written by an older version), we use the origins of the rules that it reduces.
+        all_symbols = {sym for actions in states.values() for sym in actions}
+        if nonterminals is None:
+            nonterminals = {arg.origin.name for actions in states.values() for action, arg in actions.values() if action is Reduce}
+        else:
+            nonterminals = set(nonterminals)
+        terminals = sorted(all_symbols - nonterminals)
+        self.symbols = terminals + sorted(all_symbols & nonterminals)
+        self.symbol_ids = {sym: i for i, sym in enumerate(self.symbols)}
+        self.n_terminals = n_terminals = len(terminals)
+
+        rule_ids: Dict[Rule, int] = {}
+        self.rules = []
+        unique_rows: Dict[Tuple[int, ...], List[int]] = {}
+        self.action_rows = []
+        self.default_actions = []
+        self.goto_rows = []
+        self.consistent_reductions = []
+        for state in range(len(states)):
+            action_row = [-1] * n_terminals
+            goto_row = [-1] * (len(self.symbols) - n_terminals)
+            for sym, (action, arg) in states[state].items():
+                i = self.symbol_ids[sym]
+                if action is Reduce:
+                    if arg not in rule_ids:
+                        rule_ids[arg] = len(self.rules)
+                        self.rules.append(arg)
+                    action_row[i] = rule_ids[arg] << 1 | 1
+                elif i >= n_terminals:
+                    goto_row[i - n_terminals] = arg
+                else:
+                    action_row[i] = arg << 1
+
+            # Reducing a start rule can lead to an end state, which only the end of the input may reach
+            reductions = [code for code in action_row if code & 1 and code > 0
+                          and self.rules[code >> 1].origin.name not in start_states]
+            default = max(set(reductions), key=reductions.count) if reductions else -1
+            if default >= 0:
+                action_row = [-1 if code == default else code for code in action_row]
+            self.default_actions.append(default)
+            self.consistent_reductions.append(default if max(action_row, default=-1) < 0 else -1)
+            self.action_rows.append(unique_rows.setdefault(tuple(action_row), action_row))
+            self.goto_rows.append(unique_rows.setdefault(tuple(goto_row), goto_row))
+
+        self.rule_sizes = [len(rule.expansion) for rule in self.rules]
+        self.rule_origins = [self.symbol_ids.get(rule.origin.name, -1) - n_terminals for rule in self.rules]
+
+        self._expected: Dict[int, FrozenSet[str]] = {}
+
+    def expected(self, state: int) -> FrozenSet[str]:
+        "Returns the terminals that the given state has an action for"
+        try:
+            return self._expected[state]
+        except KeyError:
+            symbol_ids = self.symbol_ids
+            res = self._expected[state] = frozenset(sym for sym in self.states[state] if symbol_ids[sym] < self.n_terminals)
+            return res
+
+    def serialize(self, memo):
+        # We only write the compressed table, and the terminals of each default action, which it doesn't keep
+        unique_rows = Enumerator()
+        state_rows = []
+        for state in range(len(self.action_rows)):
+            default = self.default_actions[state]
+            default_rule = self.rules[default >> 1] if default >= 0 else None
+            lookaheads = [self.symbol_ids[sym] for sym, (action, arg) in self.states[state].items()
+                          if action is Reduce and arg == default_rule]
+            state_rows.append((unique_rows.get(tuple(self.action_rows[state])),
+                               unique_rows.get(tuple(self.goto_rows[state])),
+                               default,
+                               unique_rows.get(tuple(lookaheads))))
+
+        rows = unique_rows.reversed()
+        return {
+            'symbols': self.symbols,
+            'n_terminals': self.n_terminals,
+            'rules': [rule.serialize(memo) for rule in self.rules],
+            'rows': [{i: x for i, x in enumerate(rows[j]) if x >= 0} for j in range(len(rows))],
+            'state_rows': state_rows,
+            'start_states': self.start_states,
+            'end_states': self.end_states,
+        }
+
+    @classmethod
+    def deserialize(cls, data, memo):
+        if 'state_rows' not in data:
+            return super().deserialize(data, memo)   # Written by an older version of Lark
+
+        symbols = data['symbols']
+        n_terminals = data['n_terminals']
+        rules = [Rule.deserialize(r, memo) for r in data['rules']]
+        rows = data['rows']
+        states = {}
+        for state, (action_row, goto_row, default, lookaheads) in enumerate(data['state_rows']):
+            actions = states[state] = {}
+            for i, code in rows[action_row].items():
+                actions[symbols[i]] = (Reduce, rules[code >> 1]) if code & 1 else (Shift, code >> 1)
+            for i, target in rows[goto_row].items():
+                actions[symbols[n_terminals + i]] = (Shift, target)
+            for i in rows[lookaheads].values():
+                actions[symbols[i]] = (Reduce, rules[default >> 1])
+        return cls(states, data['start_states'], data['end_states'], symbols[n_terminals:])
 
     @classmethod
-    def from_ParseTable(cls, parse_table: ParseTable):
+    def from_ParseTable(cls, parse_table: ParseTable, nonterminals: Optional[Collection[str]]=None):
         enum = list(parse_table.states)
         state_to_idx: Dict['State', int] = {s:i for i,s in enumerate(enum)}
         int_states = {}
@@ -92,7 +243,7 @@ class IntParseTable(ParseTableBase[int]):
 
         start_states = {start:state_to_idx[s] for start, s in parse_table.start_states.items()}
         end_states = {start:state_to_idx[s] for start, s in parse_table.end_states.items()}
-        return cls(int_states, start_states, end_states)
+        return cls(int_states, start_states, end_states, nonterminals)
 
 ###}
 
@@ -324,7 +475,8 @@ class LALR_Analyzer(GrammarAnalyzer):
         if self.debug:
             self.parse_table = _parse_table
         else:
-            self.parse_table = IntParseTable.from_ParseTable(_parse_table)
+            nonterminals = {origin.name for origin in self.rules_by_origin}
+            self.parse_table = IntParseTable.from_ParseTable(_parse_table, nonterminals)
 
     def compute_lalr(self):
         self.compute_lr0_states()
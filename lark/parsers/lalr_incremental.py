@@ -0,0 +1,308 @@
+"""Incremental reparsing for the LALR(1) parser. See ``Lark.parse_incremental()``.
+"""
+from typing import Any, List, Optional, Sequence, Tuple, cast
+
+from ..lexer import Token, Lexer, LexerThread, LexerState, _TextSlice_WithLineCount, _find_token_at, _shift_tokens
+from ..tree import Tree
+from .lalr_parser_state import ParserState, ParseConf
+
+###{standalone
+
+# A node of a recorded parser stack: (depth, state, value, n_children, parent)
+#
+# The snapshot of each token boundary is the node at the top of the stack. Consecutive snapshots share
+# the nodes of the part of the stack that didn't change, so recording them costs O(1) amortized per token.
+#
+# The tree builder extends the children of left-recursive rules in-place, so we also record how many
+# children each tree had at the time, and trim the extra children when restoring it.
+_Node = Tuple[int, Any, Any, int, Any]
+
+Edit = Tuple[int, int, str]
+
+
+def _push_changes(node: _Node, state_stack: list, value_stack: list) -> Tuple[_Node, int]:
+    """Returns the node for the top of the given stacks, reusing the part of ``node``'s chain
+    that is still on them, and the depth of that part.
+    """
+    depth = len(state_stack)
+    while True:
+        node_depth = node[0]
+        if node_depth <= depth and state_stack[node_depth-1] == node[1]:
+            if node_depth == 1:
+                break
+            value = node[2]
+            if value_stack[node_depth-2] is value and (node[3] < 0 or len(value.children) == node[3]):
+                break
+        node = node[4]
+
+    common = node[0]
+    for d in range(common, depth):
+        value = value_stack[d-1]
+        node = (d+1, state_stack[d], value, len(value.children) if isinstance(value, Tree) else -1, node)
+    return node, common
+
+
+def _unwind(node: _Node, above: int) -> Tuple[list, list]:
+    """Returns the states and values of the chain of ``node``, above the given depth, from the bottom up.
+
+    Trees are copied, so that parsing on top of them won't change the trees of the previous parse.
+    """
+    states = []
+    values = []
+    while node is not None and node[0] > above:
+        depth, state, value, n_children, parent = node
+        states.append(state)
+        if depth > 1:
+            if n_children >= 0:
+                value = type(value)(value.data, value.children[:n_children], value._meta)
+            values.append(value)
+        node = parent
+    states.reverse()
+    values.reverse()
+    return states, values
+
+
+def _extend(node: _Node, old_node: _Node, state_stack: list, value_stack: list) -> _Node:
+    """Pushes the part of ``old_node``'s chain that is above ``node`` onto the stacks, and returns the node of their new top.
+
+    Only the trees that gained children since are copied. (The reductions that follow are the same ones
+    that the previous parse did, so they won't change the others.)
+    """
+    above = []
+    while old_node[0] > node[0]:
+        above.append(old_node)
+        old_node = old_node[4]
+    for depth, state, value, n_children, _ in reversed(above):
+        if n_children >= 0 and len(value.children) != n_children:
+            value = type(value)(value.data, value.children[:n_children], value._meta)
+        state_stack.append(state)
+        value_stack.append(value)
+        node = (depth, state, value, n_children, node)
+    return node
+
+
+def _same_states(node: _Node, state_stack: list) -> bool:
+    if node[0] != len(state_stack):
+        return False
+    while node is not None:
+        if state_stack[node[0]-1] != node[1]:
+            return False
+        node = node[4]
+    return True
+
+
+def _apply_edits(text: str, edits: Sequence[Edit]) -> Tuple[str, int, int, int]:
+    """Applies the edits to the text, one after the other.
+
+    Returns the new text, and the range that changed: its start, its end in the old text, and the change in length.
+    """
+    start: Optional[int] = None
+    end = delta = 0     # The changed range ends at ``end`` in the current text
+    for edit_start, edit_end, replacement in edits:
+        if not 0 <= edit_start <= edit_end <= len(text):
+            raise ValueError("Edit %r is out of range for a text of length %d" % ((edit_start, edit_end), len(text)))
+        text = text[:edit_start] + replacement + text[edit_end:]
+        edit_delta = len(replacement) - (edit_end - edit_start)
+        replaced_end = edit_start + len(replacement)
+        if start is None:
+            start, end = edit_start, replaced_end
+        else:
+            if end > edit_start:
+                end = end + edit_delta if end >= edit_end else replaced_end
+            start = min(start, edit_start)
+            end = max(end, replaced_end)
+        delta += edit_delta
+    if start is None:
+        return text, 0, 0, 0
+    return text, start, end - delta, delta
+
+
+class IncrementalParse:
+    """The result of ``Lark.parse_incremental()``.
+
+    Pass it back to ``parse_incremental()``, along with the edits made to the text, to parse the new text.
+    A successful reparse consumes it: the new result reuses its tokens and subtrees, and may change them in-place.
+
+    Attributes:
+        tree: The parse tree
+        text: The text that was parsed
+        tokens: The tokens that were fed to the parser (without the ignored ones)
+        start: The start symbol
+    """
+    __slots__ = 'tree', 'text', 'tokens', 'start', '_nodes', '_bases', '_low'
+
+    tree: Any
+    text: str
+    tokens: List[Token]
+    start: str
+    _nodes: Optional[List[_Node]]
+    _bases: List[Optional[_Node]]
+    _low: List[int]
+
+    def __init__(self, tree, text: str, tokens: List[Token], start: str,
+                 nodes: List[_Node], bases: List[Optional[_Node]], low: List[int]):
+        self.tree = tree
+        self.text = text
+        self.tokens = tokens
+        self.start = start
+        # For each token boundary (including the end): the snapshot of the stack.
+        # When the reparse skipped over the boundary, its base is the stack that it had under the skipped part,
+        # and only the nodes above the base's depth are valid. Otherwise, the base is None.
+        self._nodes = nodes
+        self._bases = bases
+        # For each token: the depth of the stack that wasn't touched while feeding it
+        self._low = low
+
+    def __repr__(self):
+        return 'IncrementalParse(%r, tokens=%d)' % (self.tree, len(self.tokens))
+
+
+class IncrementalParser:
+    """Parses a text, and reparses it after edits, while reusing as much as it can of the previous parse.
+
+    Used by ``Lark.parse_incremental()``.
+    """
+
+    def __init__(self, parser, lexer: Lexer):
+        self.parser = parser    # lalr_parser._Parser
+        self.lexer = lexer
+
+    def _new_state(self, start: str, text_slice: _TextSlice_WithLineCount, last_token: Optional[Token],
+                   state_stack: Optional[list]=None, value_stack: Optional[list]=None) -> ParserState:
+        lexer_thread = LexerThread(self.lexer, LexerState(text_slice, last_token=last_token))
+        parse_conf = ParseConf(self.parser.parse_table, self.parser.callbacks, start)
+        return ParserState(parse_conf, lexer_thread, state_stack, value_stack)
+
+    def parse(self, text: str, start: str) -> IncrementalParse:
+        state = self._new_state(start, _TextSlice_WithLineCount.after_token(text, None), None)
+        state_stack = cast(list, state.state_stack)
+        value_stack = cast(list, state.value_stack)
+        node: _Node = (1, state_stack[0], None, -1, None)
+        tokens: List[Token] = []
+        nodes = [node]
+        low: List[int] = []
+        for token in state.lexer.lex(state):
+            state.feed_token(token)
+            node, common = _push_changes(node, state_stack, value_stack)
+            tokens.append(token)
+            nodes.append(node)
+            low.append(common)
+
+        tree = self._feed_end(state, tokens)
+        return IncrementalParse(tree, text, tokens, start, nodes, [None] * len(nodes), low)
+
+    def reparse(self, previous: IncrementalParse, edits: Sequence[Edit]) -> IncrementalParse:
+        if previous._nodes is None:
+            raise ValueError("This result was already reparsed. Use the result of the last call instead.")
+
+        text, damage_start, damage_end, delta = _apply_edits(previous.text, edits)
+        if text == previous.text:
+            return previous
+
+        old_tokens = previous.tokens
+        old_nodes = previous._nodes
+        old_bases = previous._bases
+        old_low = previous._low
+        n = len(old_tokens)
+
+        # Find the first token that touches the edit
+        first_damaged = _find_token_at(old_tokens, damage_start)
+
+        # Resume one token earlier, because the edit might let it match a longer string
+        i = max(first_damaged - 1, 0)
+        last_token = old_tokens[i-1] if i else None
+        text_slice = _TextSlice_WithLineCount.after_token(text, last_token)
+
+        node = old_nodes[i]
+        base = old_bases[i]
+        if base is None:
+            state_stack, value_stack = _unwind(node, 0)
+        else:
+            state_stack, value_stack = _unwind(base, 0)
+            more_states, more_values = _unwind(node, base[0])
+            state_stack += more_states
+            value_stack += more_values
+            node = base
+        state = self._new_state(previous.start, text_slice, last_token, state_stack, value_stack)
+        state_stack = cast(list, state.state_stack)
+        value_stack = cast(list, state.value_stack)
+        node, _ = _push_changes(node, state_stack, value_stack)
+
+        tokens = old_tokens[:i]
+        nodes = old_nodes[:i] + [node]
+        bases = old_bases[:i] + [None]
+        low = old_low[:i]
+
+        # Relex and parse, until we're back in step with the previous parse
+        j = first_damaged
+        for token in state.lexer.lex(state):
+            if token.start_pos >= damage_end + delta:
+                old_pos = token.start_pos - delta
+                while j < n and old_tokens[j].start_pos < old_pos:
+                    j += 1
+                if j < n and old_tokens[j].start_pos == old_pos:
+                    old_token = old_tokens[j]
+                    if (old_token.type == token.type and old_token.value == token.value
+                            and _same_states(old_nodes[j], state_stack)):
+                        break
+
+            state.feed_token(token)
+            node, common = _push_changes(node, state_stack, value_stack)
+            tokens.append(token)
+            nodes.append(node)
+            bases.append(None)
+            low.append(common)
+        else:
+            # Reached the end of the text without getting back in step
+            tree = self._feed_end(state, tokens)
+            previous._nodes = None
+            return IncrementalParse(tree, text, tokens, previous.start, nodes, bases, low)
+
+        # The rest of the old tokens are still valid, only moved
+        _shift_tokens(old_tokens, j, token.line - old_token.line, token.column - old_token.column, delta)
+        tokens += old_tokens[j:]
+
+        # Continue along the previous parse. Only the values at the bottom of the stack, up to depth ``f``,
+        # are different from before. As long as the previous parse didn't reach down to them, the parse
+        # proceeds exactly as it did, and we can skip the tokens without feeding them.
+        f = len(state_stack)
+        k = j
+        while True:
+            skip_to = k
+            while skip_to < n and old_low[skip_to] >= f:
+                old_base = old_bases[skip_to+1]
+                if old_base is not None and old_base[0] > f:
+                    break
+                skip_to += 1
+
+            if skip_to > k:
+                nodes += old_nodes[k+1:skip_to+1]
+                bases += [node] * (skip_to - k)
+                low += old_low[k:skip_to]
+
+                # Put the part of the stack that the previous parse built since on top of the new values
+                node = _extend(node, old_nodes[skip_to], state_stack, value_stack)
+                nodes[-1] = node
+                bases[-1] = None
+                k = skip_to
+
+            if k == n:
+                break
+            state.feed_token(old_tokens[k])
+            node, common = _push_changes(node, state_stack, value_stack)
+            nodes.append(node)
+            bases.append(None)
+            low.append(common)
+            f = len(state_stack)
+            k += 1
+
+        tree = self._feed_end(state, tokens)
+        previous._nodes = None
+        return IncrementalParse(tree, text, tokens, previous.start, nodes, bases, low)
+
+    def _feed_end(self, state: ParserState, tokens: List[Token]):
+        end_token = Token.new_borrow_pos('$END', '', tokens[-1]) if tokens else Token('$END', '', 0, 1, 1)
+        return state.feed_token(end_token, True)
+
+
+###}
@@ -4,7 +4,6 @@ from typing import Iterator, List
 from copy import copy
 import warnings
 
-from lark.exceptions import UnexpectedToken
 from lark.lexer import Token, LexerThread
 from .lalr_parser_state import ParserState
 
@@ -33,6 +32,16 @@ class InteractiveParser:
         """
         return self.parser_state.feed_token(token, token.type == '$END')
 
+    def try_feed_token(self, token: Token) -> bool:
+        """Like ``feed_token()``, but instead of raising ``UnexpectedToken`` when the token isn't accepted,
+        returns False and leaves the parser unchanged. Returns True when the token was fed.
+
+        When feeding '$END' succeeds, the result of the parse is ``parser_state.value_stack[-1]``.
+
+        Note: ``ImmutableInteractiveParser.try_feed_token()`` returns a new parser, or None, instead of a bool.
+        """
+        return self.parser_state.try_feed_token(token, token.type == '$END')
+
     def iter_parse(self) -> Iterator[Token]:
         """Step through the different stages of the parse, by reading tokens from the lexer
         and feeding them to the parser, one per iteration.
@@ -103,22 +112,8 @@ class InteractiveParser:
 
     def accepts(self):
         """Returns the set of possible tokens that will advance the parser into a new valid state."""
-        accepts = set()
-        conf_no_callbacks = copy(self.parser_state.parse_conf)
-        # We don't want to call callbacks here since those might have arbitrary side effects
-        # and are unnecessarily slow.
-        conf_no_callbacks.callbacks = {}
-        for t in self.choices():
-            if t.isupper(): # is terminal?
-                new_cursor = self.copy(deepcopy_values=False)
-                new_cursor.parser_state.parse_conf = conf_no_callbacks
-                try:
-                    new_cursor.feed_token(self.lexer_thread._Token(t, ''))
-                except UnexpectedToken:
-                    pass
-                else:
-                    accepts.add(t)
-        return accepts
+        parser_state = self.parser_state
+        return {t for t in self.choices() if t.isupper() and parser_state.accepts_token_type(t)}
 
     def resume_parse(self):
         """Resume automated parsing from the current state.
@@ -142,6 +137,19 @@ class ImmutableInteractiveParser(InteractiveParser):
         c.result = InteractiveParser.feed_token(c, token)
         return c
 
+    def try_feed_token(self, token):
+        """Returns a new ImmutableInteractiveParser that was fed the token, or None if it isn't accepted.
+
+        Unlike ``InteractiveParser.try_feed_token()``, which returns a bool, since this parser doesn't change.
+        """
+        c = copy(self)
+        is_end = token.type == '$END'
+        if not c.parser_state.try_feed_token(token, is_end):
+            return None
+        if is_end:
+            c.result = c.parser_state.value_stack[-1]
+        return c
+
     def exhaust_lexer(self):
         """Try to feed the rest of the lexer state into the parser.
 
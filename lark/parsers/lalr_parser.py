@@ -2,15 +2,15 @@
 """
 # Author: Erez Shinan (2017)
 # Email : erezshin@gmail.com
-from typing import Dict, Any, Optional
-from ..lexer import Token, LexerThread
+from typing import Dict, Any, List, Optional, Union, cast
+from ..lexer import Token, LexerThread, BasicLexer, ContextualLexer
 from ..utils import Serialize
 from ..common import ParserConf, ParserCallbacks
 
 from .lalr_analysis import LALR_Analyzer, IntParseTable, ParseTableBase
 from .lalr_interactive_parser import InteractiveParser
-from lark.exceptions import UnexpectedCharacters, UnexpectedInput, UnexpectedToken
-from .lalr_parser_state import ParserState, ParseConf
+from lark.exceptions import UnexpectedCharacters, UnexpectedInput, UnexpectedToken, LexError
+from .lalr_parser_state import ParserState, ParseConf, PersistentStack
 
 ###{standalone
 
@@ -34,8 +34,8 @@ class LALR_Parser(Serialize):
     def serialize(self, memo: Any = None) -> Dict[str, Any]:
         return self._parse_table.serialize(memo)
 
-    def parse_interactive(self, lexer: LexerThread, start: str):
-        return self.parser.parse(lexer, start, start_interactive=True)
+    def parse_interactive(self, lexer: LexerThread, start: str, persistent_stacks: bool=False):
+        return self.parser.parse(lexer, start, start_interactive=True, persistent_stacks=persistent_stacks)
 
     def parse(self, lexer, start, on_error=None):
         try:
@@ -80,22 +80,29 @@ class _Parser:
         self.callbacks = callbacks
         self.debug = debug
 
-    def parse(self, lexer: LexerThread, start: str, value_stack=None, state_stack=None, start_interactive=False):
+    def parse(self, lexer: LexerThread, start: str, value_stack=None, state_stack=None, start_interactive=False, persistent_stacks=False):
         parse_conf = ParseConf(self.parse_table, self.callbacks, start)
+        if persistent_stacks:
+            state_stack = PersistentStack(state_stack or [parse_conf.start_state])
+            value_stack = PersistentStack(value_stack or ())
         parser_state = ParserState(parse_conf, lexer, state_stack, value_stack)
         if start_interactive:
             return InteractiveParser(self, parser_state, parser_state.lexer)
-        return self.parse_from_state(parser_state)
+        return self.parse_from_state(parser_state, fused=True)
 
 
-    def parse_from_state(self, state: ParserState, last_token: Optional[Token]=None):
+    def parse_from_state(self, state: ParserState, last_token: Optional[Token]=None, fused: bool=False):
         """Run the main LALR parser loop
 
         Parameters:
             state - the initial state. Changed in-place.
             last_token - Used only for line information in case of an empty lexer.
+            fused - Lex and parse in a single loop, when the lexer allows it. See ``_parse_fused()``.
         """
         try:
+            if fused and _can_fuse(state):
+                return self._parse_fused(state)
+
             token = last_token
             for token in state.lexer.lex(state):
                 assert token is not None
@@ -119,4 +126,151 @@ class _Parser:
                 print("")
 
             raise
+
+    def _parse_fused(self, state: ParserState):
+        """Does the work of ``BasicLexer.next_token()`` and ``ParserState.feed_token()`` in a single loop.
+
+        The state is kept up to date as we go. On errors, we call ``next_token()`` or ``feed_token()``
+        on it, to raise the same exception that the regular loop would.
+
+        Like ``ContextualLexer.lex()``, the tokens are lexed in ``ParserState.lexer_position``.
+        """
+        # _can_fuse() checked the types of the lexer and of the parse table
+        lexer_thread = state.lexer
+        lexer = cast(Union[BasicLexer, ContextualLexer], lexer_thread.lexer)
+        lexers = lexer.lexers if isinstance(lexer, ContextualLexer) else None
+        lexer_state = lexer_thread.state
+        assert lexer_state is not None
+        line_ctr = lexer_state.line_ctr
+        feed = line_ctr.feed
+        text = lexer_state.text
+        text_str = text.text
+        end = text.end
+
+        parse_conf = state.parse_conf
+        parse_table = parse_conf.int_table
+        assert parse_table is not None
+        action_rows = parse_table.action_rows
+        default_actions = parse_table.default_actions
+        states = parse_table.states
+        goto_rows = parse_table.goto_rows
+        consistent_reductions = parse_table.consistent_reductions
+        symbol_ids = parse_table.symbol_ids
+        n_terminals = parse_table.n_terminals
+        rule_sizes = parse_table.rule_sizes
+        rule_origins = parse_table.rule_origins
+        rule_callbacks = parse_conf.rule_callbacks
+        token_callbacks = parse_conf.token_callbacks
+        state_stack = cast(List[int], state.state_stack)
+        value_stack = state.value_stack
+        end_state = parse_conf.end_state
+        new_token = Token._future_new
+
+        parts_by_state: Dict[int, Any] = {}
+        token: Optional[Token] = None
+        term = -1   # The terminal id of the token, or -1 when the next token wasn't lexed yet
+        while True:
+            if term < 0:
+                # Lex the next token, in the context of the state that will shift it
+                if line_ctr.char_pos >= end:
+                    break   # Before _fused_loop_parts(), which builds the scanner
+                lexer_position = state_stack[-1]
+                if lexers is not None and consistent_reductions[lexer_position] >= 0:
+                    lexer_position = state.lexer_position
+                try:
+                    parts = parts_by_state[lexer_position]
+                except KeyError:
+                    basic_lexer = cast(BasicLexer, lexer if lexers is None else lexers[lexer_position])
+                    parts = parts_by_state[lexer_position] = basic_lexer._fused_loop_parts()
+
+                if parts is None:
+                    try:
+                        t = lexer.next_token(lexer_state, state)
+                    except EOFError:
+                        break
+                else:
+                    match, skip, skip_newlines, ignore_types, newline_types, lexer_callbacks = parts
+                    pos = line_ctr.char_pos
+                    if skip is not None and pos < end:
+                        m = skip(text_str, pos, end)
+                        if m:
+                            feed(m.group(0), skip_newlines)
+                            pos = line_ctr.char_pos
+                    if pos >= end:
+                        break
+
+                    res = match(text, pos)
+                    if not res:
+                        lexer.next_token(lexer_state, state)    # Raises UnexpectedInput
+                        raise AssertionError("next_token() didn't raise")
+
+                    value, type_ = res
+                    ignored = type_ in ignore_types
+                    if ignored and type_ not in lexer_callbacks:
+                        feed(value, type_ in newline_types)
+                        continue
+
+                    t = new_token(type_, value, pos, line_ctr.line, line_ctr.column)
+                    feed(value, type_ in newline_types)
+                    t.end_line = line_ctr.line
+                    t.end_column = line_ctr.column
+                    t.end_pos = line_ctr.char_pos
+                    if type_ in lexer_callbacks:
+                        t = lexer_callbacks[type_](t)
+                    if ignored:
+                        continue
+                    if not isinstance(t, Token):
+                        raise LexError("Callbacks must return a token (returned %r)" % t)
+                    lexer_state.last_token = t
+
+                token = t
+                term = symbol_ids.get(token.type, -1)
+                if not 0 <= term < n_terminals:
+                    state.feed_token(token)     # Raises UnexpectedToken
+                    raise AssertionError("feed_token() didn't raise")
+
+            action = action_rows[state_stack[-1]][term]
+            if action < 0:
+                action = default_actions[state_stack[-1]]
+                if action < 0 or cast(Token, token).type not in states[state_stack[-1]]:
+                    state.feed_token(cast(Token, token))     # Raises UnexpectedToken
+                    raise AssertionError("feed_token() didn't raise")
+
+            if not action & 1:
+                arg = action >> 1
+                assert arg != end_state
+                state_stack.append(arg)
+                callback = token_callbacks[term]
+                value_stack.append(token if callback is None else callback(token))
+                term = -1
+                continue
+
+            # Reduce
+            arg = action >> 1
+            size = rule_sizes[arg]
+            if size:
+                s = value_stack[-size:]
+                del state_stack[-size:]
+                del value_stack[-size:]
+            else:
+                s = []
+
+            callback = rule_callbacks[arg]
+            value = callback(s) if callback is not None else s
+
+            state_stack.append(goto_rows[state_stack[-1]][rule_origins[arg]])
+            value_stack.append(value)
+
+        end_token = Token.new_borrow_pos('$END', '', token) if token else Token('$END', '', 0, 1, 1)
+        return state.feed_token(end_token, True)
+
+
+def _can_fuse(state: ParserState) -> bool:
+    "Can _parse_fused() handle this parser state and its lexer?"
+    # Subclasses, such as the lexers of plugins, might change how tokens are lexed.
+    lexer_thread = state.lexer
+    return (type(lexer_thread) is LexerThread and lexer_thread.state is not None
+            and type(lexer_thread.lexer) in (ContextualLexer, BasicLexer)
+            and state.parse_conf.int_table is not None)
+
 ###}
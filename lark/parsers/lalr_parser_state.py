@@ -1,23 +1,125 @@
 from copy import deepcopy, copy
-from typing import Dict, Any, Generic, List
+from functools import partial
+from typing import Dict, Any, Callable, Generic, List, Optional, Set, Union, cast
 from ..lexer import Token, LexerThread
 from ..common import ParserCallbacks
+from ..tree import Tree
 
-from .lalr_analysis import Shift, ParseTableBase, StateT
+from .lalr_analysis import Shift, ParseTableBase, ParseTable, IntParseTable, StateT
 from lark.exceptions import UnexpectedToken
 
 ###{standalone
 
+class PersistentStack:
+    """A stack that is copied in constant time, by sharing its items with the copy.
+
+    Each item is an immutable link to the one below it, so stacks that were copied from each other
+    share everything below the point where they diverged. It implements the list operations that
+    the parser uses: ``len()``, indexing, ``append()``, and getting or deleting a slice at the top
+    (``stack[-n:]``).
+
+    The values themselves aren't copied. The parse-tree builder extends the children of some trees
+    in-place (e.g. for left-recursive rules), so each item remembers how many children its tree had,
+    and a tree that was since extended by another copy is read as a copy of it, with its original children.
+    Callbacks of a transformer must not change their arguments.
+    """
+    __slots__ = '_top', '_len'
+
+    def __init__(self, items=()):
+        # Each link is (value, n_children, below). n_children is -1 when the value isn't a tree.
+        self._top = None
+        self._len = 0
+        for item in items:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def append(self, value) -> None:
+        self._top = (value, len(value.children) if isinstance(value, Tree) else -1, self._top)
+        self._len += 1
+
+    def copy(self) -> 'PersistentStack':
+        new_stack = PersistentStack()
+        new_stack._top = self._top
+        new_stack._len = self._len
+        return new_stack
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return PersistentStack(deepcopy(list(self), memo))
+
+    def __reduce__(self):
+        return PersistentStack, (list(self),)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.stop is None and index.step is None:
+                start = index.indices(self._len)[0]
+                return self._values(self._len - start)
+            return list(self)[index]
+
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("stack index out of range")
+        link = self._top
+        for _ in range(self._len - 1 - index):
+            link = link[2]
+        return _link_value(link)
+
+    def __delitem__(self, index):
+        if not (isinstance(index, slice) and index.stop is None and index.step is None):
+            raise TypeError("Can only delete from the top of a PersistentStack (i.e. del stack[-n:])")
+        start = index.indices(self._len)[0]
+        link = self._top
+        for _ in range(self._len - start):
+            link = link[2]
+        self._top = link
+        self._len = start
+
+    def _values(self, n: int) -> list:
+        "Returns the top n values, bottom first"
+        values = []
+        link = self._top
+        for _ in range(n):
+            values.append(_link_value(link))
+            link = link[2]
+        values.reverse()
+        return values
+
+    def __iter__(self):
+        return iter(self._values(self._len))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (PersistentStack, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return 'PersistentStack(%r)' % list(self)
+
+
+def _link_value(link):
+    value, n_children, _below = link
+    if n_children >= 0 and len(value.children) != n_children:
+        # Extended in-place since it was pushed
+        return type(value)(value.data, value.children[:n_children], value._meta)
+    return value
+
+
 class ParseConf(Generic[StateT]):
-    __slots__ = 'parse_table', 'callbacks', 'start', 'start_state', 'end_state', 'states'
+    __slots__ = ('parse_table', '_callbacks', 'start', 'start_state', 'end_state', 'states',
+                 'int_table', '_rule_callbacks', '_token_callbacks')
 
     parse_table: ParseTableBase[StateT]
-    callbacks: ParserCallbacks
     start: str
 
     start_state: StateT
     end_state: StateT
     states: Dict[StateT, Dict[str, tuple]]
+    int_table: Optional[IntParseTable]
 
     def __init__(self, parse_table: ParseTableBase[StateT], callbacks: ParserCallbacks, start: str):
         self.parse_table = parse_table
@@ -26,22 +128,53 @@ class ParseConf(Generic[StateT]):
         self.end_state = self.parse_table.end_states[start]
         self.states = self.parse_table.states
 
+        # The integer table is only available for IntParseTable. Otherwise, we use the states dict.
+        self.int_table = parse_table if isinstance(parse_table, IntParseTable) else None
+
         self.callbacks = callbacks
         self.start = start
 
+    @property
+    def callbacks(self) -> ParserCallbacks:
+        return self._callbacks
+
+    @callbacks.setter
+    def callbacks(self, callbacks: ParserCallbacks) -> None:
+        self._callbacks = callbacks
+        self._rule_callbacks: Optional[list] = None
+        self._token_callbacks: Optional[list] = None
+
+    @property
+    def rule_callbacks(self) -> list:
+        "The callback of each rule in ``int_table.rules``, or None when there are no callbacks"
+        if self._rule_callbacks is None:
+            assert self.int_table is not None
+            callbacks: Dict[Any, Callable] = self._callbacks    # The rule callbacks are keyed by Rule
+            self._rule_callbacks = [callbacks[rule] if callbacks else None for rule in self.int_table.rules]
+        return self._rule_callbacks
+
+    @property
+    def token_callbacks(self) -> list:
+        "The callback of each terminal of ``int_table``, by its symbol id, or None"
+        if self._token_callbacks is None:
+            assert self.int_table is not None
+            callbacks = self._callbacks
+            self._token_callbacks = [callbacks.get(name) for name in self.int_table.symbols[:self.int_table.n_terminals]]
+        return self._token_callbacks
+
 class ParserState(Generic[StateT]):
     __slots__ = 'parse_conf', 'lexer', 'state_stack', 'value_stack'
 
     parse_conf: ParseConf[StateT]
     lexer: LexerThread
-    state_stack: List[StateT]
-    value_stack: list
+    state_stack: 'Union[List[StateT], PersistentStack]'
+    value_stack: 'Union[list, PersistentStack]'
 
     def __init__(self, parse_conf: ParseConf[StateT], lexer: LexerThread, state_stack=None, value_stack=None):
         self.parse_conf = parse_conf
         self.lexer = lexer
         self.state_stack = state_stack or [self.parse_conf.start_state]
-        self.value_stack = value_stack or []
+        self.value_stack = value_stack if value_stack is not None else []
 
     @property
     def position(self) -> StateT:
@@ -57,6 +190,10 @@ class ParserState(Generic[StateT]):
         return self.copy()
 
     def copy(self, deepcopy_values=True) -> 'ParserState[StateT]':
+        if isinstance(self.value_stack, PersistentStack):
+            # Constant time. The values are shared, so deepcopy_values doesn't apply (see PersistentStack)
+            return type(self)(self.parse_conf, self.lexer, self.state_stack.copy(), self.value_stack.copy())
+
         return type(self)(
             self.parse_conf,
             self.lexer, # XXX copy
@@ -64,7 +201,205 @@ class ParserState(Generic[StateT]):
             deepcopy(self.value_stack) if deepcopy_values else copy(self.value_stack),
         )
 
+    def accepts_token_type(self, token_type: str, reductions: Optional[list]=None) -> bool:
+        """Returns whether feeding a token of this type would succeed, i.e. whether it's shifted
+        after the reductions it causes (or, for '$END', whether they complete the parse).
+
+        Runs the reductions on the states alone, without changing the stacks or calling any callbacks.
+        If ``reductions`` is given, the rules of these reductions are appended to it, in order.
+        """
+        parse_conf = self.parse_conf
+        state_stack = self.state_stack
+        end_state = parse_conf.end_state
+        is_end = token_type == '$END'
+        popped = 0      # Number of states removed from the top of state_stack
+        pushed: list = []     # States pushed on top of what remains of it
+
+        parse_table = parse_conf.int_table
+        if parse_table is None:
+            states = parse_conf.states
+            while True:
+                state = pushed[-1] if pushed else state_stack[-1 - popped]
+                try:
+                    action, arg = states[state][token_type]
+                except KeyError:
+                    return False
+                if action is Shift:
+                    return True
+
+                if reductions is not None:
+                    reductions.append(arg)
+                size = len(arg.expansion)
+                origin = arg.origin.name
+                if size > len(pushed):
+                    popped += size - len(pushed)
+                    pushed = []
+                elif size:
+                    del pushed[-size:]
+                top = pushed[-1] if pushed else state_stack[-1 - popped]
+                pushed.append(states[top][origin][1])
+                if is_end and pushed[-1] == end_state:
+                    return True
+
+        int_stack = cast(List[int], state_stack)
+        term = parse_table.symbol_ids.get(token_type)
+        if term is None or term >= parse_table.n_terminals:
+            return False
+        action_rows = parse_table.action_rows
+        default_actions = parse_table.default_actions
+        int_states = parse_table.states
+        goto_rows = parse_table.goto_rows
+        rule_sizes = parse_table.rule_sizes
+        rule_origins = parse_table.rule_origins
+
+        while True:
+            state = pushed[-1] if pushed else int_stack[-1 - popped]
+            action = action_rows[state][term]
+            if action < 0:
+                action = default_actions[state]
+                if action < 0 or token_type not in int_states[state]:
+                    return False
+            arg = action >> 1
+            if not action & 1:
+                return True
+
+            if reductions is not None:
+                reductions.append(parse_table.rules[arg])
+            size = rule_sizes[arg]
+            if size > len(pushed):
+                popped += size - len(pushed)
+                pushed = []
+            elif size:
+                del pushed[-size:]
+            top = pushed[-1] if pushed else int_stack[-1 - popped]
+            pushed.append(goto_rows[top][rule_origins[arg]])
+            if is_end and pushed[-1] == end_state:
+                return True
+
+    @property
+    def lexer_position(self) -> StateT:
+        """The state in which the contextual lexer lexes the next token.
+
+        When the current state reduces regardless of the next token (see ``IntParseTable.consistent_reductions``),
+        it's the state that these reductions lead to, i.e. the one that will shift the token. The reductions
+        themselves only happen when the token is fed, so errors are still reported in the current state.
+        """
+        parse_conf = self.parse_conf
+        parse_table = parse_conf.int_table
+        state_stack = self.state_stack
+        popped = 0      # Number of states removed from the top of state_stack
+        pushed: list = []     # States pushed on top of what remains of it
+
+        if parse_table is None:
+            states_table: Any = parse_conf.parse_table
+            if not isinstance(states_table, ParseTable):
+                return state_stack[-1]
+            consistent: Dict[Any, Any] = states_table.consistent_reductions
+            states = parse_conf.states
+            state = state_stack[-1]
+            while state in consistent:
+                rule = consistent[state]
+                size = len(rule.expansion)
+                if size > len(pushed):
+                    popped += size - len(pushed)
+                    pushed = []
+                elif size:
+                    del pushed[-size:]
+                top = pushed[-1] if pushed else state_stack[-1 - popped]
+                state = states[top][rule.origin.name][1]
+                pushed.append(state)
+            return state
+
+        consistent_reductions = parse_table.consistent_reductions
+        int_stack = cast(List[int], state_stack)
+        int_state = int_stack[-1]
+        action = consistent_reductions[int_state]
+        while action >= 0:
+            arg = action >> 1
+            size = parse_table.rule_sizes[arg]
+            if size > len(pushed):
+                popped += size - len(pushed)
+                pushed = []
+            elif size:
+                del pushed[-size:]
+            top = pushed[-1] if pushed else int_stack[-1 - popped]
+            int_state = parse_table.goto_rows[top][parse_table.rule_origins[arg]]
+            pushed.append(int_state)
+            action = consistent_reductions[int_state]
+        return cast(StateT, int_state)
+
+    def try_feed_token(self, token: Token, is_end=False) -> bool:
+        """Like ``feed_token()``, but returns False instead of raising ``UnexpectedToken``
+        when the token can't be fed, leaving the state unchanged. Otherwise, feeds it and returns True.
+
+        After feeding '$END' with is_end=True, the result of the parse is ``value_stack[-1]``.
+        """
+        if not self.accepts_token_type(token.type):
+            return False
+        self.feed_token(token, is_end)
+        return True
+
     def feed_token(self, token: Token, is_end=False) -> Any:
+        parse_conf = self.parse_conf
+        parse_table = parse_conf.int_table
+        if parse_table is None:
+            return self._feed_token_states(token, is_end)
+
+        state_stack = cast(List[int], self.state_stack)
+        value_stack = self.value_stack
+        end_state = parse_conf.end_state
+        action_rows = parse_table.action_rows
+        default_actions = parse_table.default_actions
+        states = parse_table.states
+        goto_rows = parse_table.goto_rows
+        rule_sizes = parse_table.rule_sizes
+        rule_origins = parse_table.rule_origins
+        rule_callbacks = parse_conf.rule_callbacks
+
+        term = parse_table.symbol_ids.get(token.type)
+        if term is None or term >= parse_table.n_terminals:
+            raise UnexpectedToken(token, partial(_expected_terminals, parse_table, state_stack[-1]), state=self, interactive_parser=None)
+
+        while True:
+            state = state_stack[-1]
+            action = action_rows[state][term]
+            if action < 0:
+                # Only take the default reduce if the full table would, so that the error is raised
+                # in the state where the token isn't expected, which the reductions might hide.
+                action = default_actions[state]
+                if action < 0 or token.type not in states[state]:
+                    raise UnexpectedToken(token, partial(_expected_terminals, parse_table, state), state=self, interactive_parser=None)
+
+            arg = action >> 1
+            if not action & 1:
+                # shift once and return
+                assert not is_end
+                assert arg != end_state
+                state_stack.append(arg)
+                callback = parse_conf.token_callbacks[term]
+                value_stack.append(token if callback is None else callback(token))
+                return
+            else:
+                # reduce+shift as many times as necessary
+                size = rule_sizes[arg]
+                if size:
+                    s = value_stack[-size:]
+                    del state_stack[-size:]
+                    del value_stack[-size:]
+                else:
+                    s = []
+
+                callback = rule_callbacks[arg]
+                value = callback(s) if callback is not None else s
+
+                state_stack.append(goto_rows[state_stack[-1]][rule_origins[arg]])
+                value_stack.append(value)
+
+                if is_end and state_stack[-1] == end_state:
+                    return value_stack[-1]
+
+    def _feed_token_states(self, token: Token, is_end=False) -> Any:
+        # Like feed_token(), for parse tables that don't have the dense rows (i.e. ParseTable, when debugging)
         state_stack = self.state_stack
         value_stack = self.value_stack
         states = self.parse_conf.states
@@ -76,8 +411,7 @@ class ParserState(Generic[StateT]):
             try:
                 action, arg = states[state][token.type]
             except KeyError:
-                expected = {s for s in states[state].keys() if s.isupper()}
-                raise UnexpectedToken(token, expected, state=self, interactive_parser=None)
+                raise UnexpectedToken(token, partial(_expected_in_states, states, state), state=self, interactive_parser=None)
 
             assert arg != end_state
 
@@ -107,4 +441,12 @@ class ParserState(Generic[StateT]):
 
                 if is_end and state_stack[-1] == end_state:
                     return value_stack[-1]
+
+
+# The expected terminals of a failed state, for UnexpectedToken to compute when they're used
+def _expected_terminals(parse_table, state) -> Set[str]:
+    return set(parse_table.expected(state))
+
+def _expected_in_states(states, state) -> Set[str]:
+    return {s for s in states[state].keys() if s.isupper()}
 ###}
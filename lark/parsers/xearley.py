@@ -14,13 +14,15 @@ uses regular expressions by necessity, achieving high-performance while maintain
 Earley's power in parsing any CFG.
 """
 
-from typing import TYPE_CHECKING, Callable, Optional, List, Any
+from typing import TYPE_CHECKING, Callable, Optional, List, Any, FrozenSet
 from collections import defaultdict
+import re
 
 from ..tree import Tree
 from ..exceptions import UnexpectedCharacters
 from ..lexer import Token
 from ..grammar import Terminal
+from ..utils import get_regexp_first_chars
 from .earley import Parser as BaseParser
 from .earley_common import Item
 from .earley_forest import TokenNode
@@ -37,6 +39,15 @@ class Parser(BaseParser):
         self.ignore = [Terminal(t) for t in lexer_conf.ignore]
         self.complete_lex = complete_lex
 
+        # For each ascii character, the terminals that can't match when the text continues with it.
+        # (The first characters are computed with sre_parse, which doesn't know the syntax of the regex module)
+        self._cant_start: Optional[List[FrozenSet[str]]] = None
+        if lexer_conf.re_module is re:
+            first_chars = {t.name: get_regexp_first_chars(t.pattern.to_regexp(), lexer_conf.g_regex_flags)
+                           for t in lexer_conf.terminals}
+            self._cant_start = [frozenset(name for name, chars in first_chars.items() if c not in chars)
+                                for c in range(128)]
+
     def _parse(self, stream, columns, to_scan, start_symbol=None):
 
         def scan(i, to_scan):
@@ -50,25 +61,38 @@ class Parser(BaseParser):
 
             node_cache = {}
 
+            c = stream[i]
+            if not isinstance(c, int):
+                c = ord(c)
+            cant_start = self._cant_start[c] if self._cant_start is not None and c < 128 else ()
+
             # 1) Loop the expectations and ask the lexer to match.
             # Since regexp is forward looking on the input stream, and we only
             # want to process tokens when we hit the point in the stream at which
             # they complete, we push all tokens into a buffer (delayed_matches), to
             # be held possibly for a later parse step when we reach the point in the
             # input stream at which they complete.
-            for item in self.Set(to_scan):
-                m = match(item.expect, stream, i)
-                if m:
-                    t = Token(item.expect.name, m.group(0), i, text_line, text_column)
-                    delayed_matches[m.end()].append( (item, i, t) )
+            # Each terminal is matched only once, and its tokens are shared by all the items that expect it.
+            matches = {}
+            for item in to_scan:
+                name = item.expect.name
+                if name in matches:
+                    terminal_matches = matches[name]
+                else:
+                    terminal_matches = matches[name] = []
+                    m = match(item.expect, stream, i) if name not in cant_start else None
+                    if m:
+                        terminal_matches.append((m.end(), Token(name, m.group(0), i, text_line, text_column)))
+
+                        if self.complete_lex:
+                            s = m.group(0)
+                            for j in range(1, len(s)):
+                                m = match(item.expect, s[:-j])
+                                if m:
+                                    terminal_matches.append((i + m.end(), Token(name, m.group(0), i, text_line, text_column)))
 
-                    if self.complete_lex:
-                        s = m.group(0)
-                        for j in range(1, len(s)):
-                            m = match(item.expect, s[:-j])
-                            if m:
-                                t = Token(item.expect.name, m.group(0), i, text_line, text_column)
-                                delayed_matches[i+m.end()].append( (item, i, t) )
+                for end, t in terminal_matches:
+                    delayed_matches[end].append( (item, i, t) )
 
                     # XXX The following 3 lines were commented out for causing a bug. See issue #768
                     # # Remove any items that successfully matched in this pass from the to_scan buffer.
@@ -80,6 +104,8 @@ class Parser(BaseParser):
             # the ignore. This should allow us to use ignored symbols in non-terminals to implement
             # e.g. mandatory spacing.
             for x in self.ignore:
+                if x.name in cant_start:
+                    continue
                 m = match(x, stream, i)
                 if m:
                     # Carry over any items still in the scan buffer, to past the end of the ignored items.
@@ -144,9 +170,13 @@ class Parser(BaseParser):
 
         # Cache for nodes & tokens created in a particular parse step.
         transitives = [{}]
+        # The items of each finished column, by the symbol they expect (for the completer)
+        expecting = []
 
         text_line = 1
         text_column = 1
+        newline = '\n' if isinstance(stream, str) else ord('\n')
+        utf8 = self.lexer_conf.use_bytes == 'utf8'
 
         ## The main Earley loop.
         # Run the Prediction/Completion cycle for any Items in the current Earley set.
@@ -156,18 +186,18 @@ class Parser(BaseParser):
         i = 0
         node_cache = {}
         for token in stream:
-            self.predict_and_complete(i, to_scan, columns, transitives, node_cache)
+            self.predict_and_complete(i, to_scan, columns, transitives, node_cache, expecting, start_symbol)
 
             to_scan, node_cache = scan(i, to_scan)
 
-            if token == '\n':
+            if token == newline:
                 text_line += 1
                 text_column = 1
-            else:
+            elif not (utf8 and b'\x80' <= stream[i+1:i+2] < b'\xc0'):    # A UTF-8 continuation byte is in the same column
                 text_column += 1
             i += 1
 
-        self.predict_and_complete(i, to_scan, columns, transitives, node_cache)
+        self.predict_and_complete(i, to_scan, columns, transitives, node_cache, expecting, start_symbol)
 
         ## Column is now the final column in the parse.
         assert i == len(columns)-1
@@ -30,7 +30,7 @@ from types import ModuleType
 from typing import (
     TypeVar, Generic, Type, Tuple, List, Dict, Iterator, Collection, Callable, Optional, FrozenSet, Any,
     Union, Iterable, IO, TYPE_CHECKING, overload, Sequence,
-    Pattern as REPattern, ClassVar, Set, Mapping
+    Pattern as REPattern, ClassVar, Set, Mapping, NamedTuple, NoReturn, cast
 )
 ###}
 
@@ -67,6 +67,7 @@ EXTRACT_STANDALONE_FILES = [
     'parsers/lalr_parser_state.py',
     'parsers/lalr_parser.py',
     'parsers/lalr_interactive_parser.py',
+    'parsers/lalr_incremental.py',
     'parser_frontends.py',
     'lark.py',
     'indenter.py',
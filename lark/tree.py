@@ -15,6 +15,18 @@ if TYPE_CHECKING:
 
 ###{standalone
 
+# Maps each lazy line/column attribute of Meta to the offset it's computed from
+_LAZY_META_POSITIONS = {
+    'line': ('start_pos', 'line', 'column'),
+    'column': ('start_pos', 'line', 'column'),
+    'end_line': ('end_pos', 'end_line', 'end_column'),
+    'end_column': ('end_pos', 'end_line', 'end_column'),
+    'container_line': ('container_start_pos', 'container_line', 'container_column'),
+    'container_column': ('container_start_pos', 'container_line', 'container_column'),
+    'container_end_line': ('container_end_pos', 'container_end_line', 'container_end_column'),
+    'container_end_column': ('container_end_pos', 'container_end_line', 'container_end_column'),
+}
+
 class Meta:
 
     empty: bool
@@ -30,6 +42,30 @@ class Meta:
     def __init__(self):
         self.empty = True
 
+    def __getattr__(self, name):
+        # With positions='offsets', only the offsets are propagated into the meta.
+        # The line & column are computed on first access, using the newline index of the tokens.
+        try:
+            pos_name, line_name, column_name = _LAZY_META_POSITIONS[name]
+            newline_index = self.__dict__['_newline_index']
+            pos = self.__dict__[pos_name]
+        except KeyError:
+            raise AttributeError(name) from None
+        line, column = newline_index.line_col(pos)
+        setattr(self, line_name, line)
+        setattr(self, column_name, column)
+        return line if name == line_name else column
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if '_newline_index' in state:
+            # Don't pickle the text along with the meta; resolve the positions instead
+            for name in _LAZY_META_POSITIONS:
+                if name not in state and _LAZY_META_POSITIONS[name][0] in state:
+                    state[name] = getattr(self, name)
+            del state['_newline_index']
+        return state
+
 
 _Leaf_T = TypeVar("_Leaf_T")
 Branch = Union[_Leaf_T, 'Tree[_Leaf_T]']
@@ -2,10 +2,13 @@ import unicodedata
 import os
 from itertools import product
 from collections import deque
-from typing import Callable, Iterator, List, Optional, Tuple, Type, TypeVar, Union, Dict, Any, Sequence, Iterable, AbstractSet
+from types import ModuleType
+from typing import Callable, Iterator, List, Optional, Tuple, Type, TypeVar, Union, Dict, Any, Sequence, Iterable, AbstractSet, Set, FrozenSet
 
 ###{standalone
 import sys, re
+from array import array
+from bisect import bisect_right
 import logging
 from dataclasses import dataclass
 from typing import Generic, AnyStr
@@ -161,6 +164,450 @@ def get_regexp_width(expr: str) -> Union[Tuple[int, int], List[int]]:
                 return 0, int(MAXWIDTH)
 
 
+def _iter_sre_subpatterns(av):
+    if isinstance(av, sre_parse.SubPattern):
+        yield av
+    elif isinstance(av, (list, tuple)):
+        for x in av:
+            yield from _iter_sre_subpatterns(x)
+
+def get_regexp_opcodes(expr: str) -> Set[str]:
+    """Returns the names of the sre opcodes used anywhere in the regexp, e.g. 'MIN_REPEAT' or 'ASSERT'.
+
+    The items of character sets are included (e.g. 'CATEGORY' for ``\\w``), and 'IGNORECASE'
+    stands for a case-insensitive part, whether the flag is global or scoped.
+
+    Raises ValueError if the regexp cannot be parsed by sre_parse.
+    """
+    try:
+        parsed = sre_parse.parse(expr)
+    except sre_constants.error:
+        raise ValueError(expr)
+
+    opcodes = set()
+    if parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        opcodes.add('IGNORECASE')
+    to_visit: List[Any] = [parsed]
+    while to_visit:
+        for op, av in to_visit.pop().data:
+            opcodes.add(op.name)
+            if op.name == 'IN':
+                opcodes.update(item_op.name for item_op, _ in av)
+            elif op.name == 'SUBPATTERN' and av[1] & sre_constants.SRE_FLAG_IGNORECASE:
+                opcodes.add('IGNORECASE')
+            to_visit += _iter_sre_subpatterns(av)
+    return opcodes
+
+
+_ALL_ASCII = frozenset(range(128))
+_ASCII_LETTERS = frozenset(range(ord('A'), ord('Z') + 1)) | frozenset(range(ord('a'), ord('z') + 1))
+_NON_ASCII = 128    # Stands for any non-ascii character, while computing the first characters
+
+_CATEGORY_REGEXPS = {
+    'CATEGORY_DIGIT': r'\d', 'CATEGORY_NOT_DIGIT': r'\D',
+    'CATEGORY_SPACE': r'\s', 'CATEGORY_NOT_SPACE': r'\S',
+    'CATEGORY_WORD': r'\w', 'CATEGORY_NOT_WORD': r'\W',
+}
+_category_first_chars: Dict[str, FrozenSet[int]] = {}
+_first_chars_cache: Dict[Tuple[str, int], FrozenSet[int]] = {}
+
+def _sre_category_chars(category) -> FrozenSet[int]:
+    try:
+        return _category_first_chars[category.name]
+    except KeyError:
+        pass
+    regexp = _CATEGORY_REGEXPS.get(category.name)
+    if regexp is None:
+        chars = _ALL_ASCII | {_NON_ASCII}
+    else:
+        chars = frozenset(c for c in range(128) if re.match(regexp, chr(c))) | {_NON_ASCII}
+    _category_first_chars[category.name] = chars
+    return chars
+
+def _sre_charset_chars(items) -> Set[int]:
+    chars: Set[int] = set()
+    for op, av in items:
+        name = op.name
+        if name == 'LITERAL':
+            chars.add(min(av, _NON_ASCII))
+        elif name == 'RANGE':
+            low, high = av
+            chars.update(range(min(low, _NON_ASCII), min(high, _NON_ASCII) + 1))
+        elif name == 'CATEGORY':
+            chars |= _sre_category_chars(av)
+        else:   # NEGATE, or unknown
+            return set(_ALL_ASCII) | {_NON_ASCII}
+    return chars
+
+def _sre_add_case_variants(chars: Set[int]) -> Set[int]:
+    res = set(chars)
+    for c in chars:
+        if c in _ASCII_LETTERS:
+            res.add(c ^ 0x20)
+        elif c == _NON_ASCII:
+            # Some non-ascii characters fold into ascii letters (e.g. the Kelvin sign into "k")
+            res |= _ASCII_LETTERS
+    return res
+
+def _sre_first_chars(items, ignorecase: bool) -> Tuple[Set[int], bool]:
+    "Returns the first characters of a sequence of sre items, and whether the sequence can match the empty string"
+    first: Set[int] = set()
+    for op, av in items:
+        name = op.name
+        nullable = False
+        if name == 'LITERAL':
+            chars = {min(av, _NON_ASCII)}
+        elif name == 'IN':
+            chars = _sre_charset_chars(av)
+        elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            min_repeat, _max_repeat, sub = av
+            chars, nullable = _sre_first_chars(sub, ignorecase)
+            nullable = nullable or min_repeat == 0
+        elif name == 'SUBPATTERN':
+            _group, add_flags, del_flags, sub = av
+            sub_ignorecase = (ignorecase or bool(add_flags & sre_constants.SRE_FLAG_IGNORECASE)) \
+                and not del_flags & sre_constants.SRE_FLAG_IGNORECASE
+            chars, nullable = _sre_first_chars(sub, sub_ignorecase)
+        elif name == 'ATOMIC_GROUP':
+            chars, nullable = _sre_first_chars(av, ignorecase)
+        elif name == 'BRANCH':
+            chars = set()
+            for sub in av[1]:
+                sub_chars, sub_nullable = _sre_first_chars(sub, ignorecase)
+                chars |= sub_chars
+                nullable = nullable or sub_nullable
+        elif name in ('AT', 'ASSERT', 'ASSERT_NOT'):
+            # Zero-width; the first character comes from what follows
+            chars = set()
+            nullable = True
+        elif name in ('ANY', 'NOT_LITERAL'):
+            chars = set(_ALL_ASCII) | {_NON_ASCII}
+        else:
+            # Backreferences, and anything else we don't know about
+            return set(_ALL_ASCII) | {_NON_ASCII}, True
+
+        first |= _sre_add_case_variants(chars) if ignorecase else chars
+        if not nullable:
+            return first, False
+    return first, True
+
+def get_regexp_first_chars(expr: str, flags: int = 0) -> FrozenSet[int]:
+    """Returns the ascii codes of the characters that a match of the regexp may begin with.
+
+    Only ascii characters are tracked. The result may contain too many characters
+    (e.g. when the regexp can't be parsed by sre_parse), but never too few.
+    """
+    try:
+        return _first_chars_cache[expr, flags]
+    except KeyError:
+        pass
+
+    try:
+        parsed = sre_parse.parse(expr, flags)
+    except sre_constants.error:
+        res = _ALL_ASCII
+    else:
+        first, nullable = _sre_first_chars(parsed, bool(parsed.state.flags & sre_constants.SRE_FLAG_IGNORECASE))
+        res = _ALL_ASCII if nullable else frozenset(c for c in first if c != _NON_ASCII)
+    _first_chars_cache[expr, flags] = res
+    return res
+
+
+_MAX_UNICODE = 0x10FFFF
+_SURROGATES = (0xD800, 0xDFFF)
+_UTF8_CONTINUATION_BYTES = bytes(range(0x80, 0xc0))
+_UTF32_NATIVE = 'utf-32-le' if sys.byteorder == 'little' else 'utf-32-be'
+_unicode_property_pattern = re.compile(r'\\[pP](?:\{[^}]*\}|[A-Za-z])')
+
+_Ranges = List[Tuple[int, int]]
+_unicode_ranges_cache: Dict[Tuple[str, int, str], _Ranges] = {}
+_case_classes: Dict[int, Tuple[int, ...]] = {}
+_utf8_regexp_cache: Dict[Tuple[str, int, str], str] = {}
+
+def utf8_len(text, start: int, end: int) -> int:
+    "Returns the number of code points in text[start:end], where text is encoded in UTF-8"
+    s = bytes(text[start:end])
+    if s.isascii():
+        return len(s)
+    return len(s.translate(None, _UTF8_CONTINUATION_BYTES))
+
+def _normalize_ranges(ranges: Iterable[Tuple[int, int]]) -> _Ranges:
+    res: _Ranges = []
+    for low, high in sorted(ranges):
+        if res and low <= res[-1][1] + 1:
+            if high > res[-1][1]:
+                res[-1] = res[-1][0], high
+        else:
+            res.append((low, high))
+    return res
+
+def _complement_ranges(ranges: _Ranges) -> _Ranges:
+    res = []
+    pos = 0
+    for low, high in ranges:
+        if low > pos:
+            res.append((pos, low - 1))
+        pos = high + 1
+    if pos <= _MAX_UNICODE:
+        res.append((pos, _MAX_UNICODE))
+    return res
+
+def _unicode_ranges(regexp: str, flags: int, re_module: ModuleType) -> _Ranges:
+    "Returns the ranges of the code points matched by a regexp of a single character (e.g. \\w, or \\p{Lu} with regex)"
+    key = regexp, flags, re_module.__name__
+    try:
+        return _unicode_ranges_cache[key]
+    except KeyError:
+        pass
+    all_chars = array('I', range(_MAX_UNICODE + 1)).tobytes().decode(_UTF32_NATIVE, 'surrogatepass')
+    res = [(m.start(), m.end() - 1) for m in re_module.finditer('(?:%s)+' % regexp, all_chars, flags)]
+    _unicode_ranges_cache[key] = res
+    return res
+
+def _get_case_classes() -> Dict[int, Tuple[int, ...]]:
+    "Maps every cased code point to the code points that it matches when ignoring case"
+    if not _case_classes:
+        groups: Dict[str, Set[int]] = {}
+        for c in range(0x20000):    # Cased letters are all in the first two planes
+            ch = chr(c)
+            lower = ch.lower()
+            upper = ch.upper()
+            if lower == ch == upper or len(lower) != 1 or len(upper) != 1:
+                continue
+            key = upper.lower()
+            groups.setdefault(key if len(key) == 1 else lower, set()).update((c, ord(lower), ord(upper)))
+        for group in groups.values():
+            for c in group:
+                _case_classes[c] = tuple(group)
+    return _case_classes
+
+def _add_case_variants(ranges: _Ranges) -> _Ranges:
+    starts = [low for low, _high in ranges]
+    extra = []
+    for c, variants in _get_case_classes().items():
+        i = bisect_right(starts, c) - 1
+        if i >= 0 and c <= ranges[i][1]:
+            extra += [(v, v) for v in variants]
+    return _normalize_ranges(ranges + extra) if extra else ranges
+
+def _utf8_sequences(low: int, high: int) -> List[Tuple[Tuple[int, int], ...]]:
+    """Splits a range of code points into sequences of byte ranges, that together match
+    exactly the UTF-8 encodings of the code points in the range.
+    """
+    for boundary in (0x7f, 0x7ff, 0xffff):
+        if low <= boundary < high:
+            return _utf8_sequences(low, boundary) + _utf8_sequences(boundary + 1, high)
+    for i in (1, 2, 3):
+        mask = (1 << (6 * i)) - 1
+        if low & ~mask != high & ~mask:
+            if low & mask:
+                return _utf8_sequences(low, low | mask) + _utf8_sequences((low | mask) + 1, high)
+            if high & mask != mask:
+                return _utf8_sequences(low, (high & ~mask) - 1) + _utf8_sequences(high & ~mask, high)
+    return [tuple(zip(chr(low).encode('utf-8'), chr(high).encode('utf-8')))]
+
+def _byte_regexp(b: int) -> str:
+    return chr(b) if b < 128 and chr(b).isalnum() else '\\x%02x' % b
+
+def _byte_range_regexp(low: int, high: int) -> str:
+    if low == high:
+        return _byte_regexp(low)
+    return '[\\x%02x-\\x%02x]' % (low, high)
+
+def _sequences_regexps(sequences) -> List[str]:
+    # Merges the sequences that start with the same byte range, like a trie
+    by_first: Dict[Tuple[int, int], list] = {}
+    for seq in sequences:
+        by_first.setdefault(seq[0], []).append(seq[1:])
+    res = []
+    for first, rests in by_first.items():
+        head = _byte_range_regexp(*first)
+        if rests == [()]:
+            res.append(head)
+        else:
+            tails = _sequences_regexps(rests)
+            res.append(head + (tails[0] if len(tails) == 1 else '(?:%s)' % '|'.join(tails)))
+    return res
+
+def _ranges_regexp(ranges: _Ranges) -> str:
+    "Returns a bytes regexp (as latin-1) that matches the UTF-8 encoding of any code point in the ranges"
+    ascii_ranges = []
+    sequences: list = []
+    for low, high in ranges:
+        if low < 0x80:
+            ascii_ranges.append((low, min(high, 0x7f)))
+            low = 0x80
+        for low, high in ((low, min(high, _SURROGATES[0] - 1)), (max(low, _SURROGATES[1] + 1), high)):
+            if low <= high:
+                sequences += _utf8_sequences(low, high)
+
+    alternatives = []
+    if len(ascii_ranges) == 1 and ascii_ranges[0][0] == ascii_ranges[0][1]:
+        alternatives.append(_byte_regexp(ascii_ranges[0][0]))
+    elif ascii_ranges:
+        alternatives.append('[%s]' % ''.join('\\x%02x-\\x%02x' % r for r in ascii_ranges))
+    alternatives += _sequences_regexps(sequences)
+    if not alternatives:
+        return '(?!)'
+    return alternatives[0] if len(alternatives) == 1 else '(?:%s)' % '|'.join(alternatives)
+
+def _char_ranges(ranges: _Ranges, flags: int) -> _Ranges:
+    ranges = _normalize_ranges(ranges)
+    return _add_case_variants(ranges) if flags & sre_constants.SRE_FLAG_IGNORECASE else ranges
+
+def _charset_ranges(items, flags: int) -> _Ranges:
+    negate = False
+    ranges: _Ranges = []
+    for op, av in items:
+        name = op.name
+        if name == 'NEGATE':
+            negate = True
+        elif name == 'LITERAL':
+            ranges.append((av, av))
+        elif name == 'RANGE':
+            ranges.append(av)
+        elif name == 'CATEGORY':
+            ranges += _unicode_ranges(_CATEGORY_REGEXPS[av.name], flags & re.ASCII, re)
+        else:
+            raise ValueError("Unsupported item in character set: %s" % name)
+    ranges = _char_ranges(ranges, flags)
+    return _complement_ranges(ranges) if negate else ranges
+
+def _utf8_translate(items, flags: int, group_names: Dict[int, str]) -> str:
+    res = []
+    for op, av in items:
+        name = op.name
+        if name == 'LITERAL':
+            ranges = _char_ranges([(av, av)], flags)
+            if len(ranges) == 1 and ranges[0][0] == ranges[0][1]:
+                res.append(''.join(_byte_regexp(b) for b in chr(av).encode('utf-8')))
+            else:
+                res.append(_ranges_regexp(ranges))
+        elif name == 'NOT_LITERAL':
+            res.append(_ranges_regexp(_complement_ranges(_char_ranges([(av, av)], flags))))
+        elif name == 'ANY':
+            dotall = flags & sre_constants.SRE_FLAG_DOTALL
+            res.append(_ranges_regexp([(0, _MAX_UNICODE)] if dotall else [(0, 9), (11, _MAX_UNICODE)]))
+        elif name == 'IN':
+            res.append(_ranges_regexp(_charset_ranges(av, flags)))
+        elif name == 'BRANCH':
+            res.append('(?:%s)' % '|'.join(_utf8_translate(sub, flags, group_names) for sub in av[1]))
+        elif name == 'SUBPATTERN':
+            group, add_flags, del_flags, sub = av
+            inner = _utf8_translate(sub, (flags | add_flags) & ~del_flags, group_names)
+            if group is None:
+                res.append('(?:%s)' % inner)
+            elif group in group_names:
+                res.append('(?P<%s>%s)' % (group_names[group], inner))
+            else:
+                res.append('(%s)' % inner)
+        elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            low, high, sub = av
+            quantifier = '{%d,}' % low if high == sre_constants.MAXREPEAT else '{%d,%d}' % (low, high)
+            suffix = {'MIN_REPEAT': '?', 'POSSESSIVE_REPEAT': '+'}.get(name, '')
+            res.append('(?:%s)%s%s' % (_utf8_translate(sub, flags, group_names), quantifier, suffix))
+        elif name == 'ATOMIC_GROUP':
+            res.append('(?>%s)' % _utf8_translate(av, flags, group_names))
+        elif name in ('ASSERT', 'ASSERT_NOT'):
+            direction, sub = av
+            res.append('(?%s%s%s)' % ('<' if direction < 0 else '', '=' if name == 'ASSERT' else '!',
+                                      _utf8_translate(sub, flags, group_names)))
+        elif name == 'AT':
+            multiline = flags & sre_constants.SRE_FLAG_MULTILINE
+            res.append({
+                'AT_BEGINNING': '(?m:^)' if multiline else '\\A',
+                'AT_END': '(?m:$)' if multiline else '(?=\\n?\\Z)',
+                'AT_BEGINNING_STRING': '\\A',
+                'AT_END_STRING': '\\Z',
+                'AT_BOUNDARY': '\\b',
+                'AT_NON_BOUNDARY': '\\B',
+            }[av.name])
+        elif name == 'GROUPREF':
+            res.append('(?:\\%d)' % av)
+        elif name == 'GROUPREF_EXISTS':
+            group, yes, no = av
+            res.append('(?(%d)%s|%s)' % (group, _utf8_translate(yes, flags, group_names),
+                                         _utf8_translate(no, flags, group_names) if no else ''))
+        else:
+            raise ValueError("Unsupported regexp operation: %s" % name)
+    return ''.join(res)
+
+def _expand_unicode_properties(expr: str, re_module: ModuleType) -> str:
+    r"Replaces the unicode properties of the regex module (e.g. \p{Lu}) with the ranges of code points that they match"
+    res = []
+    in_set = False
+    i = 0
+    while i < len(expr):
+        c = expr[i]
+        if c == '\\':
+            m = _unicode_property_pattern.match(expr, i)
+            if m:
+                ranges = ''.join('\\U%08x' % low if low == high else '\\U%08x-\\U%08x' % (low, high)
+                                 for low, high in _unicode_ranges(m.group(), 0, re_module))
+                res.append(ranges if in_set else '[%s]' % ranges if ranges else '(?!)')
+                i = m.end()
+                continue
+            res.append(expr[i:i+2])
+            i += 2
+            continue
+        if c == '[' and not in_set:
+            in_set = True
+            # A closing bracket right at the start of the set is a literal
+            m = re.compile(r'\^?\]?').match(expr, i + 1)
+            assert m is not None
+            res.append(expr[i:m.end()])
+            i = m.end()
+            continue
+        if c == ']':
+            in_set = False
+        res.append(c)
+        i += 1
+    return ''.join(res)
+
+def utf8_regexp(expr: str, flags: int = 0, re_module: ModuleType = re) -> str:
+    r"""Translates a regexp over text, into an equivalent regexp over the UTF-8 encoding of the text.
+
+    The result is a str in which every character stands for a byte, so it should be encoded
+    as latin-1 before it's compiled. Character sets, including \w, \d, \s and the unicode
+    properties of the regex module (e.g. \p{Lu}), are expanded into the UTF-8 sequences of
+    their code points. Word boundaries (\b) only recognize ascii letters.
+
+    Raises ValueError if the regexp can't be translated.
+    """
+    key = expr, flags, re_module.__name__
+    try:
+        return _utf8_regexp_cache[key]
+    except KeyError:
+        pass
+    if re_module is not re:
+        expr = _expand_unicode_properties(expr, re_module)
+    try:
+        parsed = sre_parse.parse(expr, flags)
+    except sre_constants.error as e:
+        raise ValueError("Cannot translate regexp %r to UTF-8: %s" % (expr, e))
+    group_names = {group: name for name, group in parsed.state.groupdict.items()}
+    res = _utf8_translate(parsed, parsed.state.flags, group_names)
+    _utf8_regexp_cache[key] = res
+    return res
+
+
+def _count(text, sub, start: int, end: int) -> int:
+    "Like str.count(), but also for buffers that don't provide it (like mmap)"
+    if isinstance(text, (str, bytes, bytearray)):
+        return text.count(sub, start, end)
+    return sum(1 for _ in re.compile(re.escape(sub)).finditer(text, start, end))
+
+def _rfind(text, sub, start: int, end: int) -> int:
+    "Like str.rfind(), but also for buffers that don't provide it (like memoryview)"
+    try:
+        return text.rfind(sub, start, end)
+    except AttributeError:
+        pos = -1
+        for m in re.compile(re.escape(sub)).finditer(text, start, end):
+            pos = m.start()
+        return pos
+
+
 @dataclass(frozen=True)
 class TextSlice(Generic[AnyStr]):
     """A view of a string or bytes object, between the start and end indices.
@@ -170,13 +617,17 @@ class TextSlice(Generic[AnyStr]):
     Lark accepts instances of TextSlice as input (instead of a string),
     when the lexer is 'basic' or 'contextual'.
 
+    When ``use_bytes=True``, the text may also be any object that supports the buffer protocol,
+    such as ``mmap.mmap``, ``bytearray`` or ``memoryview``. That allows to parse a memory-mapped
+    file without reading it into memory first.
+
     Args:
-        text (str or bytes): The text to slice.
+        text (str, bytes or buffer): The text to slice.
         start (int): The start index. Negative indices are supported.
         end (int): The end index. Negative indices are supported.
 
     Raises:
-        TypeError: If `text` is not a `str` or `bytes`.
+        TypeError: If `text` is not a `str`, `bytes`, or a buffer.
         AssertionError: If `start` or `end` are out of bounds.
 
     Examples:
@@ -193,7 +644,11 @@ class TextSlice(Generic[AnyStr]):
 
     def __post_init__(self):
         if not isinstance(self.text, (str, bytes)):
-            raise TypeError("text must be str or bytes")
+            try:
+                with memoryview(self.text):
+                    pass
+            except TypeError:
+                raise TypeError("text must be str, bytes, or support the buffer protocol") from None
 
         if self.start < 0:
             object.__setattr__(self, 'start', self.start + len(self.text))
@@ -219,14 +674,53 @@ class TextSlice(Generic[AnyStr]):
         return self.end - self.start
 
     def count(self, substr: AnyStr):
-        return self.text.count(substr, self.start, self.end)
+        return _count(self.text, substr, self.start, self.end)
 
     def rindex(self, substr: AnyStr):
-        return self.text.rindex(substr, self.start, self.end)
+        pos = _rfind(self.text, substr, self.start, self.end)
+        if pos < 0:
+            raise ValueError("substring not found")
+        return pos
+
+
+class TextStream(Generic[AnyStr]):
+    """A text that is read incrementally, from a file object or from an iterable of chunks.
+
+    Lark accepts instances of TextStream as input (instead of a string), when the lexer is 'basic'
+    or 'contextual'. Only a rolling buffer of the text is kept in memory while it's being lexed,
+    but the positions of the tokens are still counted from the start of the stream.
+
+    Args:
+        source: A file object opened for reading (in text or binary mode),
+            or an iterable of strings (or of bytes).
+        chunk_size: The size of each read from a file object.
+
+    Example:
+        >>> with open('big.log') as f:
+        ...     tree = parser.parse(TextStream(f))
+    """
+    source: Any
+    chunk_size: int
+
+    def __init__(self, source: Any, chunk_size: int = 0x10000):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.source = source
+        self.chunk_size = chunk_size
+        self._chunks = None if hasattr(source, 'read') else iter(source)
+
+    def read(self) -> Optional[AnyStr]:
+        "Returns the next (non-empty) chunk of the text, or None when the stream is exhausted"
+        if self._chunks is None:
+            return self.source.read(self.chunk_size) or None
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return None
 
 
 TextOrSlice = Union[AnyStr, 'TextSlice[AnyStr]']
-LarkInput = Union[AnyStr, TextSlice[AnyStr], Any]
+LarkInput = Union[AnyStr, TextSlice[AnyStr], TextStream[AnyStr], Any]
 
 ###}
 
@@ -1,6 +1,23 @@
-from unittest import TestCase, main
+from unittest import TestCase, main, skipIf
+from unittest.mock import patch
 
-from lark import Lark, Tree, TextSlice
+import mmap
+import pickle
+import re
+import string
+import tempfile
+from copy import deepcopy
+from io import BytesIO, StringIO
+
+from lark import Lark, Tree, TextSlice, TextStream, UnexpectedCharacters, UnexpectedToken
+from lark.exceptions import ConfigurationError, LexError
+from lark.lexer import DFAScanner, OffsetToken, LazyToken, Token, TerminalDef, PatternRE
+from lark.utils import get_regexp_first_chars, utf8_regexp
+
+try:
+    import interegular
+except ImportError:
+    interegular = None
 
 
 class TestLexer(TestCase):
@@ -31,6 +48,494 @@ class TestLexer(TestCase):
         res = list(p.lex(TextSlice("aaaabc cba dddd", 3, -2)))
         assert res == list('abccbadd')
 
+    def test_tokenize_arrays(self):
+        p = Lark(r"""
+            start: (NAME | NUMBER | IF)*
+            IF: "if"
+            NAME: /[a-z]+/
+            NUMBER: /\d+/
+            COMMENT: /#[^\n]*/
+            %ignore /\s+/
+            %ignore COMMENT
+        """, parser='lalr', lexer_callbacks={'NUMBER': lambda t: t.update('INT')})
+
+        text = "if x 12 # hi\nfoo"
+        arrays = p.tokenize_arrays(text)
+        tokens = list(p.lex(text))
+        self.assertEqual(len(arrays), len(tokens))
+        self.assertEqual([arrays.type_names[i] for i in arrays.types], [t.type for t in tokens])
+        self.assertEqual(list(arrays.start_pos), [t.start_pos for t in tokens])
+        self.assertEqual(list(arrays.end_pos), [t.end_pos for t in tokens])
+        self.assertIn('INT', arrays.type_names)
+
+        arrays = p.tokenize_arrays(TextSlice(text, 3, 7), dont_ignore=True)
+        self.assertEqual([arrays.type_names[i] for i in arrays.types], ['NAME', '__IGNORE_0', 'INT'])
+
+    @skipIf(interegular is None, "interegular is required for lexer_engine='dfa'")
+    def test_dfa_engine(self):
+        grammar = r"""
+            start: (NAME | NUMBER | IF | OP)*
+            IF: "if"
+            OP: "==" | "=" | "+"
+            NAME: /[a-z_]\w*/
+            NUMBER: /\d+(\.\d+)?/
+            %ignore /\s+/
+        """
+        text = "if iffy == 12.5 +x = 3 é"
+        re_lexer = Lark(grammar, lexer='basic')
+        dfa_lexer = Lark(grammar, lexer='basic', lexer_engine='dfa')
+        self.assertIsInstance(dfa_lexer.parser.lexer.scanner, DFAScanner)
+
+        # Tokens must be the same, including positions, and the non-ascii fallback to `re`
+        expected = list(re_lexer.lex(text[:-2]))
+        res = list(dfa_lexer.lex(text[:-2]))
+        self.assertEqual(res, expected)
+        self.assertEqual([t.end_pos for t in res], [t.end_pos for t in expected])
+        self.assertEqual([t.type for t in res], ['IF', 'NAME', 'OP', 'NUMBER', 'OP', 'NAME', 'OP', 'NUMBER'])
+
+        grammar = grammar.replace(r"/[a-z_]\w*/", r"/\w+/")
+        self.assertEqual(list(Lark(grammar, lexer='basic', lexer_engine='dfa').lex(text))[-1], 'é')
+
+        # No backtracking. With `re`, LABEL takes exponential time to fail on this input.
+        p = Lark(r"""
+            start: (LABEL | WORD)*
+            LABEL: /([a-z]+ ?)+:/
+            WORD: /[a-z]+/
+            %ignore " "
+        """, lexer='basic', lexer_engine='dfa')
+        self.assertEqual([t.type for t in p.lex('a' * 40 + ' b')], ['WORD', 'WORD'])
+        self.assertEqual([t.type for t in p.lex('a b:')], ['LABEL'])
+
+    @skipIf(interegular is None, "interegular is required for lexer_engine='dfa'")
+    def test_dfa_engine_fallback(self):
+        # Lazy repeats and lookarounds have no DFA equivalent, so only these terminals are matched with `re`
+        grammar = r"""
+            start: (COMMENT | STRING | NAME | OP)*
+            COMMENT: "/*" /(.|\n)*?/ "*/"
+            STRING: /"(?!"").*?"/
+            NAME: /\w+/
+            OP: "/" | "*"
+            %ignore " "
+        """
+        p = Lark(grammar, lexer='basic', lexer_engine='dfa')
+        self.assertIsInstance(p.parser.lexer.scanner, DFAScanner)
+        text = '/* a */ x / "y" */ "a" * zé'
+        self.assertEqual(list(p.lex(text)), list(Lark(grammar, lexer='basic').lex(text)))
+
+        # Only the terminals that depend on Unicode classes leave the DFA at a non-ascii character,
+        # so the match doesn't depend on what follows it
+        p = Lark(r"""
+            start: (AB | E | NAME)*
+            AB: /a|abc/
+            E: "é"
+            NAME: /[xyz]\w*/
+            %ignore " "
+        """, lexer='basic', lexer_engine='dfa')
+        self.assertEqual(list(p.lex("abcé abc xé")), ['abc', 'é', 'abc', 'xé'])
+
+        self.assertRaises(ValueError, DFAScanner, [TerminalDef('A', PatternRE('(?=a)a'))], 0, re, False)
+
+    def test_positions_offsets(self):
+        grammar = r"""
+            start: item+
+            ?item: NAME | "(" item* ")" -> group
+            NAME: /\w+/
+            %ignore /\s+/
+        """
+        text = "foo\n bar (baz\n\n  qux)\nzz"
+        for lexer in ('basic', 'contextual'):
+            lines = Lark(grammar, parser='lalr', lexer=lexer, propagate_positions=True)
+            offsets = Lark(grammar, parser='lalr', lexer=lexer, propagate_positions=True, positions='offsets')
+
+            expected = lines.parse(text)
+            res = offsets.parse(text)
+            self.assertEqual(res, expected)
+
+            attrs = ('start_pos', 'end_pos', 'line', 'column', 'end_line', 'end_column')
+            tokens = list(res.scan_values(lambda v: True))
+            self.assertTrue(all(isinstance(t, OffsetToken) for t in tokens))
+            self.assertEqual([[getattr(t, a) for a in attrs] for t in tokens],
+                             [[getattr(t, a) for a in attrs] for t in expected.scan_values(lambda v: True)])
+
+            attrs += ('container_line', 'container_column', 'container_end_line', 'container_end_column')
+            for tree in (res, pickle.loads(pickle.dumps(res))):
+                self.assertEqual([[getattr(t.meta, a) for a in attrs] for t in tree.iter_subtrees()],
+                                 [[getattr(t.meta, a) for a in attrs] for t in expected.iter_subtrees()])
+
+            t = deepcopy(tokens[-2])
+            self.assertEqual((t.line, t.column, t.end_line, t.end_column), (4, 3, 4, 6))
+
+    def test_positions_offsets_errors(self):
+        grammar = r"""
+            start: NAME+
+            NAME: /\w+/
+            %ignore /\s+/
+        """
+        text = "foo\nbar\n  baz $ qux\nx"
+        errors = []
+        for positions in ('lines', 'offsets'):
+            with self.assertRaises(UnexpectedCharacters) as cm:
+                Lark(grammar, parser='lalr', positions=positions).parse(text)
+            errors.append(cm.exception)
+
+        expected, e = errors
+        self.assertEqual((e.line, e.column), (3, 7))
+        self.assertEqual(e.get_context(text), "  baz $ qux\n      ^\n")
+        self.assertEqual(str(e), str(expected))
+
+    def test_keywords(self):
+        p = Lark(r"""
+            start: (IF | ELSE | K | NAME)*
+            IF: "if"
+            ELSE: "else"i
+            K: "k"i
+            NAME: /\w+/
+            %ignore " "
+        """, lexer='basic')
+        res = list(p.lex("if IF else ELSE Else elsee k K \u212a kk"))
+        self.assertEqual([t.type for t in res], ['IF', 'NAME', 'ELSE', 'ELSE', 'ELSE', 'NAME', 'K', 'K', 'K', 'NAME'])
+
+        p = Lark(r"""
+            start: (IF | NAME)*
+            IF: "if"
+            NAME: /\w+/
+            %ignore " "
+        """, lexer='basic', use_bytes=True)
+        self.assertEqual([t.type for t in p.lex(b"if iff IF")], ['IF', 'NAME', 'NAME'])
+
+    def test_contextual_lexers_lazy(self):
+        grammar = """
+            start: "a" x | "b" y | "c" y
+            x: "1" | "2"
+            y: "3" | "4"
+            %ignore " "
+        """
+        p = Lark(grammar, parser='lalr', lexer='contextual')
+        f = BytesIO()
+        p.save(f)
+        f.seek(0)
+
+        # The lexers are only created when their state is reached, whether the parser was built or loaded
+        for p in (p, Lark.load(f)):
+            lexer = p.parser.lexer
+            self.assertEqual(len(lexer.lexers), 0)
+            self.assertEqual(p.parse("b 3"), Tree('start', [Tree('y', [])]))
+            self.assertEqual(len(lexer.lexers), 2)
+            self.assertEqual(lexer.materialized_scanners, 2)  # The last state only sees the end of the input
+            self.assertEqual(p.parse("c 4"), Tree('start', [Tree('y', [])]))
+            self.assertEqual(lexer.materialized_scanners, 2)  # "c" leads to a state that shares the lexer of "b"
+
+        # The terminals are still validated when the parser is built.
+        # Collisions only count between terminals that some state accepts together.
+        self.assertRaises(LexError, Lark, 'start: "a" A\nA: /a*/', parser='lalr', lexer='contextual')
+        grammar = r"""
+            start: "a" A | "b" B
+            A: /x+/
+            B: /x/
+        """
+        Lark(grammar, parser='lalr', lexer='contextual', strict=True)
+        self.assertRaises(LexError, Lark, grammar.replace('"b" B', '"b" (A | B)'), parser='lalr', lexer='contextual', strict=True)
+
+    def test_earley_contextual_lexer(self):
+        grammar = """
+            start: NAME "=" VALUE
+            NAME: /[a-z]+/
+            VALUE: /[a-z0-9]+/
+            %ignore " "
+        """
+        # The basic lexer always matches "abc" as VALUE
+        self.assertRaises(UnexpectedToken, Lark(grammar, parser='earley', lexer='basic').parse, "abc = abc")
+
+        p = Lark(grammar, parser='earley', lexer='contextual')
+        self.assertEqual(p.parse("abc = abc1"), Tree('start', ['abc', 'abc1']))
+
+        # Only the lexers of the most recently used sets of terminals are kept
+        lexer = p.parser.lexer
+        self.assertEqual(len(lexer._lexers_by_terminals), 4)    # NAME, "=", VALUE, and nothing at the end
+        lexer.max_lexers = 1
+        self.assertEqual(p.parse("abc = abc1"), Tree('start', ['abc', 'abc1']))
+        self.assertEqual(len(lexer._lexers_by_terminals), 1)
+
+        # Unexpected text is matched with all the terminals, so the parser can report the token
+        with self.assertRaises(UnexpectedToken) as cm:
+            p.parse("abc = abc = abc")
+        self.assertEqual(cm.exception.token, '=')
+        self.assertEqual(cm.exception.column, 11)
+        self.assertRaises(UnexpectedCharacters, p.parse, "abc = $")
+
+    def test_regexp_first_chars(self):
+        def first_chars(regexp, flags=0):
+            return ''.join(sorted(map(chr, get_regexp_first_chars(regexp, flags))))
+
+        self.assertEqual(first_chars(r'(?:a|b)?c'), 'abc')
+        self.assertEqual(first_chars(r'\d+|x*y'), '0123456789xy')
+        self.assertEqual(first_chars(r'\bfoo'), 'f')
+        self.assertEqual(first_chars(r'(?i:ab)'), 'Aa')
+        self.assertEqual(first_chars(r'ab', re.I), 'Aa')
+        self.assertEqual(first_chars(r'\u212a', re.I), ''.join(sorted(string.ascii_letters)))   # Kelvin sign
+        self.assertEqual(len(first_chars(r'a?')), 128)
+        self.assertEqual(len(first_chars(r'[^a]')), 128)
+
+    def test_first_char_dispatch(self):
+        p = Lark(r"""
+            start: (IF | NAME | NUMBER | OP | STRING)*
+            IF.2: /if\b/
+            NAME: /[a-z_]\w*/i
+            NUMBER: /\d+(\.\d*)?/
+            OP: "+" | "==" | "="
+            STRING: /"[^"]*"/
+            %ignore " "
+        """, lexer='basic')
+        scanner = p.parser.lexer.scanner
+        self.assertIsNotNone(scanner._dispatch)
+        res = list(p.lex('if iffy == 12.5 +X = "é" é'[:-2]))
+        self.assertEqual([t.type for t in res], ['IF', 'NAME', 'OP', 'NUMBER', 'OP', 'NAME', 'OP', 'STRING'])
+        self.assertEqual(res[-1], '"é"')
+        self.assertIsNone(scanner.match(TextSlice.cast_from('('), 0))
+        self.assertEqual(scanner._dispatch[ord('(')], [])
+        self.assertIs(scanner._dispatch[ord('x')], scanner._dispatch[ord('X')])
+
+    def test_skip_ignored(self):
+        grammar = r"""
+            start: (NAME | OP)*
+            NAME: /\w+/
+            OP: "+" | "/"
+            COMMENT: /#[^\n]*/
+            %ignore COMMENT
+            %ignore /\s+/
+        """
+        text = "a + b # c\n\n  # d\n c / \u3000 d"
+        p = Lark(grammar, lexer='basic')
+        skip = p.parser.lexer.skip
+        self.assertEqual(skip(" # c\n d").group(), " # c\n ")
+        res = list(p.lex(text))
+        self.assertEqual(res, ['a', '+', 'b', 'c', '/', 'd'])
+        self.assertEqual([(t.line, t.column) for t in res], [(1, 1), (1, 3), (1, 5), (4, 2), (4, 4), (4, 8)])
+
+        # A comment that starts like an operator isn't skipped
+        p = Lark(grammar.replace('/#', r'/\/\/'), lexer='basic')
+        self.assertIsNone(p.parser.lexer.skip("// c"))
+        self.assertEqual(list(p.lex("a // c\n/ b")), ['a', '/', 'b'])
+
+        # Neither is a terminal with a callback
+        comments = []
+        p = Lark(grammar, lexer='basic', lexer_callbacks={'COMMENT': comments.append})
+        self.assertEqual(list(p.lex(text)), ['a', '+', 'b', 'c', '/', 'd'])
+        self.assertEqual(comments, ['# c', '# d'])
+
+    def test_text_stream(self):
+        grammar = r"""
+            start: (NAME | NUMBER | STRING)*
+            NAME: /[a-z]+/
+            NUMBER: /\d+/
+            STRING: /"[^"]*"/
+            COMMENT: /#[^\n]*/
+            %ignore COMMENT
+            %ignore /\s+/
+        """
+        text = 'abc 123 "hello world" # a comment\nfoo bar\n' * 20 + 'end'
+        def info(tokens):
+            return [(t.type, t.value, t.start_pos, t.end_pos, t.line, t.column, t.end_line, t.end_column) for t in tokens]
+
+        for lexer in ('basic', 'contextual'):
+            p = Lark(grammar, parser='lalr', lexer=lexer)
+            expected = info(p.lex(text))
+            tree = p.parse(text)
+            for size in (1, 3, 16):
+                chunks = [text[i:i+size] for i in range(0, len(text), size)]
+                self.assertEqual(info(p.lex(TextStream(chunks))), expected)
+                self.assertEqual(info(p.lex(TextStream(StringIO(text), size))), expected)
+                self.assertEqual(p.parse(TextStream(chunks)), tree)
+
+            p = Lark(grammar, parser='lalr', lexer=lexer, use_bytes=True)
+            self.assertEqual(info(p.lex(TextStream(BytesIO(text.encode()), 5))), info(p.lex(text.encode())))
+
+            # A chunk boundary inside a token whose match depends on what follows it
+            p = Lark(r"""
+                start: (NUMBER | DOT | NAME)*
+                NUMBER: /\d+(\.\d+)?/
+                DOT: "."
+                NAME: /[a-z]+/
+                %ignore " "
+            """, parser='lalr', lexer=lexer)
+            self.assertEqual(info(p.lex(TextStream(["12.", "5 a"]))), info(p.lex("12.5 a")))
+            self.assertEqual(info(p.lex(TextStream(StringIO("1.a 12.5 3."), 1))), info(p.lex("1.a 12.5 3.")))
+            self.assertEqual(p.parse(TextStream(["12.", "5 a"])), p.parse("12.5 a"))
+
+        # Errors are reported relative to the start of the stream
+        p = Lark(grammar, parser='lalr')
+        with self.assertRaises(UnexpectedCharacters) as cm:
+            p.parse(TextStream(StringIO('abc def\nghi !'), 2))
+        self.assertEqual((cm.exception.pos_in_stream, cm.exception.line, cm.exception.column), (12, 2, 5))
+
+        self.assertEqual(p.parse(TextStream([])), Tree('start', []))
+        self.assertRaises(ConfigurationError, Lark(grammar, lexer='dynamic').parse, TextStream([text]))
+        self.assertRaises(ValueError, TextStream, [], 0)
+
+    def test_buffer_input(self):
+        grammar = r"""
+            start: (NAME | NUMBER | "(" start ")")*
+            NAME: /[a-z]+/
+            NUMBER: /\d+/
+            %ignore /\s+/
+        """
+        text = b"abc (12 de)\n  f (g 3)\n" * 3
+        with tempfile.TemporaryFile() as f:
+            f.write(text)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for options in ({}, {'positions': 'offsets'}, {'positions': 'offsets', 'token_values': 'lazy'}):
+                    p = Lark(grammar, parser='lalr', use_bytes=True, **options)
+                    tree = p.parse(text)
+                    expected = [(t.type, t.value, t.start_pos, t.end_pos, t.line, t.column) for t in p.lex(text)]
+                    ranges = [m.range for m in p.scan(text)]
+                    for buf in (mm, bytearray(text), memoryview(text)):
+                        self.assertEqual(p.parse(TextSlice(buf, 0, None)), tree)
+                        tokens = list(p.lex(TextSlice(buf, 0, None)))
+                        self.assertEqual([(t.type, t.value, t.start_pos, t.end_pos, t.line, t.column) for t in tokens], expected)
+                        self.assertEqual([m.range for m in p.scan(TextSlice(buf, 0, None))], ranges)
+
+        with self.assertRaises(UnexpectedCharacters) as cm:
+            p.parse(TextSlice(bytearray(b"abc\n ! d"), 0, None))
+        self.assertEqual((cm.exception.char, cm.exception.line, cm.exception.column), ('!', 2, 2))
+
+        self.assertRaises(TypeError, TextSlice, [1, 2], 0, None)
+        self.assertEqual(TextSlice(bytearray(b"a\nb\nc"), 1, None).count(b"\n"), 2)
+
+    def test_lazy_token_values(self):
+        grammar = r"""
+            start: NAME*
+            NAME: /\w+/
+            %ignore " "
+        """
+        p = Lark(grammar, parser='lalr', use_bytes=True, positions='offsets', token_values='lazy')
+        buf = bytearray(b"abc de")
+        a, b = p.parse(TextSlice(buf, 0, None)).children
+        self.assertIsInstance(a, LazyToken)
+
+        # The value is only read from the buffer on first access
+        self.assertEqual(a.value, b"abc")
+        buf[4:6] = b"xy"
+        self.assertEqual(b.value, b"xy")
+        self.assertEqual((b.start_pos, b.end_pos, b.line, b.end_column), (4, 6, 1, 7))
+
+        # Behaves like an eager token
+        eager = Token('NAME', b"abc")
+        self.assertEqual(a, eager)
+        self.assertEqual(hash(a), hash(eager))
+        self.assertEqual(str(a), str(eager))
+        self.assertEqual(len(a), 3)
+        self.assertEqual(deepcopy(a), a)
+        self.assertEqual(pickle.loads(pickle.dumps(a)), a)
+
+        self.assertRaises(ConfigurationError, Lark, grammar, parser='lalr', use_bytes=True, token_values='lazy')
+        self.assertRaises(ConfigurationError, Lark, grammar, parser='lalr', positions='offsets', token_values='lazy')
+
+    def test_utf8_bytes(self):
+        grammar = r"""
+            start: (WORD | NUM | STR | ARROW | KW)*
+            KW: "für"
+            WORD: /[^\W\d]\w*/
+            NUM: /\d+/
+            STR: /"(?:[^"\\]|\\.)*"/
+            ARROW: "→"
+            COMMENT: /#[^\n]*/
+            %import unicode.WS
+            %ignore WS
+            %ignore COMMENT
+        """
+        text = 'für straße → 123 ٣٤ "héllo wörld" # ÿ\n  ёж αβγ ñ x'
+
+        def info(tokens):
+            return [(t.type, str(t) if isinstance(t.value, str) else t.value.decode(),
+                     t.line, t.column, t.end_line, t.end_column) for t in tokens]
+
+        for parser, lexer, positions in [('lalr', 'basic', 'lines'), ('lalr', 'contextual', 'lines'),
+                                         ('lalr', 'contextual', 'offsets'), ('earley', 'dynamic', 'lines')]:
+            p = Lark(grammar, parser=parser, lexer=lexer, positions=positions)
+            pb = Lark(grammar, parser=parser, lexer=lexer, positions=positions, use_bytes='utf8')
+            expected = info(p.parse(text).children)
+            self.assertEqual(info(pb.parse(text.encode()).children), expected)
+            self.assertEqual(expected[-1][3], 12)
+            if parser == 'lalr':
+                self.assertEqual(expected[0][:2], ('KW', 'für'))
+
+        pb = Lark(grammar, parser='lalr', use_bytes='utf8')
+        with self.assertRaises(UnexpectedCharacters) as cm:
+            pb.parse('für € x'.encode())
+        self.assertEqual((cm.exception.line, cm.exception.column), (1, 5))
+
+        self.assertRaises(ConfigurationError, Lark, grammar, parser='lalr', use_bytes=True)
+
+        r = re.compile(utf8_regexp(r'[^\W\d]\w*').encode('latin-1'))
+        self.assertEqual(r.match('ñandú, x'.encode()).group().decode(), 'ñandú')
+        self.assertEqual(r.match('٣'.encode()), None)
+
+    def test_utf8_bytes_ignorecase(self):
+        # Non-ascii keywords still take precedence over the names, and fold their case like in str mode
+        for kw, flags in [('"straße"i', 0), ('"straße"', re.I)]:
+            grammar = """
+                start: (KW | NAME)*
+                KW: %s
+                NAME: /\\w+/
+                %%ignore " "
+            """ % kw
+            text = 'straße STRAßE Straße STRAẞE STRASSE strasse'
+            p = Lark(grammar, parser='lalr', g_regex_flags=flags)
+            pb = Lark(grammar, parser='lalr', g_regex_flags=flags, use_bytes='utf8')
+            expected = [(t.type, str(t)) for t in p.lex(text)]
+            self.assertEqual([(t.type, t.value.decode()) for t in pb.lex(text.encode())], expected)
+            self.assertEqual([t for t, _ in expected], ['KW'] * 4 + ['NAME'] * 2)
+
+            # Without a name to match them
+            p = Lark('start: KW*\nKW: %s\n%%ignore " "' % kw, parser='lalr', g_regex_flags=flags, use_bytes='utf8')
+            self.assertEqual(len(p.parse('STRAẞE straße'.encode()).children), 2)
+
+    def test_relex(self):
+        p = Lark(r"""
+            start: (NAME | NUMBER | STRING | OP)*
+            NAME: /[a-z]+/
+            NUMBER: /\d+/
+            STRING: /"[^"\n]*"/
+            OP: "+" | "++"
+            COMMENT: /#[^\n]*/
+            %ignore /\s+/
+            %ignore COMMENT
+        """, parser='lalr', lexer='basic')
+
+        def info(tokens):
+            return [(t.type, t.value, t.start_pos, t.end_pos, t.line, t.column, t.end_line, t.end_column) for t in tokens]
+
+        text = "a + b  # c\n" * 20
+        for dont_ignore in (False, True):
+            tokens = list(p.lex(text, dont_ignore=dont_ignore))
+            old_text = text
+            for start, end, replacement in [(4, 5, 'foo'), (2, 3, '++'), (1, 2, '\n\n'), (0, 1, '"a b" '),
+                                             (30, 35, ''), (len(old_text) - 3, len(old_text), '12')]:
+                new_text = old_text[:start] + replacement + old_text[end:]
+                splice = p.relex(new_text, tokens, (start, end, replacement), dont_ignore=dont_ignore)
+                # Only the tokens around the edit are lexed again
+                self.assertLess(len(splice.tokens), 8)
+                splice.apply(tokens)
+                self.assertEqual(info(tokens), info(p.lex(new_text, dont_ignore=dont_ignore)))
+                old_text = new_text
+
+        self.assertRaises(ValueError, p.relex, "a + b", list(p.lex("a + c")), (4, 5, 'x'))
+        self.assertRaises(ConfigurationError, Lark(r"start: /\w+/", lexer='basic', positions='offsets').relex, "", [], (0, 0, ''))
+
+        # The lexer is built once for each value of dont_ignore, and not on every call
+        p = Lark(r"""
+            start: NAME+
+            NAME: /[a-z]+/
+            %ignore " "
+        """, parser='lalr', lexer='basic')
+        with patch.object(Lark, '_build_lexer', side_effect=Lark._build_lexer, autospec=True) as build_lexer:
+            for dont_ignore in (False, True, False, True):
+                tokens = list(p.lex("a b", dont_ignore=dont_ignore))
+                p.relex("a bc", tokens, (3, 3, 'c'), dont_ignore=dont_ignore).apply(tokens)
+                self.assertEqual(tokens[-1], 'bc')
+        self.assertEqual(build_lexer.call_count, 2)
+
 
 if __name__ == '__main__':
     main()
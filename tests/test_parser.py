@@ -3,6 +3,7 @@ from __future__ import absolute_import
 
 import re
 import unittest
+from unittest import mock
 import os
 import sys
 from copy import copy, deepcopy
@@ -28,8 +29,11 @@ from lark.lark import Lark
 from lark.utils import TextSlice
 from lark.exceptions import GrammarError, ParseError, UnexpectedToken, UnexpectedInput, UnexpectedCharacters, ConfigurationError
 from lark.tree import Tree
+from lark.grammar import Terminal
 from lark.visitors import Transformer, Transformer_InPlace, v_args, Transformer_InPlaceRecursive
 from lark.lexer import Lexer, BasicLexer
+from lark.parsers.lalr_parser_state import PersistentStack
+from lark.parsers.earley import Parser as EarleyParser
 from lark.indenter import Indenter
 
 __all__ = ['TestParsers']
@@ -420,6 +424,230 @@ class TestParsers(unittest.TestCase):
         res = ParseToDict().transform(tree)
         assert res == {'alice': [1, 27, 3], 'bob': [4], 'carrie': [], 'dan': [8, 6]}
 
+    def test_earley_lexer_expects(self):
+        seen = []
+
+        class RecordingLexer(Lexer):
+            __future_interface__ = 2
+
+            def __init__(self, lexer_conf):
+                pass
+
+            def lex(self, lexer_state, expects):
+                for obj in lexer_state.text:
+                    seen.append(set(expects))
+                    yield Token(type(obj).__name__.upper(), obj)
+
+        parser = Lark("""
+                start: item+
+                item: STR INT* | FLOAT
+
+                %declare STR INT FLOAT
+                """, parser='earley', lexer=RecordingLexer)
+
+        parser.parse(['a', 1, 2.0])
+        STR, INT, FLOAT = Terminal('STR'), Terminal('INT'), Terminal('FLOAT')
+        self.assertEqual(seen, [{STR, FLOAT}, {STR, INT, FLOAT}, {STR, INT, FLOAT}])
+        self.assertTrue(all(type(t) is Terminal for s in seen for t in s))
+
+    def test_lalr_int_table(self):
+        grammar = """
+            start: item+
+            item: "(" item* ")" | ab__expr
+            %import .grammars.ab.expr -> ab__expr
+            %import common.WS
+            %ignore WS
+        """
+        parser = Lark(grammar, parser='lalr', source_path=__file__)
+        table = parser.parser.parser.parser.parse_table
+        self.assertEqual(len(table.action_rows), len(table.states))
+        self.assertEqual(set(table.symbols[table.n_terminals:]), {rule.origin.name for rule in parser.rules})
+        for state, actions in table.states.items():
+            for sym, (action, arg) in actions.items():
+                i = table.symbol_ids[sym]
+                if i >= table.n_terminals:
+                    self.assertEqual(table.goto_rows[state][i - table.n_terminals], arg)
+                    continue
+                code = table.action_rows[state][i]
+                if code < 0:
+                    code = table.default_actions[state]
+                if code & 1:
+                    self.assertIs(table.rules[code >> 1], arg)
+                else:
+                    self.assertEqual(code >> 1, arg)
+
+        # Default actions make states share their action rows
+        self.assertLess(len({id(row) for row in table.action_rows}), len(table.action_rows))
+        self.assertIn(-1, table.consistent_reductions)
+        self.assertGreater(max(table.consistent_reductions), 0)
+
+        text = "(ab (aabb) ()) ab"
+        debug_parser = Lark(grammar, parser='lalr', source_path=__file__, debug=True)
+        self.assertEqual(parser.parse(text), debug_parser.parse(text))
+
+        # Imported terminals are namespaced, which makes them lowercase
+        with self.assertRaises(UnexpectedToken) as cm:
+            parser.parse("(ab")
+        self.assertEqual(cm.exception.expected, {'LPAR', 'RPAR', 'grammars__ab__A'})
+
+        s = BytesIO()
+        parser.save(s)
+        s.seek(0)
+        parser2 = Lark.load(s)
+        table2 = parser2.parser.parser.parser.parse_table
+        self.assertEqual(table2.states, table.states)
+        self.assertEqual(table2.action_rows, table.action_rows)
+        self.assertEqual(table2.goto_rows, table.goto_rows)
+        self.assertEqual(table2.default_actions, table.default_actions)
+        self.assertEqual(parser2.parse(text), parser.parse(text))
+
+    def test_lalr_consistent_reductions(self):
+        # After "a", the parser reduces x regardless of the next token. parse() does it before lexing that token,
+        # so the contextual lexer knows if it expects ID or KW.
+        grammar = r"""
+            start: "(" x ID | "[" x KW
+            x: "a"
+            ID: /\w+/
+            KW: "k"
+            %ignore " "
+        """
+        for debug in (False, True):
+            parser = Lark(grammar, parser='lalr', debug=debug)
+            self.assertEqual(parser.parse("(a k").children[1], Token('ID', 'k'))
+            self.assertEqual(parser.parse("[a k").children[1], Token('KW', 'k'))
+
+            # So does the regular loop
+            self.assertEqual(parser.parse_interactive("(a k").resume_parse(), parser.parse("(a k"))
+            ip = parser.parse_interactive("[a k")
+            ip.exhaust_lexer()
+            self.assertEqual(ip.feed_eof(), parser.parse("[a k"))
+
+            # But x is only reduced once the token is fed, so errors are reported in the state after "a"
+            parser = Lark(grammar, parser='lalr', lexer='basic', debug=debug)
+            for parse in (parser.parse, lambda text: parser.parse_interactive(text).resume_parse()):
+                with self.assertRaises(UnexpectedToken) as cm:
+                    parse("(a (")
+                self.assertEqual(cm.exception.expected, {'ID', 'KW'})
+                self.assertEqual(cm.exception.interactive_parser.accepts(), {'ID'})
+
+    def test_lalr_default_reductions_expected(self):
+        # "3" isn't expected after "2", but the default reduce of "expr + term" would take it to a state
+        # that doesn't expect STAR either. The error is raised before that reduce.
+        grammar = r"""
+            start: expr ";"
+            expr: expr "+" term | term
+            term: term "*" NUM | NUM
+            NUM: /\d+/
+            %ignore " "
+        """
+        for debug in (False, True):
+            parser = Lark(grammar, parser='lalr', lexer='basic', debug=debug)
+            for parse in (parser.parse, lambda text: parser.parse_interactive(text).resume_parse()):
+                with self.assertRaises(UnexpectedToken) as cm:
+                    parse("1 + 2 3")
+                self.assertEqual(cm.exception.expected, {'PLUS', 'SEMICOLON', 'STAR'})
+                self.assertEqual(cm.exception.interactive_parser.accepts(), {'PLUS', 'SEMICOLON', 'STAR'})
+
+    def test_lalr_fused_loop(self):
+        grammar = r"""
+            start: stmt*
+            stmt: "let" NAME "=" NUMBER ";" | NAME "(" NAME? ")" ";"
+            COMMENT: /#[^\n]*/
+            %import common.CNAME -> NAME
+            %import common.NUMBER
+            %import common.WS
+            %ignore WS
+            %ignore COMMENT
+        """
+        text = "let x = 1;\n# comment\nprint(x);  # done\nlet y = 22;\n"
+
+        for lexer in ('basic', 'contextual'):
+            comments = []
+            parser = Lark(grammar, parser='lalr', lexer=lexer, lexer_callbacks={'COMMENT': comments.append})
+            tree = parser.parse(text)
+            self.assertEqual(len(comments), 2)
+
+            # resume_parse() runs the regular loop
+            comments.clear()
+            self.assertEqual(tree, parser.parse_interactive(text).resume_parse())
+            self.assertEqual(len(comments), 2)
+            tokens = list(tree.scan_values(lambda v: isinstance(v, Token)))
+            self.assertEqual([(t.type, t.line, t.column, t.end_pos) for t in tokens][-2:],
+                             [('NAME', 4, 5, text.index('y') + 1), ('NUMBER', 4, 9, len(text) - 2)])
+
+            # Errors are the same as in the regular loop
+            for bad_text in ("let x = 1;\nlet = 2;", "let x = 1;\nlet y = 2 @"):
+                with self.assertRaises(UnexpectedInput) as cm1:
+                    parser.parse(bad_text)
+                with self.assertRaises(UnexpectedInput) as cm2:
+                    parser.parse_interactive(bad_text).resume_parse()
+                self.assertEqual(type(cm1.exception), type(cm2.exception))
+                self.assertEqual((cm1.exception.line, cm1.exception.column), (cm2.exception.line, cm2.exception.column))
+                self.assertEqual(cm1.exception.interactive_parser.parser_state, cm2.exception.interactive_parser.parser_state)
+
+            # Recovering from an error with on_error
+            tree = parser.parse("let x = 1;\nlet y = 2 3;\nf();", on_error=lambda e: True)
+            self.assertEqual(len(tree.children), 3)
+
+    def test_parse_incremental(self):
+        grammar = r"""
+            start: stmt*
+            stmt: "let" NAME "=" expr ";"
+                | "{" stmt* "}" -> block
+            ?expr: expr "+" atom | atom
+            ?atom: NAME | NUMBER | STRING | "(" expr ")"
+            STRING: /"[^"\n]*"/
+            COMMENT: /#[^\n]*/
+            %import common.CNAME -> NAME
+            %import common.NUMBER
+            %import common.WS
+            %ignore WS
+            %ignore COMMENT
+        """
+        text = ''.join('let v%d = (a + %d) + "s";  # c\n{ let w = b; { } }\n' % (i, i) for i in range(30))
+        edits = [
+            [(text.index('v3'), text.index('v3') + 2, 'renamed')],      # Change a token
+            [(0, 0, '{ ')],                                               # Change the structure of what follows
+            [(0, 2, '')],
+            [(40, 40, '\n\n')],                                           # Move the following lines
+            [(100, 100, '"'), (102, 102, '"')],                          # Open a string, and close it
+            [(len(text) - 10, len(text), '')],                            # Break the end, then fix it
+            [(len(text) - 10, len(text) - 10, '}}')],
+            [(5, 5, 'let x = 1;'), (3, 4, '')],                           # Several edits
+        ]
+
+        for lexer in ('basic', 'contextual'):
+            parser = Lark(grammar, parser='lalr', lexer=lexer)
+            result = parser.parse_incremental(text)
+            self.assertEqual(result.tree, parser.parse(text))
+
+            for edit in edits:
+                new_text = result.text
+                for start, end, replacement in edit:
+                    new_text = new_text[:start] + replacement + new_text[end:]
+
+                try:
+                    expected = parser.parse(new_text)
+                except UnexpectedInput:
+                    # The previous result is still valid after an error
+                    self.assertRaises(UnexpectedInput, parser.parse_incremental, result, edit)
+                    continue
+
+                result = parser.parse_incremental(result, edit)
+                self.assertEqual(result.text, new_text)
+                self.assertEqual(result.tree, expected)
+                full = parser.parse_incremental(new_text)
+                self.assertEqual([(t.type, t.start_pos, t.end_pos, t.line, t.column, t.end_line, t.end_column) for t in result.tokens],
+                                 [(t.type, t.start_pos, t.end_pos, t.line, t.column, t.end_line, t.end_column) for t in full.tokens])
+
+            # A reparsed result can't be used again
+            new_result = parser.parse_incremental(result, [(0, 0, ' ')])
+            self.assertRaises(ValueError, parser.parse_incremental, result, [(0, 0, ' ')])
+            self.assertEqual(new_result.tree, parser.parse(new_result.text))
+
+        self.assertRaises(ConfigurationError, Lark(grammar, parser='earley').parse_incremental, text)
+        self.assertRaises(ConfigurationError, Lark(grammar, parser='lalr', transformer=Transformer()).parse_incremental, text)
+
 
 
 def _make_full_earley_test(LEXER):
@@ -436,7 +664,7 @@ def _make_full_earley_test(LEXER):
             self.assertEqual( g.parse('abc').children[0], 'abc')
 
 
-        @unittest.skipIf(LEXER=='basic', "Requires dynamic lexer")
+        @unittest.skipIf(LEXER in ('basic', 'contextual'), "Requires dynamic lexer")
         def test_earley(self):
             g = Lark("""start: A "b" c
                         A: "a"+
@@ -505,7 +733,7 @@ def _make_full_earley_test(LEXER):
             empty_tree = Tree('empty', [Tree('empty2', [])])
             self.assertSequenceEqual(res.children, ['a', empty_tree, empty_tree, 'b'])
 
-        @unittest.skipIf(LEXER=='basic', "Requires dynamic lexer")
+        @unittest.skipIf(LEXER in ('basic', 'contextual'), "Requires dynamic lexer")
         def test_earley_explicit_ambiguity(self):
             # This was a sneaky bug!
 
@@ -521,7 +749,7 @@ def _make_full_earley_test(LEXER):
             self.assertEqual( ambig_tree.data, '_ambig')
             self.assertEqual( len(ambig_tree.children), 2)
 
-        @unittest.skipIf(LEXER=='basic', "Requires dynamic lexer")
+        @unittest.skipIf(LEXER in ('basic', 'contextual'), "Requires dynamic lexer")
         def test_ambiguity1(self):
             grammar = """
             start: cd+ "e"
@@ -537,7 +765,7 @@ def _make_full_earley_test(LEXER):
             assert ambig_tree.data == '_ambig', ambig_tree
             assert len(ambig_tree.children) == 2
 
-        @unittest.skipIf(LEXER=='basic', "Requires dynamic lexer")
+        @unittest.skipIf(LEXER in ('basic', 'contextual'), "Requires dynamic lexer")
         def test_ambiguity2(self):
             grammar = """
             ANY:  /[a-zA-Z0-9 ]+/
@@ -795,7 +1023,7 @@ def _make_full_earley_test(LEXER):
             self.assertEqual(ambig_tree.data, '_ambig')
             self.assertEqual(set(ambig_tree.children), expected)
 
-        @unittest.skipIf(LEXER=='basic', 'This ambiguity only occurs with the dynamic lexers')
+        @unittest.skipIf(LEXER in ('basic', 'contextual'), 'This ambiguity only occurs with the dynamic lexers')
         def test_ambiguous_ignores(self):
             grammar = """
             !start: a "b"
@@ -814,7 +1042,7 @@ def _make_full_earley_test(LEXER):
             ])
             self.assertEqual(tree, expected)
 
-        @unittest.skipIf(LEXER=='basic', "Requires dynamic lexer")
+        @unittest.skipIf(LEXER in ('basic', 'contextual'), "Requires dynamic lexer")
         def test_fruitflies_ambig(self):
             grammar = """
                 start: noun verb noun        -> simple
@@ -905,7 +1133,7 @@ def _make_full_earley_test(LEXER):
             tree = l.parse('x')
             assert tree == Tree('start', [Tree('a', ['x'])])
 
-        @unittest.skipIf(LEXER=='basic', 'Ignore carry-over is dynamic-lexer-specific')
+        @unittest.skipIf(LEXER in ('basic', 'contextual'), 'Ignore carry-over is dynamic-lexer-specific')
         def test_ignore_carryover_with_priority(self):
             """Items in to_scan with item.node=None must not produce an empty SPPF
             node when carried over past an ignored sequence (issue #1598)."""
@@ -920,7 +1148,7 @@ def _make_full_earley_test(LEXER):
             tree = l.parse('   hello')
             self.assertEqual(tree, Tree('start', [Tree('a', ['hello'])]))
 
-        @unittest.skipIf(LEXER=='basic', 'This scenario only occurs with the dynamic lexers')
+        @unittest.skipIf(LEXER in ('basic', 'contextual'), 'This scenario only occurs with the dynamic lexers')
         def test_multiple_start_solutions2(self):
             grammar = r"""
                 !start: "foo1" | "foo" | "foo12"
@@ -1030,7 +1258,7 @@ def _make_full_earley_test(LEXER):
             tree = l.parse('');
             self.assertEqual(tree, Tree('a', [Tree('x', [Tree('b', [])])]))
 
-        @unittest.skipIf(LEXER=='basic', "start/end values work differently for the basic lexer")
+        @unittest.skipIf(LEXER in ('basic', 'contextual'), "start/end values work differently for the basic lexer")
         def test_symbol_node_start_end_dynamic_lexer(self):
             grammar = """
             start: "ABC"
@@ -1085,6 +1313,65 @@ def _make_full_earley_test(LEXER):
             n = Tree('a', [])
             assert tree == Tree('start', [n, n])
 
+        def test_terminal_first_chars(self):
+            # Terminals whose first character isn't obvious from their pattern
+            grammar = r"""
+                start: (KW | OPT | WORD)+
+                KW: "select"i
+                OPT: /-?\d+/
+                WORD: /[^\W\d]+/
+                %ignore " "
+            """
+            parser = Lark(grammar, lexer=LEXER)
+            tree = parser.parse('SELECT -12 über select 3')
+            self.assertEqual([t.type for t in tree.children], ['KW', 'OPT', 'WORD', 'KW', 'OPT'])
+
+        def test_right_recursion(self):
+            parser = Lark('''
+                start: stmt start | stmt
+                !stmt: "x" ";"
+            ''', lexer=LEXER)
+
+            tree = parser.parse('x;' * 300)
+            expected = Tree('start', [Tree('stmt', ['x', ';'])])
+            for _ in range(299):
+                expected = Tree('start', [Tree('stmt', ['x', ';']), expected])
+            self.assertEqual(tree, expected)
+
+            parser = Lark('''
+                start: item start | item
+                !item: "a" | "a" "a"
+            ''', ambiguity='explicit', lexer=LEXER)
+
+            tree = parser.parse('aaa')
+            self.assertEqual(tree.data, '_ambig')
+            a, aa = Tree('item', ['a']), Tree('item', ['a', 'a'])
+            self.assertEqual(len(tree.children), 2)
+            self.assertIn(Tree('start', [aa, Tree('start', [a])]), tree.children)
+            nested, = [t for t in tree.children if t.children[0] == a]
+            self.assertEqual(nested.children[1].data, '_ambig')
+            self.assertEqual(set(nested.children[1].children), {
+                Tree('start', [a, Tree('start', [a])]),
+                Tree('start', [aa]),
+            })
+
+        def test_right_recursion_resolve(self):
+            # Leo's optimization must not change which derivation ambiguity='resolve' picks
+            grammar = '''
+                l: i l | i
+                !i: A | A A
+                A: "a"
+                %ignore " "
+            '''
+            text = 'a a a a'
+            tree = Lark(grammar, start='l', lexer=LEXER).parse(text)
+
+            with mock.patch.object(EarleyParser, '_leo_transitive', return_value=None):
+                self.assertEqual(tree, Lark(grammar, start='l', lexer=LEXER).parse(text))
+
+            a, aa = Tree('i', ['a']), Tree('i', ['a', 'a'])
+            self.assertEqual(tree, Tree('l', [a, Tree('l', [aa, Tree('l', [a])])]))
+
     _NAME = "TestFullEarley" + LEXER.capitalize()
     _TestFullEarley.__name__ = _NAME
     globals()[_NAME] = _TestFullEarley
@@ -2671,6 +2958,109 @@ def _make_parser_test(LEXER, PARSER):
             res = ip_copy.feed_eof()
             self.assertEqual(res, Tree('start', ['a', 'b', 'b']))
 
+        @unittest.skipIf(PARSER != 'lalr', "interactive_parser is only implemented for LALR at the moment")
+        def test_interactive_parser_accepts(self):
+            g = _Lark(r'''
+                start: item+
+                item: "(" item* ")" | "x" | "y" "," ?
+            ''')
+
+            # After "x", what's accepted depends on the states below it
+            for text, expected in [("", {'LPAR', 'X', 'Y'}),
+                                   ("x", {'LPAR', 'X', 'Y', '$END'}),
+                                   ("((x", {'LPAR', 'RPAR', 'X', 'Y'}),
+                                   ("(x)", {'LPAR', 'X', 'Y', '$END'}),
+                                   ("y", {'LPAR', 'X', 'Y', 'COMMA', '$END'}),
+                                   ]:
+                for persistent_stacks in (False, True):
+                    ip = g.parse_interactive(text, persistent_stacks=persistent_stacks)
+                    ip.exhaust_lexer()
+                    state_stack = list(ip.parser_state.state_stack)
+                    self.assertEqual(ip.accepts(), expected)
+                    self.assertEqual(list(ip.parser_state.state_stack), state_stack)
+                    for t in expected:
+                        self.assertTrue(ip.parser_state.accepts_token_type(t))
+
+            ip = g.parse_interactive("((x")
+            ip.exhaust_lexer()
+            self.assertFalse(ip.parser_state.accepts_token_type('$END'))
+            self.assertFalse(ip.parser_state.accepts_token_type('COMMA'))
+            self.assertFalse(ip.parser_state.accepts_token_type('NOT_A_TERMINAL'))
+
+        @unittest.skipIf(PARSER != 'lalr', "interactive_parser is only implemented for LALR at the moment")
+        def test_interactive_parser_try_feed_token(self):
+            g = _Lark(r'''
+                start: item+
+                item: "(" item* ")" | "x"
+            ''')
+
+            ip = g.parse_interactive("((x")
+            ip.exhaust_lexer()
+            state_stack = list(ip.parser_state.state_stack)
+            self.assertFalse(ip.try_feed_token(Token('$END', '')))
+            self.assertEqual(list(ip.parser_state.state_stack), state_stack)
+            self.assertTrue(ip.try_feed_token(Token('RPAR', ')')))
+            self.assertTrue(ip.try_feed_token(Token('RPAR', ')')))
+            self.assertTrue(ip.try_feed_token(Token('$END', '')))
+            self.assertEqual(ip.parser_state.value_stack[-1], g.parse("((x))"))
+
+            ip = g.parse_interactive("x").as_immutable().exhaust_lexer()
+            self.assertIsNone(ip.try_feed_token(Token('RPAR', ')')))
+            ip2 = ip.try_feed_token(Token('X', 'x'))
+            self.assertEqual(ip2.feed_eof().result, g.parse("xx"))
+            self.assertEqual(ip.feed_eof().result, g.parse("x"))
+            self.assertEqual(ip.try_feed_token(Token('$END', '')).result, g.parse("x"))
+            self.assertIsNone(ip.result)
+
+            # The expected terminals of the failed state, regardless of what happened to the parser since
+            ip = g.parse_interactive("(")
+            ip.exhaust_lexer()
+            try:
+                ip.feed_token(Token('$END', ''))
+            except UnexpectedToken as e:
+                ip.feed_token(Token('RPAR', ')'))
+                self.assertEqual(e.expected, {'LPAR', 'RPAR', 'X'})
+            else:
+                self.fail()
+
+        @unittest.skipIf(PARSER != 'lalr', "interactive_parser is only implemented for LALR at the moment")
+        def test_interactive_parser_persistent_stacks(self):
+            g = _Lark(r'''
+                start: _stmts
+                _stmts: _stmts stmt | stmt
+                stmt: NAME "=" NAME ";"
+                %import common.CNAME -> NAME
+                %ignore " "
+            ''')
+
+            ip = g.parse_interactive("a = b; c = d;", persistent_stacks=True)
+            ip.exhaust_lexer()
+            self.assertIsInstance(ip.parser_state.value_stack, PersistentStack)
+            ip_lists = g.parse_interactive("a = b; c = d;")
+            ip_lists.exhaust_lexer()
+            self.assertEqual(ip.accepts(), ip_lists.accepts())
+
+            # Both copies extend the same list of statements in-place, and mustn't see each other's
+            ip_copy = ip.copy()
+            self.assertEqual(ip_copy.parser_state, ip.parser_state)
+            self.assertIsNot(ip_copy.parser_state.value_stack, ip.parser_state.value_stack)
+            for t in g.lex("e = f;"):
+                ip.feed_token(t)
+            for t in g.lex("g = h; i = j;"):
+                ip_copy.feed_token(t)
+            self.assertEqual(ip_copy.copy().feed_eof(), g.parse("a = b; c = d; g = h; i = j;"))
+            self.assertEqual(ip.feed_eof(), g.parse("a = b; c = d; e = f;"))
+            self.assertEqual(ip_copy.feed_eof(), g.parse("a = b; c = d; g = h; i = j;"))
+
+            stack = PersistentStack([1, 2, 3])
+            stack_copy = stack.copy()
+            del stack[-2:]
+            stack.append(4)
+            self.assertEqual(list(stack), [1, 4])
+            self.assertEqual(list(stack_copy), [1, 2, 3])
+            self.assertEqual(stack_copy[-2:], [2, 3])
+            self.assertEqual(stack_copy[0], 1)
+
         @unittest.skipIf(PARSER != 'lalr', "interactive_parser error handling only works with LALR for now")
         def test_error_with_interactive_parser(self):
             def ignore_errors(e):
@@ -2868,6 +3258,7 @@ _TO_TEST = [
         ('dynamic_complete', 'earley'),
 
         ('contextual', 'lalr'),
+        ('contextual', 'earley'),
 
         ('custom_new', 'lalr'),
         ('custom_new', 'cyk'),
@@ -2878,7 +3269,7 @@ _TO_TEST = [
 for _LEXER, _PARSER in _TO_TEST:
     _make_parser_test(_LEXER, _PARSER)
 
-for _LEXER in ('basic', 'dynamic', 'dynamic_complete'):
+for _LEXER in ('basic', 'contextual', 'dynamic', 'dynamic_complete'):
     _make_full_earley_test(_LEXER)
 
 if __name__ == '__main__':
@@ -49,7 +49,7 @@ class TestScan(unittest.TestCase):
         self.assertEqual(list(parser.scan("a b a")), [])
 
     def test_scan_matches_parse_under_tree_options(self):
-        # scan() builds the tree via a separate replay path; check it matches parse().
+        # scan() builds the tree from the steps it recorded while parsing; check it matches parse().
         grammar = r"""
         start: "(" WORD? ")"
         WORD: /\w+/
@@ -114,6 +114,47 @@ class TestScan(unittest.TestCase):
             ScanMatch((22, 25), Tree('start', [Tree('expr', ['f'])])),
         ])
 
+    def test_scan_callbacks_only_run_for_matches(self):
+        # Reductions past the longest match, or in failed candidates, are recorded but never run
+        calls = []
+        class T(Transformer):
+            def expr(self, children):
+                calls.append(children)
+                return ''.join(children)
+
+        parser = Lark(r"""
+        start: expr+
+        expr: "(" (WORD|expr)* ")"
+        %ignore /\s+/
+        WORD: /\w+/
+        """, parser='lalr', transformer=T())
+
+        finds = list(parser.scan("(a)(b(c) (d(e)"))
+        self.assertEqual(finds, [ScanMatch((0, 3), Tree('start', ['a'])),
+                                 ScanMatch((5, 8), Tree('start', ['c'])),
+                                 ScanMatch((11, 14), Tree('start', ['e']))])
+        self.assertEqual(calls, [['a'], ['c'], ['e']])
+
+    def test_scan_ranges_only(self):
+        calls = []
+        class T(Transformer):
+            def expr(self, children):
+                calls.append(children)
+                return children
+
+        for transformer in (None, T()):
+            parser = Lark(r"""
+            start: expr+
+            expr: "(" (WORD|expr)* ")"
+            %ignore /\s+/
+            WORD: /\w+/
+            """, parser='lalr', transformer=transformer)
+
+            text = "(a)(b) || (c)(d(e) || (f)"
+            self.assertEqual(list(parser.scan(text, values=False)), [(0, 6), (10, 13), (15, 18), (22, 25)])
+            self.assertEqual(calls, [])
+            self.assertEqual(list(parser.scan(text, values=False)), [m.range for m in parser.scan(text)])
+
     def test_scan_adjacent(self):
         # Matches that abut with no gap: the resume (pos = last.end_pos) must re-find a
         # match starting at the exact end offset of the previous one. No %ignore, and each